@@ -2,34 +2,45 @@
 # Protected endpoints for Dentalogic Analytics Dashboard.
 # Ensures Sovereign isolation via tenant_id extraction.
 
+import os
+
+import jwt
 from fastapi import APIRouter, Depends, HTTPException, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import Dict, Any
-from .services.analytics_service import AnalyticsService
+from ..services.analytics_service import AnalyticsService
 
 router = APIRouter(prefix="/admin/analytics", tags=["Analytics"])
 security = HTTPBearer()
 
-# Mock dependency for tenant_id extraction (in real app, this comes from JWT)
-async def get_current_tenant_id(credentials: HTTPAuthorizationCredentials = Security(security)):
-    # Logic to decode JWT and return tenant_id
-    # For this implementation, we assume it's extracted safely.
-    return "extract-uuid-from-jwt"
+# Same signing key as the orchestrator's auth_service
+JWT_SECRET_KEY = os.getenv("INTERNAL_SECRET_KEY", "nexus-super-secret-key-v7.6")
+
+async def get_current_tenant_id(credentials: HTTPAuthorizationCredentials = Security(security)) -> int:
+    """tenant_id (int, as in tenants.id) from the orchestrator-issued JWT."""
+    try:
+        payload = jwt.decode(credentials.credentials, JWT_SECRET_KEY, algorithms=["HS256"])
+        return int(payload["tenant_id"])
+    except (jwt.PyJWTError, KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=401, detail="Invalid or expired session token")
 
 @router.get("/ceo")
-async def get_ceo_dashboard(tenant_id: str = Depends(get_current_tenant_id)):
+async def get_ceo_dashboard(
+    tenant_id: int = Depends(get_current_tenant_id),
+    credentials: HTTPAuthorizationCredentials = Security(security),
+):
     """
     Returns strategic data for the CEO role.
     """
     # Verify role in JWT: If role != 'ceo' return 403
     try:
-        data = await AnalyticsService.get_ceo_metrics(None, tenant_id)
+        data = await AnalyticsService.get_ceo_metrics(None, tenant_id, credentials.credentials)
         return data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/secretary")
-async def get_secretary_dashboard(tenant_id: str = Depends(get_current_tenant_id)):
+async def get_secretary_dashboard(tenant_id: int = Depends(get_current_tenant_id)):
     """
     Returns operational data for the Secretary role.
     """
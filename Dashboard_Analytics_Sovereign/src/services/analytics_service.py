@@ -2,13 +2,19 @@
 # Logic for calculating Dentalogic KPIs with Sovereign isolation.
 
 import json
+import os
 from datetime import datetime, date
-from uuid import UUID
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+import httpx
+
+# The orchestrator owns llm_usage; we read its aggregation instead of the table
+ORCHESTRATOR_URL = os.getenv("ORCHESTRATOR_URL", "http://orchestrator_service:8000")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 
 class AnalyticsService:
     @staticmethod
-    async def get_ceo_metrics(db_pool, tenant_id: UUID) -> Dict[str, Any]:
+    async def get_ceo_metrics(db_pool, tenant_id: int, auth_token: str) -> Dict[str, Any]:
         """
         Calculates high-level strategic KPIs for the CEO.
         Filters by tenant_id.
@@ -16,7 +22,8 @@ class AnalyticsService:
         # 1. AI ROI Calculation (Simplified example)
         # In a real scenario, these would be complex JOINs with payments and logs
         revenue_from_ia = 15000.50 # Mock value for implementation
-        ia_api_cost = 450.00
+        # Real OpenAI spend for the current month (llm_usage, aggregated by the orchestrator)
+        ia_api_cost = await AnalyticsService.get_ia_api_cost(tenant_id, auth_token)
         roi = ((revenue_from_ia - ia_api_cost) / ia_api_cost) * 100 if ia_api_cost > 0 else 0
         
         # 2. Conversion Velocity (Lead to Patient)
@@ -24,6 +31,7 @@ class AnalyticsService:
         
         return {
             "ai_roi": round(roi, 2),
+            "ia_api_cost": round(ia_api_cost, 2),
             "revenue_summary": {
                 "ia_driven": revenue_from_ia,
                 "total": 45000.00
@@ -33,7 +41,24 @@ class AnalyticsService:
         }
 
     @staticmethod
-    async def get_secretary_metrics(db_pool, tenant_id: UUID) -> Dict[str, Any]:
+    async def get_ia_api_cost(tenant_id: int, auth_token: str, since: Optional[date] = None) -> float:
+        """
+        Estimated LLM cost (USD) since `since` (default: first day of the month), taken from
+        the orchestrator's /admin/analytics/llm-usage with the caller's own JWT, so the
+        orchestrator enforces the tenant isolation.
+        """
+        since = since or date.today().replace(day=1)
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            response = await client.get(
+                f"{ORCHESTRATOR_URL}/admin/analytics/llm-usage",
+                params={"tenant_id": tenant_id, "start_date": since.isoformat()},
+                headers={"Authorization": f"Bearer {auth_token}", "X-Admin-Token": ADMIN_TOKEN},
+            )
+            response.raise_for_status()
+        return float(sum(total["cost_usd"] for total in response.json()["totals"]))
+
+    @staticmethod
+    async def get_secretary_metrics(db_pool, tenant_id: int) -> Dict[str, Any]:
         """
         Calculates operational KPIs for the Secretary.
         """
@@ -54,12 +79,12 @@ class AnalyticsService:
         }
 
     @staticmethod
-    async def sync_daily_metrics(db_pool, tenant_id: UUID, target_date: date):
+    async def sync_daily_metrics(db_pool, tenant_id: int, auth_token: str, target_date: date):
         """
         Pre-aggregates metrics for faster dashboard rendering.
         To be called by Maintenance Robot or background task.
         """
-        ceo_data = await AnalyticsService.get_ceo_metrics(db_pool, tenant_id)
+        ceo_data = await AnalyticsService.get_ceo_metrics(db_pool, tenant_id, auth_token)
         # Store in daily_analytics_metrics (Idempotent update)
         # Implementation via DB Surgeon patterns omitted for brevity in this step
         pass
@@ -13,7 +13,8 @@ app.use(cors({
     origin: true,
     credentials: true,
     methods: ['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS', 'PATCH'],
-    allowedHeaders: ['Content-Type', 'Authorization', 'x-admin-token', 'x-tenant-id', 'x-signature']
+    allowedHeaders: ['Content-Type', 'Authorization', 'x-admin-token', 'x-tenant-id', 'x-signature'],
+    exposedHeaders: ['x-next-cursor']
 }));
 app.options('*', cors());
 app.use(express.json());
@@ -41,6 +42,10 @@ app.use(async (req: Request, res: Response) => {
             data: req.body,
             headers: { ...req.headers, host: undefined }
         });
+        // Cursor de paginación de los listados del admin (el body sigue siendo la lista)
+        if (response.headers['x-next-cursor']) {
+            res.setHeader('x-next-cursor', response.headers['x-next-cursor']);
+        }
         res.status(response.status).send(response.data);
     } catch (error: any) {
         console.error(`[Proxy Error] ${error.message}`);
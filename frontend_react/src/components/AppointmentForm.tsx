@@ -5,7 +5,8 @@ import api, { BACKEND_URL } from '../api/axios';
 import { useTranslation } from '../context/LanguageContext';
 import { useAuth } from '../context/AuthContext';
 import AnamnesisPanel from './AnamnesisPanel';
-import { io, Socket } from 'socket.io-client';
+import { Socket } from 'socket.io-client';
+import { createSocket } from '../utils/socket';
 import { addMonths } from 'date-fns';
 
 interface AppointmentFormProps {
@@ -211,7 +212,7 @@ export default function AppointmentForm({
         const jwtToken = localStorage.getItem('access_token');
         const adminToken = localStorage.getItem('ADMIN_TOKEN');
 
-        socketRef.current = io(BACKEND_URL, {
+        socketRef.current = createSocket(BACKEND_URL, {
             transports: ['websocket', 'polling'],
             auth: { token: jwtToken || '', adminToken: adminToken || '' },
         });
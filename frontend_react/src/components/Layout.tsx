@@ -3,7 +3,8 @@ import { useNavigate } from 'react-router-dom';
 import { Sidebar } from './Sidebar';
 import { useAuth } from '../context/AuthContext';
 import { useTranslation } from '../context/LanguageContext';
-import { io, Socket } from 'socket.io-client';
+import { Socket } from 'socket.io-client';
+import { createSocket } from '../utils/socket';
 import { BACKEND_URL } from '../api/axios';
 import { X, Wifi, WifiOff, Bell, UserPlus, Calendar, AlertTriangle, HelpCircle } from 'lucide-react';
 import MetaTokenBanner from './MetaTokenBanner';
@@ -63,7 +64,8 @@ export const Layout: React.FC<LayoutProps> = ({ children }: LayoutProps) => {
     // Conectar socket si no existe
     if (!socketRef.current) {
       // Connect to root namespace (matching ChatsView.tsx logic)
-      socketRef.current = io(BACKEND_URL, {
+      // WebSocket primero + JWT (ver utils/socket): con varios workers no hace falta sticky session
+      socketRef.current = createSocket(BACKEND_URL, {
         reconnection: true,
         reconnectionAttempts: Infinity,
         reconnectionDelay: 1000,
@@ -1,7 +1,8 @@
 import { useState, useEffect, useRef, useCallback, useMemo } from 'react';
 import { useTranslation } from '../context/LanguageContext';
 import { Save, RotateCcw, AlertCircle, Check } from 'lucide-react';
-import { io, Socket } from 'socket.io-client';
+import { Socket } from 'socket.io-client';
+import { createSocket } from '../utils/socket';
 import { WS_URL } from '../api/axios';
 import api from '../api/axios';
 import { ToothSVG, type SurfaceName } from './odontogram/ToothSVG';
@@ -145,7 +146,7 @@ export default function Odontogram({ patientId, recordId, initialData, onSave, r
   // WebSocket
   useEffect(() => {
     const jwt = localStorage.getItem('access_token');
-    const socket: Socket = io(WS_URL, { transports: ['websocket','polling'], auth: { token: jwt||'' } });
+    const socket: Socket = createSocket(WS_URL, { transports: ['websocket','polling'], auth: { token: jwt||'' } });
     socket.on('ODONTOGRAM_UPDATED', (payload: { patient_id?: number; odontogram_data?: any }) => {
       if (payload.patient_id !== patientId || !payload.odontogram_data) return;
       const data = payload.odontogram_data;
@@ -0,0 +1,26 @@
+import { io, Socket, ManagerOptions, SocketOptions } from 'socket.io-client';
+
+/** Frame coalescido del servidor: varios eventos de la misma clínica en un solo mensaje. */
+export const BATCH_EVENT = 'EVENT_BATCH';
+
+interface EventBatch {
+    events?: { event: string; data: unknown }[];
+}
+
+/**
+ * Socket del dashboard: JWT en el handshake (salas por clínica), WebSocket primero
+ * y desempaquetado de EVENT_BATCH hacia los listeners de cada evento (NEW_MESSAGE, PATIENT_UPDATED...).
+ */
+export function createSocket(url: string, opts: Partial<ManagerOptions & SocketOptions> = {}): Socket {
+    const socket = io(url, {
+        transports: ['websocket', 'polling'],
+        auth: { token: localStorage.getItem('access_token') || '' },
+        ...opts,
+    });
+    socket.on(BATCH_EVENT, (frame: EventBatch) => {
+        for (const { event, data } of frame?.events ?? []) {
+            socket.listeners(event).forEach((listener) => listener(data));
+        }
+    });
+    return socket;
+}
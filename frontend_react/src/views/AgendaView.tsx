@@ -13,7 +13,8 @@ import { RefreshCw, Stethoscope } from 'lucide-react';
 import AppointmentCard from '../components/AppointmentCard';
 import api from '../api/axios';
 import { addDays, subDays, startOfDay, endOfDay } from 'date-fns';
-import { io, Socket } from 'socket.io-client';
+import { Socket } from 'socket.io-client';
+import { createSocket } from '../utils/socket';
 import { BACKEND_URL } from '../api/axios';
 import { useAuth } from '../context/AuthContext';
 import { useTranslation } from '../context/LanguageContext';
@@ -355,7 +356,7 @@ export default function AgendaView() {
   useEffect(() => {
     const jwtToken = localStorage.getItem('access_token');
     const adminToken = localStorage.getItem('ADMIN_TOKEN');
-    socketRef.current = io(BACKEND_URL, {
+    socketRef.current = createSocket(BACKEND_URL, {
       transports: ['websocket', 'polling'],
       reconnection: true,
       reconnectionAttempts: 3,
@@ -9,7 +9,8 @@ import {
 import api, { BACKEND_URL } from '../api/axios';
 import * as chatsApi from '../api/chats';
 import { useTranslation } from '../context/LanguageContext';
-import { io, Socket } from 'socket.io-client';
+import { Socket } from 'socket.io-client';
+import { createSocket } from '../utils/socket';
 import type { ChatSummaryItem, ChatApiMessage } from '../types/chat';
 import AdContextCard from '../components/AdContextCard';
 import { MessageContent } from '../components/chat/MessageMedia';
@@ -110,7 +111,8 @@ export default function ChatsView() {
   const [selectedFiles, setSelectedFiles] = useState<File[]>([]);
   const fileInputRef = useRef<HTMLInputElement>(null);
   const [searchTerm, setSearchTerm] = useState('');
-  const [messageOffset, setMessageOffset] = useState(0);
+  // Cursor (X-Next-Cursor) de la página de mensajes más viejos
+  const [messagesCursor, setMessagesCursor] = useState<string | null>(null);
   const [hasMoreMessages, setHasMoreMessages] = useState(true);
   const [loadingMore, setLoadingMore] = useState(false);
 
@@ -160,7 +162,8 @@ export default function ChatsView() {
 
   useEffect(() => {
     // Conectar al WebSocket (una sola vez — los handlers leen refs para valores frescos)
-    socketRef.current = io(BACKEND_URL);
+    // Auth JWT: el backend une el socket solo a las salas de las clínicas permitidas
+    socketRef.current = createSocket(BACKEND_URL);
 
     // Evento: Nueva derivación humana (derivhumano) — solo para la clínica seleccionada
     socketRef.current.on('HUMAN_HANDOFF', (data: { phone_number: string; reason: string; tenant_id?: number }) => {
@@ -420,14 +423,15 @@ export default function ChatsView() {
             params: selectedSession.tenant_id != null ? { tenant_id_override: selectedSession.tenant_id } : {}
           }).catch(() => null),
           api.get(`/admin/chat/messages/${selectedSession.phone_number}`, {
-            params: { tenant_id: selectedSession.tenant_id, limit: 50, offset: 0 }
+            params: { tenant_id: selectedSession.tenant_id, limit: 50 }
           }).catch(() => null)
         ]);
         if (currentPatientKeyRef.current !== keyAtStart) return;
         if (ctxRes?.data) setPatientContext(ctxRes.data);
         if (msgRes?.data) setMessages(msgRes.data);
-        setHasMoreMessages((msgRes?.data?.length ?? 0) === 50);
-        setMessageOffset(0);
+        const nextCursor = msgRes?.headers?.['x-next-cursor'] ?? null;
+        setMessagesCursor(nextCursor);
+        setHasMoreMessages(Boolean(nextCursor));
         markAsRead(selectedSession.phone_number, selectedSession.tenant_id);
       };
       fetchForSession();
@@ -510,23 +514,22 @@ export default function ChatsView() {
   const fetchMessages = async (phone: string, tenantId: number, append: boolean = false) => {
     if (!selectedSession) return;
     try {
-      const currentOffset = append ? messageOffset + 50 : 0;
       const response = await api.get(`/admin/chat/messages/${phone}`, {
-        params: { tenant_id: tenantId, limit: 50, offset: currentOffset }
+        params: { tenant_id: tenantId, limit: 50, ...(append && messagesCursor ? { before: messagesCursor } : {}) }
       });
 
       const newBatch = response.data;
 
       if (append) {
         setMessages(prev => [...newBatch, ...prev]);
-        setMessageOffset(currentOffset);
       } else {
         setMessages(newBatch);
-        setMessageOffset(0);
         scrollToBottom();
       }
 
-      setHasMoreMessages(newBatch.length === 50);
+      const nextCursor = response.headers?.['x-next-cursor'] ?? null;
+      setMessagesCursor(nextCursor);
+      setHasMoreMessages(Boolean(nextCursor));
     } catch (error) {
       console.error('Error fetching messages:', error);
       if (!append) setMessages([]);
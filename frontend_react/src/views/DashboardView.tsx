@@ -1,6 +1,7 @@
 import { useEffect, useState, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { io, Socket } from 'socket.io-client';
+import { Socket } from 'socket.io-client';
+import { createSocket } from '../utils/socket';
 import { MessageSquare, Calendar, Activity as LucideActivity, DollarSign, TrendingUp, TrendingDown, Target, Zap, Clock, ArrowUpRight, User, AlertCircle } from 'lucide-react';
 import {
   XAxis,
@@ -101,7 +102,7 @@ export default function DashboardView() {
 
   useEffect(() => {
     // 1. Conectar WebSocket
-    socketRef.current = io(BACKEND_URL);
+    socketRef.current = createSocket(BACKEND_URL);
 
     const loadUrgencies = async () => {
       try {
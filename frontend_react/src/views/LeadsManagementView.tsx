@@ -1,5 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
-import { io, Socket } from 'socket.io-client';
+import { Socket } from 'socket.io-client';
+import { createSocket } from '../utils/socket';
 import { useNavigate } from 'react-router-dom';
 import {
   Users, Search, Filter, Calendar, Phone, Mail, MessageSquare,
@@ -114,7 +115,7 @@ export default function LeadsManagementView() {
 
   // WebSocket Connection
   useEffect(() => {
-    socketRef.current = io(BACKEND_URL);
+    socketRef.current = createSocket(BACKEND_URL);
 
     socketRef.current.on('NEW_PATIENT', () => {
       loadLeads();
@@ -13,7 +13,8 @@ import DocumentGallery from '../components/DocumentGallery';
 import AnamnesisPanel from '../components/AnamnesisPanel';
 import DigitalRecordsTab from '../components/DigitalRecordsTab';
 import BillingTab from '../components/BillingTab';
-import { io, Socket } from 'socket.io-client';
+import { Socket } from 'socket.io-client';
+import { createSocket } from '../utils/socket';
 import { BACKEND_URL } from '../api/axios';
 
 interface Patient {
@@ -140,7 +141,7 @@ export default function PatientDetail() {
     const jwtToken = localStorage.getItem('access_token');
     const adminToken = localStorage.getItem('ADMIN_TOKEN');
 
-    socketRef.current = io(BACKEND_URL, {
+    socketRef.current = createSocket(BACKEND_URL, {
       transports: ['websocket', 'polling'],
       auth: { token: jwtToken || '', adminToken: adminToken || '' },
     });
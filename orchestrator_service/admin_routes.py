@@ -19,6 +19,8 @@ from fastapi import (
     UploadFile,
     File,
     Form,
+    Query,
+    Response,
 )
 from fastapi.responses import FileResponse, HTMLResponse
 from pydantic import BaseModel
@@ -26,6 +28,15 @@ from db import db
 from gcal_service import gcal_service
 from analytics_service import analytics_service
 from holiday_service import holiday_service
+from tool_cache import tool_cache
+from intent_router import fast_path_router
+from conversation_memory import conversation_memory
+from conversation_cache import conversation_cache
+from inbound_dedup import inbound_deduplicator
+from llm_usage import llm_usage_recorder
+from query_stats import query_stats
+from schema_capabilities import schema_capabilities
+from pagination import decode_cursor, keyset_page
 
 # Treatment Plan Schemas
 from schemas.treatment_plan import (
@@ -93,11 +104,11 @@ def normalize_phone(phone: str) -> str:
 
 # --- Helper para emitir eventos de Socket.IO ---
 async def emit_appointment_event(
-    event_type: str, data: Dict[str, Any], request: Request
+    event_type: str, data: Any, request: Request, tenant_id: Optional[int] = None
 ):
-    """Emit appointment events via Socket.IO through the app state."""
+    """Emit appointment events via Socket.IO to the clinic room (tenant_id o data["tenant_id"])."""
     if hasattr(request.app.state, "emit_appointment_event"):
-        await request.app.state.emit_appointment_event(event_type, data)
+        await request.app.state.emit_appointment_event(event_type, data, tenant_id)
 
 
 # --- Background Task para envío a WhatsApp ---
@@ -393,10 +404,21 @@ async def update_user_status(
     uid = uuid.UUID(user_id)
     if target_user["role"] in ("professional", "secretary"):
         is_active = payload.status == "active"
-        # Sincronizar is_active en professionals si ya tiene fila(s)
-        await db.execute(
-            "UPDATE professionals SET is_active = $1 WHERE user_id = $2", is_active, uid
-        )
+        # Sincronizar is_active en professionals si ya tiene fila(s); la caché de tools
+        # solo cambia en las sedes donde el usuario tiene ficha
+        if schema_capabilities.has_professional_tenant_id:
+            rows = await db.fetch(
+                "UPDATE professionals SET is_active = $1 WHERE user_id = $2 RETURNING tenant_id",
+                is_active,
+                uid,
+            )
+            for tenant in {r["tenant_id"] for r in rows}:
+                tool_cache.invalidate("professionals", tenant)
+        else:
+            await db.execute(
+                "UPDATE professionals SET is_active = $1 WHERE user_id = $2", is_active, uid
+            )
+            tool_cache.invalidate("professionals")
         # Al aprobar: si no tiene ninguna fila en professionals, crear una para la primera sede (puede usar la plataforma)
         if payload.status == "active":
             has_row = await db.pool.fetchval(
@@ -457,6 +479,7 @@ async def update_user_status(
                         )
                     else:
                         raise
+                tool_cache.invalidate("professionals", tenant_id)
 
     return {
         "message": f"Usuario {target_user['email']} actualizado a {payload.status}."
@@ -693,15 +716,14 @@ async def get_chat_sessions(
     El usuario solo ve sesiones cuyo tenant_id coincide con su clínica (o cualquiera si es CEO).
     Human Override y ventana de 24h son por (tenant_id, phone): independientes por clínica.
     """
+    reader = db.reader()
     if tenant_id not in allowed_ids:
         raise HTTPException(status_code=403, detail="No tienes acceso a esta clínica.")
     # Sesiones = pacientes de esta clínica que tienen al menos un mensaje en esta clínica
-    has_tenant_in_cm = await db.pool.fetchval(
-        "SELECT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema='public' AND table_name='chat_messages' AND column_name='tenant_id')"
-    )
+    has_tenant_in_cm = schema_capabilities.has_chat_tenant_id
     if not has_tenant_in_cm:
         # Fallback: DB sin parche 15, filtrar solo por patients.tenant_id (mensajes sin tenant)
-        rows = await db.pool.fetch(
+        rows = await reader.fetch(
             """
             SELECT * FROM (
                 SELECT DISTINCT ON (p.phone_number)
@@ -713,9 +735,10 @@ async def get_chat_sessions(
                     p.human_handoff_requested,
                     p.human_override_until,
                     p.last_derivhumano_at,
-                    CASE 
-                        WHEN p.human_handoff_requested AND p.human_override_until > NOW() THEN 'human_handling'
-                        WHEN p.human_override_until > NOW() THEN 'silenced'
+                    -- Los overrides vencidos los limpia override_sweeper (sin comparar contra NOW())
+                    CASE
+                        WHEN p.human_handoff_requested AND p.human_override_until IS NOT NULL THEN 'human_handling'
+                        WHEN p.human_override_until IS NOT NULL THEN 'silenced'
                         ELSE 'active'
                     END as status,
                     urgency.urgency_level
@@ -739,7 +762,7 @@ async def get_chat_sessions(
             tenant_id,
         )
     else:
-        rows = await db.pool.fetch(
+        rows = await reader.fetch(
             """
             SELECT * FROM (
                 SELECT DISTINCT ON (p.phone_number)
@@ -751,9 +774,10 @@ async def get_chat_sessions(
                     p.human_handoff_requested,
                     p.human_override_until,
                     p.last_derivhumano_at,
-                    CASE 
-                        WHEN p.human_handoff_requested AND p.human_override_until > NOW() THEN 'human_handling'
-                        WHEN p.human_override_until > NOW() THEN 'silenced'
+                    -- Los overrides vencidos los limpia override_sweeper (sin comparar contra NOW())
+                    CASE
+                        WHEN p.human_handoff_requested AND p.human_override_until IS NOT NULL THEN 'human_handling'
+                        WHEN p.human_override_until IS NOT NULL THEN 'silenced'
                         ELSE 'active'
                     END as status,
                     urgency.urgency_level
@@ -797,7 +821,7 @@ async def get_chat_sessions(
         unread_params = [row["phone_number"]] + (
             [tenant_id] if has_tenant_in_cm else []
         )
-        unread = await db.pool.fetchval(unread_sql, *unread_params)
+        unread = await reader.fetchval(unread_sql, *unread_params)
         last_user_sql = (
             """
             SELECT created_at FROM chat_messages
@@ -811,7 +835,7 @@ async def get_chat_sessions(
         last_user_params = [row["phone_number"]] + (
             [tenant_id] if has_tenant_in_cm else []
         )
-        last_user_msg = await db.pool.fetchval(last_user_sql, *last_user_params)
+        last_user_msg = await reader.fetchval(last_user_sql, *last_user_params)
         is_window_open = False
         if last_user_msg:
             now_localized = datetime.now(
@@ -852,46 +876,44 @@ async def get_chat_sessions(
 async def get_chat_messages(
     phone: str,
     tenant_id: int,
-    limit: int = 50,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
     offset: int = 0,
+    before: Optional[str] = None,
     allowed_ids: List[int] = Depends(get_allowed_tenant_ids),
 ):
-    """Historial de mensajes para un número en la clínica indicada. Aislado por tenant_id."""
+    """
+    Historial de mensajes para un número en la clínica indicada. Aislado por tenant_id.
+    Paginación: `before` = cursor de X-Next-Cursor (mensajes más viejos, por índice);
+    `offset` sigue funcionando para clientes anteriores.
+    """
     if tenant_id not in allowed_ids:
         raise HTTPException(status_code=403, detail="No tienes acceso a esta clínica.")
-    has_tenant = await db.pool.fetchval(
-        "SELECT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema='public' AND table_name='chat_messages' AND column_name='tenant_id')"
-    )
-    if has_tenant:
-        rows = await db.pool.fetch(
-            """
-            SELECT id, from_number, role, content, created_at, correlation_id
-            FROM chat_messages
-            WHERE from_number = $1 AND tenant_id = $2
-            ORDER BY created_at DESC
-            LIMIT $3 OFFSET $4
-        """,
-            phone,
-            tenant_id,
-            limit,
-            offset,
-        )
-    else:
-        rows = await db.pool.fetch(
-            """
-            SELECT id, from_number, role, content, created_at, correlation_id
-            FROM chat_messages
-            WHERE from_number = $1
-            ORDER BY created_at DESC
-            LIMIT $2 OFFSET $3
-        """,
-            phone,
-            limit,
-            offset,
-        )
+    conditions = ["from_number = $1"]
+    params: List[Any] = [phone]
+    if schema_capabilities.has_chat_tenant_id:
+        params.append(tenant_id)
+        conditions.append(f"tenant_id = ${len(params)}")
+    if before:
+        cursor_created, cursor_id = decode_cursor(before)
+        params.extend([cursor_created, cursor_id])
+        conditions.append(f"(created_at, id) < (${len(params) - 1}, ${len(params)})")
+    params.append(limit + 1)
+    query = f"""
+        SELECT id, from_number, role, content, created_at, correlation_id
+        FROM chat_messages
+        WHERE {" AND ".join(conditions)}
+        ORDER BY created_at DESC, id DESC
+        LIMIT ${len(params)}
+    """
+    if offset and not before:
+        params.append(offset)
+        query += f" OFFSET ${len(params)}"
+    rows = await db.pool.fetch(query, *params)
+    rows, _ = keyset_page(rows, limit, lambda r: (r["created_at"], r["id"]), response)
 
     # Invertir para que lleguen en orden cronológico al frontend
-    rows = sorted(rows, key=lambda x: x["created_at"])
+    rows = list(reversed(rows))
 
     messages = []
     for row in rows:
@@ -963,6 +985,9 @@ async def toggle_human_intervention(
             payload.tenant_id,
             payload.phone,
         )
+        await conversation_cache.set_handoff(
+            payload.tenant_id, payload.phone, True, override_until
+        )
         logger.info(
             f"👤 Intervención humana activada para {payload.phone} (tenant={payload.tenant_id}) hasta {override_until}"
         )
@@ -994,6 +1019,7 @@ async def toggle_human_intervention(
             payload.tenant_id,
             payload.phone,
         )
+        await conversation_cache.set_handoff(payload.tenant_id, payload.phone, False, None)
         logger.info(
             f"🤖 IA reactivada para {payload.phone} (tenant={payload.tenant_id})"
         )
@@ -1039,6 +1065,7 @@ async def remove_silence(
         tenant_id,
         phone,
     )
+    await conversation_cache.set_handoff(tenant_id, phone, False, None)
     await emit_appointment_event(
         "HUMAN_OVERRIDE_CHANGED",
         {
@@ -1076,6 +1103,57 @@ async def get_internal_credential(name: str, x_internal_token: str = Header(None
     return {"name": name, "value": val}
 
 
+@router.get("/internal/fast-path/stats", tags=["Internal"])
+async def get_fast_path_stats(x_internal_token: str = Header(None)):
+    """Tasa de acierto del fast-path (sin LLM) y de la caché de tools; latencia ahorrada estimada."""
+    if not INTERNAL_API_TOKEN or x_internal_token != INTERNAL_API_TOKEN:
+        raise HTTPException(status_code=401, detail="Internal token invalid")
+    return {
+        "fast_path": fast_path_router.stats.report(),
+        "tool_cache": tool_cache.stats(),
+    }
+
+
+@router.get("/internal/history/stats", tags=["Internal"])
+async def get_history_stats(x_internal_token: str = Header(None)):
+    """Tokens promedio de historial enviados al agente por turno y resúmenes generados."""
+    if not INTERNAL_API_TOKEN or x_internal_token != INTERNAL_API_TOKEN:
+        raise HTTPException(status_code=401, detail="Internal token invalid")
+    return conversation_memory.stats()
+
+
+@router.get("/internal/inbound/stats", tags=["Internal"])
+async def get_inbound_stats(x_internal_token: str = Header(None)):
+    """Dedup de mensajes entrantes: registros pendientes de escribir, escritos y purgados por retención."""
+    if not INTERNAL_API_TOKEN or x_internal_token != INTERNAL_API_TOKEN:
+        raise HTTPException(status_code=401, detail="Internal token invalid")
+    return inbound_deduplicator.stats()
+
+
+@router.get("/internal/db/queries", tags=["Internal"])
+async def get_query_stats(
+    limit: int = Query(20, ge=1, le=500),
+    order_by: str = Query("total", pattern="^(total|calls|p95|max|rows)$"),
+    x_internal_token: str = Header(None),
+):
+    """
+    Top-N consultas SQL de este proceso por fingerprint (llamadas, tiempo total/p95/máximo,
+    filas). Con varios workers cada uno tiene su tabla: consultar cada réplica.
+    """
+    if not INTERNAL_API_TOKEN or x_internal_token != INTERNAL_API_TOKEN:
+        raise HTTPException(status_code=401, detail="Internal token invalid")
+    return {**query_stats.stats(), "queries": query_stats.top(limit, order_by)}
+
+
+@router.delete("/internal/db/queries", tags=["Internal"])
+async def reset_query_stats(x_internal_token: str = Header(None)):
+    """Reinicia la tabla de fingerprints (por ejemplo, antes de una prueba de carga)."""
+    if not INTERNAL_API_TOKEN or x_internal_token != INTERNAL_API_TOKEN:
+        raise HTTPException(status_code=401, detail="Internal token invalid")
+    query_stats.reset()
+    return {"status": "reset"}
+
+
 @router.post("/chat/send", dependencies=[Depends(verify_admin_token)], tags=["Chat"])
 async def send_chat_message(
     payload: ChatSendMessage,
@@ -1087,9 +1165,7 @@ async def send_chat_message(
     if payload.tenant_id not in allowed_ids:
         raise HTTPException(status_code=403, detail="No tienes acceso a esta clínica.")
     try:
-        has_tenant = await db.pool.fetchval(
-            "SELECT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema='public' AND table_name='chat_messages' AND column_name='tenant_id')"
-        )
+        has_tenant = schema_capabilities.has_chat_tenant_id
         if has_tenant:
             last_user_msg = await db.pool.fetchval(
                 """
@@ -1123,7 +1199,7 @@ async def send_chat_message(
                 detail="La ventana de 24hs de WhatsApp ha expirado. El paciente debe escribir primero.",
             )
         correlation_id = str(uuid.uuid4())
-        await db.append_chat_message(
+        await conversation_cache.append_message(
             from_number=payload.phone,
             role="assistant",
             content=payload.message,
@@ -1166,13 +1242,14 @@ async def get_dashboard_stats(
     tenant_id: int = Depends(get_resolved_tenant_id),
 ):
     """Devuelve métricas avanzadas filtradas por rango temporal. Aislado por tenant_id (Regla de Oro)."""
+    reader = db.reader()
     try:
         days_map = {"weekly": 7, "monthly": 30, "yearly": 365}
         days = days_map.get(range, 99999)  # 99999 = effectively all time
 
         # 1. IA Conversations (Hilos únicos en el rango seleccionado)
         ia_conversations = (
-            await db.pool.fetchval(
+            await reader.fetchval(
                 """
             SELECT COUNT(DISTINCT from_number)
             FROM chat_messages
@@ -1186,7 +1263,7 @@ async def get_dashboard_stats(
 
         # 2. IA Appointments (Turnos de IA en el rango seleccionado)
         ia_appointments = (
-            await db.pool.fetchval(
+            await reader.fetchval(
                 """
             SELECT COUNT(*) FROM appointments
             WHERE tenant_id = $1 AND source = 'ai' AND appointment_datetime >= CURRENT_DATE - INTERVAL '1 day' * $2
@@ -1199,7 +1276,7 @@ async def get_dashboard_stats(
 
         # 3. Urgencias activas (Total acumulado de urgencias detectadas en el rango)
         active_urgencies = (
-            await db.pool.fetchval(
+            await reader.fetchval(
                 """
             SELECT COUNT(*) FROM appointments
             WHERE tenant_id = $1 AND urgency_level IN ('high', 'emergency')
@@ -1214,7 +1291,7 @@ async def get_dashboard_stats(
 
         # 4. Ingresos Totales (Basado en el rango seleccionado)
         total_revenue = (
-            await db.pool.fetchval(
+            await reader.fetchval(
                 """
             SELECT COALESCE(SUM(at.amount), 0)
             FROM accounting_transactions at
@@ -1232,7 +1309,7 @@ async def get_dashboard_stats(
         )
 
         # 5. Datos de crecimiento
-        growth_rows = await db.pool.fetch(
+        growth_rows = await reader.fetch(
             """
             SELECT
                 DATE(appointment_datetime) as date,
@@ -1754,13 +1831,15 @@ async def create_patient(
 
 @router.get("/patients", dependencies=[Depends(verify_admin_token)], tags=["Pacientes"])
 async def list_patients(
+    response: Response,
     search: str = None,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
     tenant_id: int = Depends(get_resolved_tenant_id),
 ):
     """
     Listar pacientes del tenant. Solo aparecen quienes tienen al menos un turno (Lead vs Paciente).
-    Aislado por tenant_id (Regla de Oro).
+    Aislado por tenant_id (Regla de Oro). Más páginas: `cursor` = X-Next-Cursor de la respuesta.
     """
     query = """
         SELECT p.id, p.first_name, p.last_name, p.phone_number, p.email,
@@ -1774,14 +1853,17 @@ async def list_patients(
     """
     params: List[Any] = [tenant_id]
     if search:
-        query += " AND (p.first_name ILIKE $2 OR p.last_name ILIKE $2 OR p.phone_number ILIKE $2 OR p.dni ILIKE $2)"
         params.append(f"%{search}%")
-        query += " ORDER BY p.created_at DESC LIMIT $3"
-        params.append(limit)
-    else:
-        query += " ORDER BY p.created_at DESC LIMIT $2"
-        params.append(limit)
+        n = len(params)
+        query += f" AND (p.first_name ILIKE ${n} OR p.last_name ILIKE ${n} OR p.phone_number ILIKE ${n} OR p.dni ILIKE ${n})"
+    if cursor:
+        cursor_created, cursor_id = decode_cursor(cursor)
+        params.extend([cursor_created, cursor_id])
+        query += f" AND (p.created_at, p.id) < (${len(params) - 1}, ${len(params)})"
+    params.append(limit + 1)
+    query += f" ORDER BY p.created_at DESC, p.id DESC LIMIT ${len(params)}"
     rows = await db.pool.fetch(query, *params)
+    rows, _ = keyset_page(rows, limit, lambda r: (r["created_at"], r["id"]), response)
     return [dict(row) for row in rows]
 
 
@@ -2737,6 +2819,7 @@ async def create_professional(
                 detail="La clínica elegida no existe. Creá una sede primero en Sedes (Clínicas).",
             )
 
+        tool_cache.invalidate("professionals", tenant_id)
         return {"status": "created", "user_id": str(user_id)}
     except HTTPException:
         raise
@@ -2768,10 +2851,16 @@ async def create_professional(
 async def update_professional(id: int, payload: ProfessionalUpdate):
     """Actualizar datos de un profesional por su ID numérico."""
     try:
-        # Verificar existencia
-        exists = await db.pool.fetchval("SELECT 1 FROM professionals WHERE id = $1", id)
+        # Verificar existencia (y la sede, para invalidar solo su caché de tools)
+        if schema_capabilities.has_professional_tenant_id:
+            exists = await db.pool.fetchrow(
+                "SELECT id, tenant_id FROM professionals WHERE id = $1", id
+            )
+        else:
+            exists = await db.pool.fetchrow("SELECT id FROM professionals WHERE id = $1", id)
         if not exists:
             raise HTTPException(status_code=404, detail="Profesional no encontrado")
+        prof_tenant_id = exists.get("tenant_id")
 
         # Actualizar datos básicos, disponibilidad y google_calendar_id
         current_wh = payload.working_hours
@@ -2907,6 +2996,7 @@ async def update_professional(id: int, payload: ProfessionalUpdate):
             else:
                 raise
 
+        tool_cache.invalidate("professionals", prof_tenant_id)
         return {"id": id, "status": "updated"}
     except HTTPException:
         raise
@@ -3068,10 +3158,17 @@ async def add_clinical_note(
 async def list_appointments(
     start_date: str,
     end_date: str,
+    response: Response,
     professional_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=2000),
+    cursor: Optional[str] = None,
     tenant_id: int = Depends(get_resolved_tenant_id),
 ):
-    """Obtener turnos del calendario. Aislado por tenant_id (Regla de Oro)."""
+    """
+    Obtener turnos del calendario. Aislado por tenant_id (Regla de Oro).
+    Sin `limit` devuelve el rango completo; con `limit` pagina y `cursor` = X-Next-Cursor.
+    """
+    reader = db.reader()
     query = """
         SELECT a.id, a.patient_id, a.appointment_datetime, a.duration_minutes, a.status, a.urgency_level,
                a.source, a.appointment_type, a.notes,
@@ -3091,8 +3188,19 @@ async def list_appointments(
     if professional_id:
         query += f" AND a.professional_id = ${len(params) + 1}"
         params.append(professional_id)
-    query += " ORDER BY a.appointment_datetime ASC"
-    rows = await db.pool.fetch(query, *params)
+    if cursor:
+        cursor_datetime, cursor_id = decode_cursor(cursor)
+        params.extend([cursor_datetime, cursor_id])
+        query += f" AND (a.appointment_datetime, a.id) > (${len(params) - 1}, ${len(params)}::uuid)"
+    query += " ORDER BY a.appointment_datetime ASC, a.id ASC"
+    if limit:
+        params.append(limit + 1)
+        query += f" LIMIT ${len(params)}"
+    rows = await reader.fetch(query, *params)
+    if limit:
+        rows, _ = keyset_page(
+            rows, limit, lambda r: (r["appointment_datetime"], r["id"]), response
+        )
     return [dict(row) for row in rows]
 
 
@@ -3237,11 +3345,12 @@ async def create_appointment_manual(
             apt.appointment_datetime,
             apt.appointment_type,
         )
+        tool_cache.invalidate("appointments", tenant_id)
 
         # 5. Obtener datos completos del turno para evento y GCal
         appointment_data = await db.pool.fetchrow(
             """
-            SELECT a.id, a.patient_id, a.professional_id, a.appointment_datetime, 
+            SELECT a.id, a.tenant_id, a.patient_id, a.professional_id, a.appointment_datetime, 
                    a.appointment_type, a.status, a.urgency_level,
                    (p.first_name || ' ' || COALESCE(p.last_name, '')) as patient_name, 
                    p.phone_number as patient_phone,
@@ -3329,14 +3438,18 @@ async def create_appointment_manual(
 )
 async def update_appointment_status(id: str, payload: StatusUpdate, request: Request):
     """Cambiar estado: confirmed, cancelled, attended, no_show."""
-    await db.pool.execute(
-        "UPDATE appointments SET status = $1 WHERE id = $2", payload.status, id
+    apt_tenant_id = await db.pool.fetchval(
+        "UPDATE appointments SET status = $1 WHERE id = $2 RETURNING tenant_id",
+        payload.status,
+        id,
     )
+    if apt_tenant_id is not None:
+        tool_cache.invalidate("appointments", apt_tenant_id)
 
     # Obtener datos actualizados del turno para emitir evento
     appointment_data = await db.pool.fetchrow(
         """
-        SELECT a.id, a.patient_id, a.professional_id, a.appointment_datetime, 
+        SELECT a.id, a.tenant_id, a.patient_id, a.professional_id, a.appointment_datetime, 
                a.appointment_type, a.status, a.urgency_level,
                (p.first_name || ' ' || COALESCE(p.last_name, '')) as patient_name, 
                p.phone_number as patient_phone,
@@ -3377,7 +3490,9 @@ async def update_appointment_status(id: str, payload: StatusUpdate, request: Req
 
         # 2. Emitir evento según el nuevo estado
         if payload.status == "cancelled":
-            await emit_appointment_event("APPOINTMENT_DELETED", id, request)
+            await emit_appointment_event(
+                "APPOINTMENT_DELETED", id, request, appointment_data["tenant_id"]
+            )
         else:
             await emit_appointment_event(
                 "APPOINTMENT_UPDATED", dict(appointment_data), request
@@ -3452,6 +3567,7 @@ async def update_appointment(
             id,
             tenant_id,
         )
+        tool_cache.invalidate("appointments", tenant_id)
 
         # 4. Sincronizar con Google Calendar
         try:
@@ -3534,7 +3650,7 @@ async def update_appointment(
         # 5. Emitir evento Socket.IO
         full_data = await db.pool.fetchrow(
             """
-            SELECT a.id, a.patient_id, a.professional_id, a.appointment_datetime, 
+            SELECT a.id, a.tenant_id, a.patient_id, a.professional_id, a.appointment_datetime, 
                    a.appointment_type, a.status, a.urgency_level,
                    (p.first_name || ' ' || COALESCE(p.last_name, '')) as patient_name, 
                    p.phone_number as patient_phone, prof.first_name as professional_name
@@ -3567,7 +3683,7 @@ async def delete_appointment(id: str, request: Request):
         # 1. Obtener datos antes de borrar
         apt = await db.pool.fetchrow(
             """
-            SELECT google_calendar_event_id, professional_id 
+            SELECT google_calendar_event_id, professional_id, tenant_id 
             FROM appointments WHERE id = $1
         """,
             id,
@@ -3593,9 +3709,12 @@ async def delete_appointment(id: str, request: Request):
 
         # 3. Borrar de la base de datos
         await db.pool.execute("DELETE FROM appointments WHERE id = $1", id)
+        tool_cache.invalidate("appointments", apt["tenant_id"])
 
         # 4. Notificar a la UI
-        await emit_appointment_event("APPOINTMENT_DELETED", id, request)
+        await emit_appointment_event(
+            "APPOINTMENT_DELETED", id, request, apt["tenant_id"]
+        )
 
         return {"status": "deleted", "id": id}
     except Exception as e:
@@ -3750,75 +3869,23 @@ async def list_professionals(
     """
     # Solo listar profesionales dentales aprobados (u.role = 'professional' y u.status = 'active').
     base_join = "FROM professionals p INNER JOIN users u ON p.user_id = u.id AND u.role = 'professional' AND u.status = 'active'"
-    # CEO (varias sedes): listar profesionales de todas las sedes permitidas
-    if len(allowed_ids) > 1:
-        try:
-            rows = await db.pool.fetch(
-                f"SELECT p.id, p.first_name, p.last_name, p.specialty, p.is_active, p.tenant_id {base_join} WHERE p.tenant_id = ANY($1::int[])",
-                allowed_ids,
-            )
-            return [dict(row) for row in rows]
-        except Exception as e:
-            err_str = str(e).lower()
-            if "last_name" in err_str or "tenant_id" in err_str:
-                try:
-                    rows = await db.pool.fetch(
-                        f"SELECT p.id, p.first_name, p.specialty, p.is_active, p.tenant_id {base_join} WHERE p.tenant_id = ANY($1::int[])",
-                        allowed_ids,
-                    )
-                    return [dict(r) | {"last_name": ""} for r in rows]
-                except Exception:
-                    pass
-            try:
-                rows = await db.pool.fetch(
-                    "SELECT p.id, p.first_name, p.last_name, p.specialty, p.is_active FROM professionals p INNER JOIN users u ON p.user_id = u.id AND u.role = 'professional' AND u.status = 'active' WHERE p.tenant_id = ANY($1::int[])",
-                    allowed_ids,
-                )
-                return [dict(row) for row in rows]
-            except Exception:
-                pass
-        try:
-            rows = await db.pool.fetch(
-                "SELECT p.id, p.first_name, p.last_name, p.specialty, p.is_active FROM professionals p INNER JOIN users u ON p.user_id = u.id AND u.role = 'professional' AND u.status = 'active'"
-            )
-            return [dict(row) for row in rows]
-        except Exception as e2:
-            logger.warning(f"list_professionals CEO fallback failed: {e2}")
-            return []
-
-    tenant_id = resolved_tenant_id
-    try:
-        rows = await db.pool.fetch(
-            f"SELECT p.id, p.first_name, p.last_name, p.specialty, p.is_active {base_join} WHERE p.tenant_id = $1",
-            tenant_id,
-        )
-        return [dict(row) for row in rows]
-    except Exception as e:
-        logger.warning(f"list_professionals primary query failed: {e}")
-
-    try:
-        rows = await db.pool.fetch(
-            "SELECT p.id, p.first_name, p.specialty, p.is_active FROM professionals p INNER JOIN users u ON p.user_id = u.id AND u.role = 'professional' AND u.status = 'active' WHERE p.tenant_id = $1",
-            tenant_id,
-        )
-        return [dict(r) | {"last_name": ""} for r in rows]
-    except Exception as e:
-        logger.warning(f"list_professionals fallback (no last_name) failed: {e}")
-
+    # Variante de consulta según las columnas detectadas al arrancar (schema_capabilities)
+    last_name = "p.last_name" if schema_capabilities.has_professional_last_name else "'' AS last_name"
+    columns = f"p.id, p.first_name, {last_name}, p.specialty, p.is_active"
+    if not schema_capabilities.has_professional_tenant_id:
+        # Esquema previo a multi-sede: no hay columna por la que filtrar
+        where, args = "", []
+    elif len(allowed_ids) > 1:
+        # CEO (varias sedes): listar profesionales de todas las sedes permitidas
+        columns += ", p.tenant_id"
+        where, args = "WHERE p.tenant_id = ANY($1::int[])", [allowed_ids]
+    else:
+        where, args = "WHERE p.tenant_id = $1", [resolved_tenant_id]
     try:
-        rows = await db.pool.fetch(
-            "SELECT p.id, p.first_name, p.last_name, p.specialty, p.is_active FROM professionals p INNER JOIN users u ON p.user_id = u.id AND u.role = 'professional' AND u.status = 'active'"
-        )
+        rows = await db.pool.fetch(f"SELECT {columns} {base_join} {where}", *args)
         return [dict(row) for row in rows]
     except Exception as e:
-        logger.warning(f"list_professionals fallback (no tenant) failed: {e}")
-    try:
-        rows = await db.pool.fetch(
-            "SELECT p.id, p.first_name, p.specialty, p.is_active FROM professionals p INNER JOIN users u ON p.user_id = u.id AND u.role = 'professional' AND u.status = 'active'"
-        )
-        return [dict(r) | {"last_name": ""} for r in rows]
-    except Exception as e:
-        logger.error(f"list_professionals all fallbacks failed: {e}", exc_info=True)
+        logger.error(f"list_professionals failed: {e}", exc_info=True)
         return []
 
 
@@ -3840,46 +3907,33 @@ async def get_professionals_by_user(
         uid = uuid.UUID(user_id)
     except (ValueError, TypeError):
         raise HTTPException(status_code=400, detail="user_id inválido")
-    try:
-        rows = await db.pool.fetch(
-            """
-            SELECT id, tenant_id, user_id, first_name, last_name, email, specialty,
-                   is_active, working_hours, created_at, phone_number, registration_id, google_calendar_id
-            FROM professionals
-            WHERE user_id = $1 AND tenant_id = ANY($2::int[])
-            ORDER BY tenant_id
-            """,
-            uid,
-            allowed_ids,
+    optional = [
+        c
+        for c in (
+            "tenant_id",
+            "last_name",
+            "working_hours",
+            "created_at",
+            "phone_number",
+            "registration_id",
+            "google_calendar_id",
         )
+        if schema_capabilities.has_column("professionals", c)
+    ]
+    # Solo las columnas que existen (detectadas al arrancar): una consulta, sin reintentos
+    columns = ", ".join(["id", "user_id", "first_name", "email", "specialty", "is_active"] + optional)
+    if schema_capabilities.has_professional_tenant_id:
+        query = f"SELECT {columns} FROM professionals WHERE user_id = $1 AND tenant_id = ANY($2::int[]) ORDER BY tenant_id"
+        args = [uid, allowed_ids]
+    else:
+        query = f"SELECT {columns} FROM professionals WHERE user_id = $1"
+        args = [uid]
+    try:
+        rows = await db.pool.fetch(query, *args)
         return [dict(r) for r in rows]
     except Exception as e:
-        err_str = str(e).lower()
-        if (
-            "working_hours" in err_str
-            or "tenant_id" in err_str
-            or "phone_number" in err_str
-            or "registration_id" in err_str
-            or "google_calendar_id" in err_str
-        ):
-            try:
-                rows = await db.pool.fetch(
-                    "SELECT id, tenant_id, user_id, first_name, last_name, email, specialty, is_active, working_hours, phone_number, registration_id FROM professionals WHERE user_id = $1 AND tenant_id = ANY($2::int[]) ORDER BY tenant_id",
-                    uid,
-                    allowed_ids,
-                )
-                return [dict(r) for r in rows]
-            except Exception:
-                pass
-        try:
-            rows = await db.pool.fetch(
-                "SELECT id, first_name, last_name, email, specialty, is_active FROM professionals WHERE user_id = $1",
-                uid,
-            )
-            return [dict(r) for r in rows]
-        except Exception as e2:
-            logger.warning(f"get_professionals_by_user failed: {e2}")
-            return []
+        logger.warning(f"get_professionals_by_user failed: {e}")
+        return []
 
 
 @router.get(
@@ -4356,6 +4410,7 @@ async def create_treatment_type(
             treatment.is_available_for_booking,
             treatment.internal_notes,
         )
+        tool_cache.invalidate("treatments", tenant_id)
         return {"status": "created", "code": treatment.code}
     except asyncpg.UniqueViolationError:
         raise HTTPException(
@@ -4403,6 +4458,7 @@ async def update_treatment_type(
         tenant_id,
         code,
     )
+    tool_cache.invalidate("treatments", tenant_id)
     if result == "UPDATE 0":
         raise HTTPException(status_code=404, detail="Tipo de tratamiento no encontrado")
     return {"status": "updated", "code": code}
@@ -4428,6 +4484,7 @@ async def delete_treatment_type(
             tenant_id,
             code,
         )
+        tool_cache.invalidate("treatments", tenant_id)
         return {
             "status": "deactivated",
             "code": code,
@@ -4438,6 +4495,7 @@ async def delete_treatment_type(
         tenant_id,
         code,
     )
+    tool_cache.invalidate("treatments", tenant_id)
     if result == "DELETE 0":
         raise HTTPException(status_code=404, detail="Tipo de tratamiento no encontrado")
     return {"status": "deleted", "code": code}
@@ -4556,6 +4614,7 @@ async def create_holiday(
         holiday.date,
         holiday.description,
     )
+    tool_cache.invalidate("holidays", tenant_id)
     return dict(row)
 
 
@@ -4600,6 +4659,55 @@ async def get_professionals_analytics(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+LLM_USAGE_COUNTERS = (
+    "agent_turns",
+    "llm_calls",
+    "tool_calls",
+    "prompt_tokens",
+    "completion_tokens",
+    "cached_tokens",
+)
+
+
+@router.get("/analytics/llm-usage", tags=["Analítica"])
+async def get_llm_usage(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    tenant_id: Optional[int] = None,
+    user_data=Depends(verify_admin_token),
+    allowed_ids: List[int] = Depends(get_allowed_tenant_ids),
+):
+    """
+    Consumo del LLM (tokens, llamadas, tools, latencia y costo estimado en USD) por clínica y día.
+    Por defecto los últimos 30 días; CEO ve todas las clínicas, el resto solo la propia.
+    """
+    try:
+        end = date.fromisoformat(end_date) if end_date else datetime.now().date()
+        start = date.fromisoformat(start_date) if start_date else end - timedelta(days=29)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Fechas inválidas (usar YYYY-MM-DD)")
+    if tenant_id is not None:
+        if tenant_id not in allowed_ids:
+            raise HTTPException(status_code=403, detail="No tienes acceso a esta clínica.")
+        allowed_ids = [tenant_id]
+
+    days = await llm_usage_recorder.daily_usage(allowed_ids, start, end)
+    totals: Dict[int, Dict[str, Any]] = {}
+    for row in days:
+        total = totals.setdefault(
+            row["tenant_id"], {"tenant_id": row["tenant_id"], "cost_usd": 0.0}
+        )
+        for key in LLM_USAGE_COUNTERS:
+            total[key] = total.get(key, 0) + int(row[key] or 0)
+        total["cost_usd"] = round(total["cost_usd"] + row["cost_usd"], 6)
+    return {
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "days": days,
+        "totals": list(totals.values()),
+    }
+
+
 # ============================================
 # TREATMENT PLAN BILLING - CRUD ENDPOINTS (EP-01 a EP-10)
 # ============================================
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger("admission")
+
+# Límites de concurrencia para turnos del agente (OpenAI + conexiones a BD)
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "20"))
+AGENT_TENANT_MAX_CONCURRENCY = int(os.getenv("AGENT_TENANT_MAX_CONCURRENCY", "8"))
+# Cola de espera acotada: más allá de esto se rechaza al instante
+AGENT_QUEUE_MAX = int(os.getenv("AGENT_QUEUE_MAX", "100"))
+# Tiempo máximo en cola antes de rechazar (segundos)
+AGENT_QUEUE_TIMEOUT = float(os.getenv("AGENT_QUEUE_TIMEOUT_SECONDS", "20"))
+AGENT_RETRY_AFTER_MIN = int(os.getenv("AGENT_RETRY_AFTER_MIN_SECONDS", "2"))
+AGENT_RETRY_AFTER_MAX = int(os.getenv("AGENT_RETRY_AFTER_MAX_SECONDS", "60"))
+
+AGENT_IN_FLIGHT = Gauge(
+    "orchestrator_agent_in_flight", "Turnos del agente en ejecución"
+)
+AGENT_QUEUED = Gauge(
+    "orchestrator_agent_queued", "Turnos del agente esperando un cupo"
+)
+AGENT_REJECTED = Counter(
+    "orchestrator_agent_rejected_total",
+    "Turnos rechazados por el control de admisión",
+    ["reason"],
+)
+
+
+class AdmissionRejected(Exception):
+    """El turno no consiguió cupo: el llamador debe reintentar tras `retry_after` segundos."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"admission rejected ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Control de admisión para /chat: límite global + límite por clínica,
+    cola de espera acotada con deadline y rechazo rápido con retry_after estimado.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = AGENT_MAX_CONCURRENCY,
+        tenant_max_concurrency: int = AGENT_TENANT_MAX_CONCURRENCY,
+        queue_max: int = AGENT_QUEUE_MAX,
+        queue_timeout: float = AGENT_QUEUE_TIMEOUT,
+    ):
+        self.max_concurrency = max_concurrency
+        self.tenant_max_concurrency = tenant_max_concurrency
+        self.queue_max = queue_max
+        self.queue_timeout = queue_timeout
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._tenants: Dict[int, asyncio.Semaphore] = {}
+        self.in_flight = 0
+        self.queued = 0
+        # Promedio móvil de duración de un turno (base del retry_after)
+        self._avg_turn_seconds = 5.0
+
+    def _tenant_semaphore(self, tenant_id: int) -> asyncio.Semaphore:
+        sem = self._tenants.get(tenant_id)
+        if sem is None:
+            sem = self._tenants[tenant_id] = asyncio.Semaphore(
+                self.tenant_max_concurrency
+            )
+        return sem
+
+    def retry_after(self) -> int:
+        """Segundos sugeridos para reintentar: tiempo estimado hasta drenar la cola actual."""
+        waves = (self.queued + 1) / max(self.max_concurrency, 1)
+        estimate = math.ceil(self._avg_turn_seconds * max(waves, 1))
+        return max(AGENT_RETRY_AFTER_MIN, min(estimate, AGENT_RETRY_AFTER_MAX))
+
+    def _reject(self, reason: str, tenant_id: int) -> AdmissionRejected:
+        AGENT_REJECTED.labels(reason=reason).inc()
+        retry_after = self.retry_after()
+        logger.warning(
+            f"🚦 Turno rechazado tenant_id={tenant_id} reason={reason} "
+            f"in_flight={self.in_flight} queued={self.queued} retry_after={retry_after}s"
+        )
+        return AdmissionRejected(reason, retry_after)
+
+    @asynccontextmanager
+    async def slot(self, tenant_id: int, timeout: Optional[float] = None):
+        """Espera un cupo (clínica y global) o lanza AdmissionRejected."""
+        if self.queued >= self.queue_max:
+            raise self._reject("queue_full", tenant_id)
+
+        deadline = time.monotonic() + (timeout or self.queue_timeout)
+        tenant_sem = self._tenant_semaphore(tenant_id)
+        acquired = []
+        self.queued += 1
+        AGENT_QUEUED.set(self.queued)
+        try:
+            for sem in (tenant_sem, self._global):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                await asyncio.wait_for(sem.acquire(), timeout=remaining)
+                acquired.append(sem)
+        except asyncio.TimeoutError:
+            for sem in acquired:
+                sem.release()
+            raise self._reject("queue_timeout", tenant_id)
+        except BaseException:
+            for sem in acquired:
+                sem.release()
+            raise
+        finally:
+            self.queued -= 1
+            AGENT_QUEUED.set(self.queued)
+
+        self.in_flight += 1
+        AGENT_IN_FLIGHT.set(self.in_flight)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self._avg_turn_seconds = 0.8 * self._avg_turn_seconds + 0.2 * elapsed
+            self.in_flight -= 1
+            AGENT_IN_FLIGHT.set(self.in_flight)
+            for sem in reversed(acquired):
+                sem.release()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_concurrency": self.max_concurrency,
+            "tenant_max_concurrency": self.tenant_max_concurrency,
+            "avg_turn_seconds": round(self._avg_turn_seconds, 2),
+        }
+
+
+# Instancia global para importar fácilmente
+admission_controller = AdmissionController()
@@ -14,9 +14,10 @@ class AnalyticsService:
         Calculates performance metrics for all professionals within the given date range.
         Using REAL data from appointments, patients, and clinical records.
         """
+        reader = db.reader()
         try:
             # 1. Fetch basic professional info (solo profesionales dentales, no secretarias)
-            professionals = await db.pool.fetch(
+            professionals = await reader.fetch(
                 """
                 SELECT p.id, p.first_name, p.last_name, p.specialty, p.google_calendar_id 
                 FROM professionals p
@@ -34,7 +35,7 @@ class AnalyticsService:
 
                 # 2. Aggregations from APPOINTMENTS
                 # Status counts
-                stats = await db.pool.fetchrow(
+                stats = await reader.fetchrow(
                     """
                     SELECT 
                         COUNT(*) as total,
@@ -68,7 +69,7 @@ class AnalyticsService:
                 # 3. Revenue Estimation (Real Data from Treatments)
                 # Assumes 'cost' field exists in treatments JSONB or clinical_records
                 # If not currently populated, this will return 0 but logic is "Real"
-                revenue_row = await db.pool.fetchrow(
+                revenue_row = await reader.fetchrow(
                     """
                     SELECT SUM(COALESCE((treatment->>'cost')::numeric, 0)) as total_revenue
                     FROM clinical_records, jsonb_array_elements(treatments) as treatment
@@ -85,7 +86,7 @@ class AnalyticsService:
 
                 # 4. Retention Analysis (Patients seen in this period who had prior visits)
                 # "Returning Patient": A patient who has an appointment BEFORE start_date
-                returning_patients_count = await db.pool.fetchval(
+                returning_patients_count = await reader.fetchval(
                     """
                     SELECT COUNT(DISTINCT patient_id)
                     FROM appointments a1
@@ -153,8 +154,9 @@ class AnalyticsService:
         Métricas de un solo profesional para un tenant y rango de fechas.
         Usado por el modal de datos del profesional (acordeón).
         """
+        reader = db.reader()
         try:
-            prof = await db.pool.fetchrow(
+            prof = await reader.fetchrow(
                 """
                 SELECT id, first_name, last_name, specialty
                 FROM professionals
@@ -167,7 +169,7 @@ class AnalyticsService:
                 return None
             prof_id = prof["id"]
             full_name = f"{prof['first_name']} {prof['last_name'] or ''}".strip()
-            stats = await db.pool.fetchrow(
+            stats = await reader.fetchrow(
                 """
                 SELECT
                     COUNT(*) as total,
@@ -194,7 +196,7 @@ class AnalyticsService:
                 (cancelled_apts / total_apts) * 100 if total_apts > 0 else 0
             )
             unique_patients = stats["unique_patients"] or 0
-            returning_patients_count = await db.pool.fetchval(
+            returning_patients_count = await reader.fetchval(
                 """
                 SELECT COUNT(DISTINCT patient_id)
                 FROM appointments a1
@@ -214,7 +216,7 @@ class AnalyticsService:
                 if unique_patients > 0
                 else 0
             )
-            revenue_row = await db.pool.fetchrow(
+            revenue_row = await reader.fetchrow(
                 """
                 SELECT SUM(COALESCE((treatment->>'cost')::numeric, 0)) as total_revenue
                 FROM clinical_records, jsonb_array_elements(treatments) as treatment
@@ -6,7 +6,9 @@ import json
 import logging
 import asyncpg
 from db import db
+from schema_capabilities import schema_capabilities
 from auth_service import auth_service
+from tool_cache import tool_cache
 
 router = APIRouter(prefix="/auth", tags=["Nexus Auth"])
 logger = logging.getLogger("auth_routes")
@@ -428,14 +430,30 @@ async def update_profile(payload: ProfileUpdate, request: Request):
 
     # Update professionals table if applicable
     if user_data.role == "professional" and payload.google_calendar_id is not None:
-        await db.execute(
-            """
-            UPDATE professionals 
-            SET google_calendar_id = $1 
-            WHERE user_id = $2
-        """,
-            payload.google_calendar_id,
-            uuid.UUID(user_id),
-        )
+        if schema_capabilities.has_professional_tenant_id:
+            # Solo las sedes donde el profesional tiene ficha
+            rows = await db.fetch(
+                """
+                UPDATE professionals 
+                SET google_calendar_id = $1 
+                WHERE user_id = $2
+                RETURNING tenant_id
+            """,
+                payload.google_calendar_id,
+                uuid.UUID(user_id),
+            )
+            for tenant in {r["tenant_id"] for r in rows}:
+                tool_cache.invalidate("professionals", tenant)
+        else:
+            await db.execute(
+                """
+                UPDATE professionals 
+                SET google_calendar_id = $1 
+                WHERE user_id = $2
+            """,
+                payload.google_calendar_id,
+                uuid.UUID(user_id),
+            )
+            tool_cache.invalidate("professionals")
 
     return {"message": "Perfil actualizado correctamente."}
@@ -0,0 +1,183 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from prometheus_client import Counter
+
+from db import db
+
+logger = logging.getLogger("chat_archiver")
+
+# Particiones mensuales de chat_messages creadas por adelantado
+CHAT_PARTITION_MONTHS_AHEAD = int(os.getenv("CHAT_PARTITION_MONTHS_AHEAD", "3"))
+# Meses que se conservan en la base; los anteriores se exportan y se separan (0 = no archivar)
+CHAT_ARCHIVE_AFTER_MONTHS = int(os.getenv("CHAT_ARCHIVE_AFTER_MONTHS", "0"))
+CHAT_ARCHIVE_DIR = os.getenv("CHAT_ARCHIVE_DIR", "archive/chat_messages")
+# false: la partición exportada se separa (DETACH) pero la tabla queda en la base
+CHAT_ARCHIVE_DROP = os.getenv("CHAT_ARCHIVE_DROP", "true").lower() == "true"
+CHAT_MAINTENANCE_INTERVAL_HOURS = float(os.getenv("CHAT_MAINTENANCE_INTERVAL_HOURS", "24"))
+
+_EXPORT_BATCH = 5000
+_PARTITION = re.compile(r"^chat_messages_p(\d{4})(\d{2})$")
+
+ARCHIVED_ROWS = Counter(
+    "orchestrator_chat_messages_archived_rows_total",
+    "Filas de chat_messages exportadas al archivo y separadas de la base",
+)
+
+
+def partition_month(name: str) -> Optional[date]:
+    """chat_messages_p202501 → 2025-01-01 (None para la default u otros nombres)."""
+    match = _PARTITION.match(name)
+    if match is None:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def archive_cutoff(today: date, months: int) -> date:
+    """Primer mes que se conserva: las particiones de meses anteriores se archivan."""
+    index = today.year * 12 + today.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class ChatArchiver:
+    """
+    Mantenimiento de chat_messages particionada por mes: crea las particiones futuras y
+    exporta las frías (más viejas que CHAT_ARCHIVE_AFTER_MONTHS) a JSONL comprimido con gzip,
+    luego las separa de la tabla. Así índices y páginas calientes son solo los meses recientes.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.partitions_created = 0
+        self.archived_partitions = 0
+        self.archived_rows = 0
+        self.errors = 0
+
+    async def ensure_partitions(self, months_ahead: int = CHAT_PARTITION_MONTHS_AHEAD) -> int:
+        created = await db.ensure_chat_partitions(months_ahead)
+        if created:
+            self.partitions_created += created
+            logger.info(f"🗂️ chat_messages: {created} particiones mensuales creadas")
+        return created
+
+    @staticmethod
+    def archivable(
+        partitions: List[str], months: int = CHAT_ARCHIVE_AFTER_MONTHS, today: Optional[date] = None
+    ) -> List[str]:
+        """Particiones mensuales anteriores al corte (nunca la default ni el mes en curso)."""
+        if months <= 0:
+            return []
+        cutoff = archive_cutoff(today or date.today(), months)
+        return [
+            name
+            for name in partitions
+            if partition_month(name) is not None and partition_month(name) < cutoff
+        ]
+
+    async def archive_partition(self, name: str, archive_dir: str = CHAT_ARCHIVE_DIR) -> Optional[int]:
+        """
+        Exporta la partición a {archive_dir}/{name}.jsonl.gz y la separa de chat_messages.
+        Todo en una transacción: si la exportación falla o no cuadra, la partición queda como estaba.
+        Devuelve las filas exportadas, o None si otro proceso está archivando.
+        """
+        await asyncio.to_thread(os.makedirs, archive_dir, exist_ok=True)
+        path = os.path.join(archive_dir, f"{name}.jsonl.gz")
+        tmp_path = f"{path}.tmp"
+        async with db.pool.acquire() as conn:
+            async with conn.transaction():
+                if not await conn.fetchval(
+                    "SELECT pg_try_advisory_xact_lock(hashtext('chat_messages_archival'))"
+                ):
+                    return None
+                # Sin escrituras en la partición mientras se exporta (las lecturas siguen)
+                await conn.execute(f'LOCK TABLE "{name}" IN SHARE MODE')
+                rows = 0
+                fh = await asyncio.to_thread(gzip.open, tmp_path, "wt", encoding="utf-8")
+                try:
+                    try:
+                        lines: List[str] = []
+                        async for record in conn.cursor(
+                            f'SELECT * FROM "{name}" ORDER BY created_at, id', prefetch=_EXPORT_BATCH
+                        ):
+                            lines.append(json.dumps(dict(record), default=str, ensure_ascii=False))
+                            if len(lines) >= _EXPORT_BATCH:
+                                await asyncio.to_thread(fh.write, "\n".join(lines) + "\n")
+                                rows += len(lines)
+                                lines = []
+                        if lines:
+                            await asyncio.to_thread(fh.write, "\n".join(lines) + "\n")
+                            rows += len(lines)
+                    finally:
+                        await asyncio.to_thread(fh.close)
+
+                    expected = await conn.fetchval(f'SELECT COUNT(*) FROM "{name}"')
+                    if rows != expected:
+                        raise RuntimeError(f"{name}: exportadas {rows} filas de {expected}")
+                    await asyncio.to_thread(os.replace, tmp_path, path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+
+                # DETACH toma un lock exclusivo sobre chat_messages: no encolarse detrás de consultas largas
+                await conn.execute("SET LOCAL lock_timeout = '5s'")
+                await conn.execute(f'ALTER TABLE chat_messages DETACH PARTITION "{name}"')
+                if CHAT_ARCHIVE_DROP:
+                    await conn.execute(f'DROP TABLE "{name}"')
+
+        ARCHIVED_ROWS.inc(rows)
+        self.archived_partitions += 1
+        self.archived_rows += rows
+        logger.info(f"📦 chat_messages: {name} archivada en {path} ({rows} filas)")
+        return rows
+
+    async def run_once(self, months: int = CHAT_ARCHIVE_AFTER_MONTHS) -> Dict[str, Any]:
+        created = await self.ensure_partitions()
+        archived: Dict[str, Optional[int]] = {}
+        for name in self.archivable(await db.list_chat_partitions(), months):
+            archived[name] = await self.archive_partition(name)
+            if archived[name] is None:
+                break
+        return {"created": created, "archived": archived}
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"❌ Error en el mantenimiento de chat_messages: {e}")
+            await asyncio.sleep(CHAT_MAINTENANCE_INTERVAL_HOURS * 3600)
+
+    def start(self):
+        if self._task is None and CHAT_MAINTENANCE_INTERVAL_HOURS > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "months_ahead": CHAT_PARTITION_MONTHS_AHEAD,
+            "archive_after_months": CHAT_ARCHIVE_AFTER_MONTHS,
+            "partitions_created": self.partitions_created,
+            "archived_partitions": self.archived_partitions,
+            "archived_rows": self.archived_rows,
+            "errors": self.errors,
+        }
+
+
+# Instancia global para importar fácilmente
+chat_archiver = ChatArchiver()
@@ -0,0 +1,286 @@
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from prometheus_client import Counter
+
+from db import db
+
+logger = logging.getLogger("conversation_cache")
+
+REDIS_URL = os.getenv("REDIS_URL", "")
+CONVERSATION_CACHE_ENABLED = os.getenv("CONVERSATION_CACHE_ENABLED", "true").lower() == "true"
+# Mensajes recientes por conversación (debe cubrir HISTORY_MAX_MESSAGES)
+CONVERSATION_CACHE_MESSAGES = int(
+    os.getenv("CONVERSATION_CACHE_MESSAGES", os.getenv("HISTORY_MAX_MESSAGES", "20"))
+)
+# Conversaciones inactivas salen de Redis solas; la próxima lectura las recarga de Postgres
+CONVERSATION_CACHE_TTL_SECONDS = int(os.getenv("CONVERSATION_CACHE_TTL_SECONDS", "21600"))
+
+CONVERSATION_CACHE = Counter(
+    "orchestrator_conversation_cache_total",
+    "Lecturas del estado de conversación (kind: messages/handoff; result: hit, miss, error)",
+    ["kind", "result"],
+)
+
+
+class ConversationCache:
+    """
+    Estado caliente de cada conversación (tenant_id, teléfono) en Redis, write-through:
+    - conv:{tenant}:{phone}:msgs → lista acotada de los últimos mensajes ({id, role, content}).
+    - conv:{tenant}:{phone}:state → flags de derivación (human_handoff_requested/override_until).
+    - conv:{tenant}:{phone}:v → versión; toda escritura la incrementa y una recarga desde
+      Postgres solo se guarda si la versión no cambió mientras leía (WATCH/MULTI).
+    Postgres sigue siendo la fuente de verdad: sin Redis (o si falla) se lee de ahí.
+    """
+
+    def __init__(self):
+        self._redis = None
+
+    def _get_redis(self):
+        if self._redis is None and REDIS_URL and CONVERSATION_CACHE_ENABLED:
+            import redis.asyncio as aioredis
+
+            self._redis = aioredis.from_url(REDIS_URL, decode_responses=True)
+        return self._redis
+
+    @staticmethod
+    def key(tenant_id: int, phone: str, part: str) -> str:
+        return f"conv:{tenant_id}:{phone}:{part}"
+
+    async def _fill(
+        self,
+        client,
+        tenant_id: int,
+        phone: str,
+        part: str,
+        loader: Callable[[], Awaitable[Any]],
+        write: Callable[[Any, str, Any], None],
+    ):
+        """Lee de Postgres y guarda en Redis salvo que una escritura concurrente cambie la versión."""
+        from redis.exceptions import WatchError
+
+        version_key = self.key(tenant_id, phone, "v")
+        async with client.pipeline(transaction=True) as pipe:
+            await pipe.watch(version_key)
+            value = await loader()
+            pipe.multi()
+            write(pipe, self.key(tenant_id, phone, part), value)
+            try:
+                await pipe.execute()
+            except WatchError:
+                logger.debug(f"🗃️ Recarga de {part} descartada por escritura concurrente ({phone})")
+        return value
+
+    def _bump(self, pipe, tenant_id: int, phone: str):
+        version_key = self.key(tenant_id, phone, "v")
+        pipe.incr(version_key)
+        pipe.expire(version_key, CONVERSATION_CACHE_TTL_SECONDS)
+
+    # --- Mensajes ---
+
+    @staticmethod
+    async def _load_messages(phone: str, tenant_id: int, limit: int) -> List[dict]:
+        rows = await db.pool.fetch(
+            """
+            SELECT id, role, content FROM chat_messages
+            WHERE from_number = $1 AND tenant_id = $2
+            ORDER BY id DESC LIMIT $3
+            """,
+            phone,
+            tenant_id,
+            limit,
+        )
+        return [dict(r) for r in reversed(rows)]
+
+    async def recent_messages(self, phone: str, tenant_id: int) -> List[dict]:
+        """Últimos CONVERSATION_CACHE_MESSAGES mensajes en orden cronológico."""
+        client = self._get_redis()
+        if client is None:
+            return await self._load_messages(phone, tenant_id, CONVERSATION_CACHE_MESSAGES)
+        try:
+            cached = await client.lrange(self.key(tenant_id, phone, "msgs"), 0, -1)
+            if cached:
+                CONVERSATION_CACHE.labels(kind="messages", result="hit").inc()
+                # Una recarga que ya leyó el mensaje de Postgres puede guardarse antes de su
+                # RPUSHX: el mismo id queda dos veces en la lista, se deduplica al leer
+                unique = {m["id"]: m for m in map(json.loads, cached)}
+                return [unique[message_id] for message_id in sorted(unique)]
+
+            def write(pipe, key, messages):
+                pipe.delete(key)
+                if messages:
+                    pipe.rpush(key, *(json.dumps(m) for m in messages))
+                    pipe.expire(key, CONVERSATION_CACHE_TTL_SECONDS)
+
+            CONVERSATION_CACHE.labels(kind="messages", result="miss").inc()
+            return await self._fill(
+                client,
+                tenant_id,
+                phone,
+                "msgs",
+                lambda: self._load_messages(phone, tenant_id, CONVERSATION_CACHE_MESSAGES),
+                write,
+            )
+        except Exception as e:
+            CONVERSATION_CACHE.labels(kind="messages", result="error").inc()
+            logger.warning(f"⚠️ Cache de conversación no disponible, se usa Postgres: {e}")
+            return await self._load_messages(phone, tenant_id, CONVERSATION_CACHE_MESSAGES)
+
+    async def append_message(
+        self,
+        from_number: str,
+        role: str,
+        content: str,
+        correlation_id: str,
+        tenant_id: int = 1,
+    ) -> int:
+        """db.append_chat_message + alta en la lista cacheada (solo si ya estaba cargada)."""
+        message_id = await db.append_chat_message(
+            from_number=from_number,
+            role=role,
+            content=content,
+            correlation_id=correlation_id,
+            tenant_id=tenant_id,
+        )
+        client = self._get_redis()
+        if client is None:
+            return message_id
+        key = self.key(tenant_id, from_number, "msgs")
+        try:
+            entry = json.dumps({"id": message_id, "role": role, "content": content})
+            async with client.pipeline(transaction=True) as pipe:
+                # Misma serialización que la recarga: si ya lo trajo de Postgres, no se repite
+                pipe.lrem(key, 0, entry)
+                pipe.rpushx(key, entry)
+                pipe.ltrim(key, -CONVERSATION_CACHE_MESSAGES, -1)
+                self._bump(pipe, tenant_id, from_number)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo actualizar la cache de {from_number}; se invalida: {e}")
+            await self.invalidate(tenant_id, from_number)
+        return message_id
+
+    # --- Derivación humana ---
+
+    @staticmethod
+    async def _load_handoff(phone: str, tenant_id: int) -> Optional[Dict[str, Any]]:
+        row = await db.pool.fetchrow(
+            """
+            SELECT human_handoff_requested, human_override_until
+            FROM patients
+            WHERE tenant_id = $1 AND phone_number = $2
+            """,
+            tenant_id,
+            phone,
+        )
+        return dict(row) if row else None
+
+    @staticmethod
+    def _encode_handoff(state: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        if state is None:
+            return {"exists": "0"}
+        until = state.get("human_override_until")
+        return {
+            "exists": "1",
+            "human_handoff_requested": "1" if state.get("human_handoff_requested") else "0",
+            "human_override_until": until.isoformat() if until else "",
+        }
+
+    @staticmethod
+    def _decode_handoff(cached: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        if cached.get("exists") != "1":
+            return None
+        until = cached.get("human_override_until")
+        return {
+            "human_handoff_requested": cached.get("human_handoff_requested") == "1",
+            "human_override_until": datetime.fromisoformat(until) if until else None,
+        }
+
+    async def get_handoff(self, tenant_id: int, phone: str) -> Optional[Dict[str, Any]]:
+        """Flags de derivación del paciente (mismas claves que la fila de patients) o None."""
+        client = self._get_redis()
+        if client is None:
+            return await self._load_handoff(phone, tenant_id)
+        try:
+            cached = await client.hgetall(self.key(tenant_id, phone, "state"))
+            if cached:
+                CONVERSATION_CACHE.labels(kind="handoff", result="hit").inc()
+                return self._decode_handoff(cached)
+
+            def write(pipe, key, state):
+                pipe.delete(key)
+                pipe.hset(key, mapping=self._encode_handoff(state))
+                pipe.expire(key, CONVERSATION_CACHE_TTL_SECONDS)
+
+            CONVERSATION_CACHE.labels(kind="handoff", result="miss").inc()
+            return await self._fill(
+                client,
+                tenant_id,
+                phone,
+                "state",
+                lambda: self._load_handoff(phone, tenant_id),
+                write,
+            )
+        except Exception as e:
+            CONVERSATION_CACHE.labels(kind="handoff", result="error").inc()
+            logger.warning(f"⚠️ Cache de derivación no disponible, se usa Postgres: {e}")
+            return await self._load_handoff(phone, tenant_id)
+
+    async def set_handoff(
+        self, tenant_id: int, phone: str, requested: bool, override_until: Optional[datetime]
+    ):
+        """Write-through después de actualizar patients (derivhumano, panel, expiración)."""
+        client = self._get_redis()
+        if client is None:
+            return
+        key = self.key(tenant_id, phone, "state")
+        try:
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.delete(key)
+                pipe.hset(
+                    key,
+                    mapping=self._encode_handoff(
+                        {
+                            "human_handoff_requested": requested,
+                            "human_override_until": override_until,
+                        }
+                    ),
+                )
+                pipe.expire(key, CONVERSATION_CACHE_TTL_SECONDS)
+                self._bump(pipe, tenant_id, phone)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo actualizar la derivación cacheada de {phone}: {e}")
+            await self.invalidate(tenant_id, phone)
+
+    async def invalidate(self, tenant_id: int, phone: str):
+        """Borra el estado cacheado; la próxima lectura recarga desde Postgres."""
+        client = self._get_redis()
+        if client is None:
+            return
+        try:
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.delete(self.key(tenant_id, phone, "msgs"), self.key(tenant_id, phone, "state"))
+                self._bump(pipe, tenant_id, phone)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"❌ No se pudo invalidar la cache de conversación de {phone}: {e}")
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": bool(REDIS_URL) and CONVERSATION_CACHE_ENABLED,
+            "max_messages": CONVERSATION_CACHE_MESSAGES,
+            "ttl_seconds": CONVERSATION_CACHE_TTL_SECONDS,
+        }
+
+
+# Instancia global para importar fácilmente
+conversation_cache = ConversationCache()
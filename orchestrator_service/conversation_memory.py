@@ -0,0 +1,293 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from conversation_cache import conversation_cache
+from db import db
+from llm_usage import UsageCollector, llm_usage_recorder
+from metrics import llm_metrics_callback
+
+logger = logging.getLogger("conversation_memory")
+
+HISTORY_SUMMARY_ENABLED = os.getenv("HISTORY_SUMMARY_ENABLED", "true").lower() == "true"
+# Mensajes crudos que siempre viajan al agente (últimos turnos)
+HISTORY_RECENT_MESSAGES = int(os.getenv("HISTORY_RECENT_MESSAGES", "8"))
+# Tope de mensajes sin resumir que se envían mientras el resumen todavía no los cubre
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "20"))
+# Cuántos mensajes fuera de la ventana disparan un nuevo resumen
+HISTORY_SUMMARY_BATCH = int(os.getenv("HISTORY_SUMMARY_BATCH", "10"))
+# Máximo de mensajes que se pliegan por llamada al LLM (backfill de conversaciones largas)
+HISTORY_SUMMARY_CHUNK = int(os.getenv("HISTORY_SUMMARY_CHUNK", "40"))
+# Presupuesto de tokens (resumen + historial) por turno
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "300"))
+HISTORY_SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "gpt-4o-mini")
+
+SUMMARY_PROMPT = """Sos el asistente interno de una clínica dental. Resumí la conversación entre un paciente y la secretaria virtual para que el agente pueda continuarla sin releer todo.
+Conservá SOLO datos útiles: nombre y datos que dio el paciente, tratamientos de interés, turnos agendados/cancelados/reprogramados (fecha, hora, profesional), síntomas o urgencias mencionadas, preferencias (días, horarios, profesional) y pendientes.
+Si hay un resumen previo, integralo y actualizalo (lo más nuevo manda). Escribí en español, en viñetas cortas, sin saludos ni relleno. Máximo 120 palabras."""
+
+# Recorte por mensaje al armar la entrada del resumen (respuestas largas del asistente)
+_MAX_CHARS_PER_MESSAGE = 800
+
+try:
+    import tiktoken
+
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # Sin red o sin tiktoken: se usa la estimación por caracteres
+    _ENCODING = None
+
+
+def estimate_tokens(text: str) -> int:
+    """Tokens aproximados de un texto (tiktoken si está disponible; si no ~4 caracteres por token)."""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return max(1, len(text) // 4)
+
+
+def fit_to_budget(
+    summary: Optional[str], messages: List[dict], budget: int, keep_min: int = 2
+) -> List[dict]:
+    """
+    Recorta desde los mensajes más viejos hasta que resumen + historial entren en `budget`.
+    Siempre conserva los últimos `keep_min` mensajes (contexto inmediato del turno).
+    """
+    used = estimate_tokens(summary or "")
+    kept: List[dict] = []
+    for msg in reversed(messages):
+        cost = estimate_tokens(msg["content"])
+        if len(kept) >= keep_min and used + cost > budget:
+            break
+        kept.append(msg)
+        used += cost
+    kept.reverse()
+    return kept
+
+
+class ConversationMemory:
+    """
+    Historial compacto por (tenant_id, teléfono): resumen acumulado + últimos turnos.
+    El resumen se actualiza en segundo plano después de responder, plegando los
+    mensajes que quedaron fuera de la ventana reciente (tabla conversation_summaries).
+    """
+
+    def __init__(self):
+        self._llm = None
+        self._in_flight: set = set()
+        self._tasks: set = set()
+        self.turns = 0
+        self.tokens_total = 0
+        self.summaries_written = 0
+        self.summary_errors = 0
+
+    def _get_llm(self):
+        if self._llm is None:
+            if os.getenv("AGENT_LLM_BACKEND", "openai").lower() == "fake":
+                from loadtest.fake_llm import FakeDentalChatModel
+
+                self._llm = FakeDentalChatModel(callbacks=[llm_metrics_callback])
+                return self._llm
+            from langchain_openai import ChatOpenAI
+
+            self._llm = ChatOpenAI(
+                model=HISTORY_SUMMARY_MODEL,
+                temperature=0,
+                max_tokens=HISTORY_SUMMARY_MAX_TOKENS,
+                openai_api_key=os.getenv("OPENAI_API_KEY", ""),
+                callbacks=[llm_metrics_callback],
+            )
+        return self._llm
+
+    async def _get_summary_row(self, phone: str, tenant_id: int):
+        return await db.pool.fetchrow(
+            """
+            SELECT summary, summarized_until_id, summarized_messages
+            FROM conversation_summaries
+            WHERE tenant_id = $1 AND from_number = $2
+            """,
+            tenant_id,
+            phone,
+        )
+
+    async def load_context(
+        self, phone: str, tenant_id: int
+    ) -> Tuple[Optional[str], List[dict]]:
+        """
+        Devuelve (resumen, mensajes) para el agente: el resumen cubre todo lo anterior a
+        summarized_until_id; después van los mensajes sin resumir dentro del presupuesto de tokens.
+        """
+        # Últimos mensajes desde el estado caliente en Redis (Postgres si no está cargado)
+        recent = await conversation_cache.recent_messages(phone, tenant_id)
+        if not HISTORY_SUMMARY_ENABLED:
+            return None, [
+                {"role": m["role"], "content": m["content"]}
+                for m in recent[-HISTORY_MAX_MESSAGES:]
+            ]
+
+        summary, until_id = None, 0
+        try:
+            row = await self._get_summary_row(phone, tenant_id)
+            if row:
+                summary, until_id = row["summary"], row["summarized_until_id"]
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo leer el resumen de {phone}: {e}")
+
+        # Equivale a "id > summarized_until_id ORDER BY id DESC LIMIT HISTORY_MAX_MESSAGES"
+        history = [
+            {"role": m["role"], "content": m["content"]}
+            for m in recent
+            if m["id"] > until_id
+        ][-HISTORY_MAX_MESSAGES:]
+        history = fit_to_budget(summary, history, HISTORY_TOKEN_BUDGET)
+
+        used = estimate_tokens(summary or "") + sum(
+            estimate_tokens(m["content"]) for m in history
+        )
+        self.turns += 1
+        self.tokens_total += used
+        logger.debug(
+            f"🧠 history tenant={tenant_id} phone={phone} summary={'sí' if summary else 'no'} "
+            f"messages={len(history)} tokens≈{used}"
+        )
+        return summary, history
+
+    async def maybe_summarize(self, phone: str, tenant_id: int) -> bool:
+        """
+        Pliega en el resumen los mensajes que quedaron fuera de la ventana reciente
+        (a partir de HISTORY_SUMMARY_BATCH). Devuelve True si actualizó el resumen.
+        """
+        if not HISTORY_SUMMARY_ENABLED:
+            return False
+        key = (tenant_id, phone)
+        if key in self._in_flight:
+            return False
+        self._in_flight.add(key)
+        try:
+            row = await self._get_summary_row(phone, tenant_id)
+            previous = row["summary"] if row else None
+            until_id = row["summarized_until_id"] if row else 0
+            folded_before = row["summarized_messages"] if row else 0
+
+            rows = await db.pool.fetch(
+                """
+                SELECT id, role, content FROM chat_messages
+                WHERE from_number = $1 AND tenant_id = $2 AND id > $3
+                ORDER BY id ASC LIMIT $4
+                """,
+                phone,
+                tenant_id,
+                until_id,
+                HISTORY_SUMMARY_CHUNK + HISTORY_RECENT_MESSAGES,
+            )
+            to_fold = rows[: max(len(rows) - HISTORY_RECENT_MESSAGES, 0)]
+            if len(to_fold) < HISTORY_SUMMARY_BATCH:
+                return False
+
+            summary = await self._summarize(previous, to_fold, tenant_id)
+            if not summary:
+                return False
+            await db.pool.execute(
+                """
+                INSERT INTO conversation_summaries
+                    (tenant_id, from_number, summary, summarized_until_id, summarized_messages, updated_at)
+                VALUES ($1, $2, $3, $4, $5, NOW())
+                ON CONFLICT (tenant_id, from_number) DO UPDATE SET
+                    summary = EXCLUDED.summary,
+                    summarized_until_id = EXCLUDED.summarized_until_id,
+                    summarized_messages = EXCLUDED.summarized_messages,
+                    updated_at = NOW()
+                """,
+                tenant_id,
+                phone,
+                summary,
+                to_fold[-1]["id"],
+                folded_before + len(to_fold),
+            )
+            self.summaries_written += 1
+            logger.info(
+                f"🧠 Resumen actualizado tenant={tenant_id} phone={phone} (+{len(to_fold)} mensajes)"
+            )
+            return True
+        except Exception as e:
+            self.summary_errors += 1
+            logger.error(f"❌ Error resumiendo conversación de {phone}: {e}")
+            return False
+        finally:
+            self._in_flight.discard(key)
+
+    async def _summarize(
+        self, previous: Optional[str], rows: List[Any], tenant_id: Optional[int] = None
+    ) -> str:
+        transcript = "\n".join(
+            f"{'Paciente' if r['role'] == 'user' else 'Asistente'}: {(r['content'] or '')[:_MAX_CHARS_PER_MESSAGE]}"
+            for r in rows
+        )
+        user_content = (
+            f"Resumen previo:\n{previous}\n\n" if previous else ""
+        ) + f"Mensajes nuevos:\n{transcript}"
+        usage = UsageCollector()
+        started = time.perf_counter()
+        result = await self._get_llm().ainvoke(
+            [SystemMessage(content=SUMMARY_PROMPT), HumanMessage(content=user_content)],
+            config={"callbacks": [usage]},
+        )
+        llm_usage_recorder.record(
+            tenant_id=tenant_id,
+            kind="summary",
+            model=usage.models[-1] if usage.models else HISTORY_SUMMARY_MODEL,
+            usage=usage,
+            wall_ms=int((time.perf_counter() - started) * 1000),
+        )
+        return (result.content or "").strip()
+
+    def schedule_summary(self, phone: str, tenant_id: int):
+        """Lanza maybe_summarize en segundo plano (no bloquea la respuesta al paciente)."""
+        if not HISTORY_SUMMARY_ENABLED:
+            return
+        task = asyncio.create_task(self.maybe_summarize(phone, tenant_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def backfill(self, tenant_id: Optional[int] = None) -> Dict[str, int]:
+        """Genera resúmenes para conversaciones existentes que superan la ventana reciente."""
+        params: List[Any] = [HISTORY_RECENT_MESSAGES + HISTORY_SUMMARY_BATCH]
+        tenant_filter = ""
+        if tenant_id is not None:
+            params.append(tenant_id)
+            tenant_filter = "AND tenant_id = $2"
+        conversations = await db.pool.fetch(
+            f"""
+            SELECT tenant_id, from_number FROM chat_messages
+            WHERE tenant_id IS NOT NULL {tenant_filter}
+            GROUP BY tenant_id, from_number
+            HAVING COUNT(*) >= $1
+            """,
+            *params,
+        )
+        done = 0
+        for conv in conversations:
+            # Conversaciones muy largas se pliegan en varios bloques de HISTORY_SUMMARY_CHUNK
+            while await self.maybe_summarize(conv["from_number"], conv["tenant_id"]):
+                done += 1
+        return {"conversations": len(conversations), "summaries_written": done}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "turns": self.turns,
+            "avg_context_tokens": round(self.tokens_total / self.turns, 1)
+            if self.turns
+            else 0.0,
+            "token_budget": HISTORY_TOKEN_BUDGET,
+            "summaries_written": self.summaries_written,
+            "summary_errors": self.summary_errors,
+        }
+
+
+# Instancia global para importar fácilmente
+conversation_memory = ConversationMemory()
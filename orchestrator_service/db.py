@@ -1,14 +1,95 @@
+import asyncio
 import asyncpg
+import hashlib
+import logging
 import os
 import json
-from typing import List, Tuple, Optional
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Tuple, Optional
+
+from metrics import (
+    DB_READ_ROUTES,
+    DB_REPLICA_LAG,
+    init_connection_metrics,
+    instrument_pool,
+)
+from query_stats import InstrumentedConnection
+from schema_capabilities import schema_capabilities
 
 POSTGRES_DSN = os.getenv("POSTGRES_DSN")
+# Pool asyncpg (defaults = los de la librería); repartir max_connections de Postgres entre réplicas/workers
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "10"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# Una conexión se recicla tras N consultas o N segundos sin uso
+DB_POOL_MAX_QUERIES = int(os.getenv("DB_POOL_MAX_QUERIES", "50000"))
+DB_POOL_MAX_INACTIVE_SECONDS = float(os.getenv("DB_POOL_MAX_INACTIVE_SECONDS", "300"))
+# Prepared statements cacheados por conexión (0 detrás de PgBouncer en modo transaction)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+# Timeout por consulta en segundos (0 = sin límite)
+DB_COMMAND_TIMEOUT_SECONDS = float(os.getenv("DB_COMMAND_TIMEOUT_SECONDS", "0"))
+# Réplica de lectura opcional para dashboards/analíticas (db.reader); vacío = todo al primario
+POSTGRES_REPLICA_DSN = os.getenv("POSTGRES_REPLICA_DSN", "")
+DB_REPLICA_POOL_MAX_SIZE = int(os.getenv("DB_REPLICA_POOL_MAX_SIZE", str(DB_POOL_MAX_SIZE)))
+# Con más retraso que esto las lecturas vuelven al primario
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "5"))
+DB_REPLICA_LAG_CHECK_SECONDS = float(os.getenv("DB_REPLICA_LAG_CHECK_SECONDS", "5"))
+# Tras escribir, las lecturas del mismo usuario van al primario durante esta ventana
+DB_READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "10"))
+# La ventana vive en Redis para que la vean todos los workers/réplicas (sin Redis: por proceso)
+REDIS_URL = os.getenv("REDIS_URL", "")
+# false: el esquema se migra antes del deploy (python migrate.py) y no al arrancar cada réplica
+SCHEMA_AUTO_MIGRATE = os.getenv("SCHEMA_AUTO_MIGRATE", "true").lower() == "true"
+# Parches que corren en cada arranque (idempotentes; no se registran en el ledger)
+SCHEMA_REPEATABLE_PATCHES = {"2"}
+# Parches que bloquean tablas grandes mientras copian (29: particionar chat_messages).
+# El arranque se detiene antes del primero pendiente; los aplica `python migrate.py`.
+SCHEMA_OFFLINE_PATCHES = {"29"}
+
+SCHEMA_MIGRATIONS_DDL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version TEXT PRIMARY KEY,
+    description TEXT,
+    checksum TEXT NOT NULL,
+    duration_ms INTEGER,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+"""
+
+# Identidad de quien hace el request (la fija el middleware de main.py): stickiness de lectura
+current_read_key: ContextVar[Optional[str]] = ContextVar("current_read_key", default=None)
+# True si quien hace el request escribió hace poco (resuelto una vez por request contra Redis)
+current_read_sticky: ContextVar[bool] = ContextVar("current_read_sticky", default=False)
+
+
+def _encode_json(value):
+    """Parámetros json/jsonb: dict/list se serializan; un str se asume JSON ya serializado."""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, default=str)
+
+
+async def init_connection(conn):
+    """
+    init= de asyncpg.create_pool: json/jsonb llegan como dict/list (working_hours, config,
+    medical_history...) y aceptan dict o str como parámetro; además cuenta las consultas.
+    """
+    for typename in ("json", "jsonb"):
+        await conn.set_type_codec(
+            typename, encoder=_encode_json, decoder=json.loads, schema="pg_catalog"
+        )
+    await init_connection_metrics(conn)
 
 
 class Database:
     def __init__(self):
         self.pool: Optional[asyncpg.Pool] = None
+        self.replica_pool: Optional[asyncpg.Pool] = None
+        # None = todavía sin medir o la réplica no responde: no se le envían lecturas
+        self.replica_lag: Optional[float] = None
+        self._recent_writes: Dict[str, float] = {}
+        self._lag_task: Optional[asyncio.Task] = None
+        self._redis = None
 
     async def connect(self):
         """Conecta al pool de PostgreSQL y ejecuta auto-migraciones."""
@@ -21,13 +102,192 @@ class Database:
             dsn = POSTGRES_DSN.replace("postgresql+asyncpg://", "postgresql://")
 
             try:
-                self.pool = await asyncpg.create_pool(dsn)
+                self.pool = await asyncpg.create_pool(
+                    dsn,
+                    min_size=min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+                    max_size=DB_POOL_MAX_SIZE,
+                    max_queries=DB_POOL_MAX_QUERIES,
+                    max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_SECONDS,
+                    statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                    command_timeout=DB_COMMAND_TIMEOUT_SECONDS or None,
+                    init=init_connection,
+                    # Fingerprint, tiempo y filas por consulta (query_stats.py)
+                    connection_class=InstrumentedConnection,
+                )
+                instrument_pool(self.pool)
             except Exception as e:
                 print(f"❌ ERROR: Failed to create database pool: {e}")
                 return
 
             # Auto-Migration: Ejecutar dentalogic_schema.sql si las tablas no existen
-            await self._run_auto_migrations()
+            # (SCHEMA_AUTO_MIGRATE=false → lo hace `python migrate.py` antes del deploy)
+            if SCHEMA_AUTO_MIGRATE:
+                await self._run_auto_migrations()
+            # Flags de columnas una sola vez (las rutas no consultan information_schema por request)
+            await schema_capabilities.refresh(self.pool)
+            if POSTGRES_REPLICA_DSN:
+                await self._connect_replica()
+
+    async def _connect_replica(self):
+        """Pool de la réplica (mismo init/instrumentación, sin migraciones). Si falla, todo va al primario."""
+        logger = logging.getLogger("db")
+        dsn = POSTGRES_REPLICA_DSN.replace("postgresql+asyncpg://", "postgresql://")
+        try:
+            self.replica_pool = await asyncpg.create_pool(
+                dsn,
+                min_size=min(DB_POOL_MIN_SIZE, DB_REPLICA_POOL_MAX_SIZE),
+                max_size=DB_REPLICA_POOL_MAX_SIZE,
+                max_queries=DB_POOL_MAX_QUERIES,
+                max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_SECONDS,
+                statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                command_timeout=DB_COMMAND_TIMEOUT_SECONDS or None,
+                init=init_connection,
+                connection_class=InstrumentedConnection,
+            )
+            instrument_pool(self.replica_pool, gauges=False)
+        except Exception as e:
+            logger.error(f"❌ Réplica de lectura no disponible, se usa solo el primario: {e}")
+            self.replica_pool = None
+            return
+        await self.check_replica_lag()
+        self._lag_task = asyncio.create_task(self._watch_replica_lag())
+        logger.info(f"📚 Réplica de lectura conectada (lag={self.replica_lag}s)")
+
+    async def check_replica_lag(self) -> Optional[float]:
+        """
+        Segundos de retraso de la réplica. Si ya reprodujo todo el WAL del primario el retraso es 0
+        (aunque no haya escrituras recientes); si no, la antigüedad de la última transacción aplicada.
+        """
+        try:
+            primary_lsn = await self.pool.fetchval("SELECT pg_current_wal_lsn()::text")
+            row = await self.replica_pool.fetchrow(
+                """
+                SELECT pg_is_in_recovery() AS in_recovery,
+                       COALESCE(pg_last_wal_replay_lsn() >= $1::pg_lsn, FALSE) AS caught_up,
+                       EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp())::float AS replay_age
+                """,
+                primary_lsn,
+            )
+            if not row["in_recovery"] or row["caught_up"]:
+                lag = 0.0
+            else:
+                lag = row["replay_age"] if row["replay_age"] is not None else float("inf")
+        except Exception as e:
+            logging.getLogger("db").warning(f"⚠️ No se pudo medir el retraso de la réplica: {e}")
+            lag = None
+        self.replica_lag = lag
+        DB_REPLICA_LAG.set(lag if lag is not None else -1)
+        return lag
+
+    async def _watch_replica_lag(self):
+        while True:
+            await asyncio.sleep(DB_REPLICA_LAG_CHECK_SECONDS)
+            await self.check_replica_lag()
+
+    def _get_redis(self):
+        if self._redis is None and REDIS_URL:
+            import redis.asyncio as aioredis
+
+            self._redis = aioredis.from_url(REDIS_URL, decode_responses=True)
+        return self._redis
+
+    @staticmethod
+    def _read_your_writes_key(key: str) -> str:
+        return f"ryw:{key}"
+
+    async def mark_write(self, key: Optional[str] = None):
+        """Abre la ventana de read-your-writes para `key` (por defecto, quien hace el request)."""
+        key = key or current_read_key.get()
+        if not key or DB_READ_YOUR_WRITES_SECONDS <= 0:
+            return
+        now = time.monotonic()
+        if len(self._recent_writes) > 10_000:
+            self._recent_writes = {k: t for k, t in self._recent_writes.items() if t > now}
+        self._recent_writes[key] = now + DB_READ_YOUR_WRITES_SECONDS
+        client = self._get_redis()
+        if client is None:
+            return
+        try:
+            await client.set(
+                self._read_your_writes_key(key), "1", px=int(DB_READ_YOUR_WRITES_SECONDS * 1000)
+            )
+        except Exception as e:
+            logging.getLogger("db").warning(
+                f"⚠️ No se pudo registrar la escritura reciente en Redis: {e}"
+            )
+
+    async def wrote_recently(self, key: Optional[str]) -> bool:
+        """¿`key` escribió dentro de la ventana, en este o en cualquier otro worker?"""
+        if not key or DB_READ_YOUR_WRITES_SECONDS <= 0:
+            return False
+        if self._recent_writes.get(key, 0) > time.monotonic():
+            return True
+        client = self._get_redis()
+        if client is None:
+            return False
+        try:
+            return bool(await client.exists(self._read_your_writes_key(key)))
+        except Exception as e:
+            # Sin poder confirmarlo, lo seguro es leer del primario
+            logging.getLogger("db").warning(
+                f"⚠️ Redis no respondió la ventana de read-your-writes: {e}"
+            )
+            return True
+
+    def reader(self, key: Optional[str] = None) -> asyncpg.Pool:
+        """
+        Pool para lecturas que toleran unos segundos de retraso (dashboards, analíticas, listados).
+        Va a la réplica salvo que no haya, esté atrasada o quien lee haya escrito hace poco.
+        """
+        if self.replica_pool is None:
+            return self.pool
+        if self.replica_lag is None or self.replica_lag > DB_REPLICA_MAX_LAG_SECONDS:
+            DB_READ_ROUTES.labels(target="primary", reason="lag").inc()
+            return self.pool
+        if key is None:
+            key, sticky = current_read_key.get(), current_read_sticky.get()
+        else:
+            sticky = False
+        if sticky or (key and self._recent_writes.get(key, 0) > time.monotonic()):
+            DB_READ_ROUTES.labels(target="primary", reason="read_your_writes").inc()
+            return self.pool
+        DB_READ_ROUTES.labels(target="replica", reason="ok").inc()
+        return self.replica_pool
+
+    async def migrate(self, logger=None, offline: bool = False) -> dict:
+        """
+        Foundation (si la base está vacía) + parches pendientes del ledger schema_migrations.
+        Propaga los errores; lo usan el arranque (_run_auto_migrations) y migrate.py.
+        offline=False (arranque) difiere SCHEMA_OFFLINE_PATCHES salvo en una instalación nueva,
+        donde las tablas están vacías y no hay nada que copiar.
+        """
+        import logging
+
+        logger = logger or logging.getLogger("db")
+        started = time.perf_counter()
+
+        # 1. Auditoría de Salud: ¿Existe la base mínima?
+        async with self.pool.acquire() as conn:
+            schema_exists = await conn.fetchval("""
+                SELECT EXISTS (
+                    SELECT FROM information_schema.tables 
+                    WHERE table_name = 'tenants'
+                )
+            """)
+
+        # 2. Aplicar Base (Foundation) si es un Fresh Install
+        if not schema_exists:
+            logger.warning("⚠️ Base de datos vacía, aplicando Foundation...")
+            await self._apply_foundation(logger)
+
+        # 3. Evolución Continua (Pipeline de Cirugía): solo los parches pendientes
+        result = await self._run_evolution_pipeline(
+            logger, allow_offline=offline or not schema_exists
+        )
+        if result["applied"]:
+            await schema_capabilities.refresh(self.pool)
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        return result
 
     async def _run_auto_migrations(self):
         """
@@ -39,27 +299,16 @@ class Database:
         logger = logging.getLogger("db")
 
         try:
-            # 1. Auditoría de Salud: ¿Existe la base mínima?
-            async with self.pool.acquire() as conn:
-                schema_exists = await conn.fetchval("""
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.tables 
-                        WHERE table_name = 'tenants'
-                    )
-                """)
-
-            # 2. Aplicar Base (Foundation) si es un Fresh Install
-            if not schema_exists:
-                logger.warning("⚠️ Base de datos vacía, aplicando Foundation...")
-                await self._apply_foundation(logger)
-
-            # 3. Evolución Continua (Pipeline de Cirugía)
-            # Aquí agregamos parches específicos que deben correr siempre de forma segura
-            await self._run_evolution_pipeline(logger)
-
+            result = await self.migrate(logger)
             logger.info(
-                "✅ Base de datos verificada y actualizada (Maintenance Robot OK)"
+                "✅ Base de datos verificada y actualizada (Maintenance Robot OK): "
+                f"{result['applied']}/{result['total']} parches aplicados en {result['seconds'] * 1000:.0f}ms"
             )
+            if result["deferred"]:
+                logger.warning(
+                    f"⏸️ Parches pendientes que requieren ventana de mantenimiento: {result['deferred']}. "
+                    "Correr `python migrate.py` (bloquea tablas mientras copia)."
+                )
 
         except Exception as e:
             import traceback
@@ -110,9 +359,21 @@ class Database:
                 statements.append(leftover)
 
         async with self.pool.acquire() as conn:
-            async with conn.transaction():
-                for i, stmt in enumerate(statements):
-                    await conn.execute(stmt)
+            # Mismo lock que el ledger: con varias réplicas en una base vacía aplica una sola
+            await conn.execute(
+                "SELECT pg_advisory_lock(hashtext('dentalogic_schema_migrations'))"
+            )
+            try:
+                if await conn.fetchval("SELECT to_regclass('public.tenants') IS NOT NULL"):
+                    logger.info("⏭️ Foundation ya aplicada por otra réplica")
+                    return
+                async with conn.transaction():
+                    for i, stmt in enumerate(statements):
+                        await conn.execute(stmt)
+            finally:
+                await conn.execute(
+                    "SELECT pg_advisory_unlock(hashtext('dentalogic_schema_migrations'))"
+                )
         logger.info(f"✅ Foundation aplicada ({len(statements)} sentencias)")
 
     async def _seed_demo_data(self, conn, logger):
@@ -167,14 +428,17 @@ class Database:
                 # Continuar con las siguientes (seed es idempotente)
         logger.info("✅ Seed demo ejecutado (los conflictos se ignoraron)")
 
-    async def _run_evolution_pipeline(self, logger):
+    async def _run_evolution_pipeline(self, logger, allow_offline: bool = True):
         """
         Pipeline de Cirugía: Parches acumulativos e independientes.
-        Agrega aquí bloques DO $$ que aseguren la evolución del esquema.
+        Agrega al final (versión, descripción, SQL) con bloques DO $$ idempotentes; un parche
+        ya aplicado no se edita (el checksum lo delata): los cambios van en un parche nuevo.
         """
-        patches = [
-            # Parche 1: Asegurar tabla 'users' y columna 'user_id' en 'professionals'
-            """
+        patches: List[Tuple[str, str, str]] = [
+            (
+                "1",
+                "Asegurar tabla 'users' y columna 'user_id' en 'professionals'",
+                """
             DO $$ 
             BEGIN 
                 -- Asegurar columna user_id en professionals
@@ -183,8 +447,11 @@ class Database:
                 END IF;
             END $$;
             """,
-            # Parche 2: Auto-activación del primer CEO (Protocolo Omega Prime)
-            """
+            ),
+            (
+                "2",
+                "Auto-activación del primer CEO (Protocolo Omega Prime)",
+                """
             DO $$ 
             BEGIN 
                 -- Si existe un usuario CEO en estado pending, lo activamos
@@ -196,9 +463,11 @@ class Database:
                 WHERE email IN (SELECT email FROM users WHERE role = 'ceo' AND status = 'active');
             END $$;
             """,
-            # Agrega más parches aquí en el futuro...
-            # Parche 3: Permitir DNI y Apellido nulos para 'guests' (Chat Users)
-            """
+            ),
+            (
+                "3",
+                "Permitir DNI y Apellido nulos para 'guests' (Chat Users)",
+                """
             DO $$ 
             BEGIN 
                 -- Hacer dni nullable
@@ -212,8 +481,11 @@ class Database:
                 WHEN others THEN null; -- Ignorar si ya se aplicó o falla
             END $$;
             """,
-            # Parche 4: Asegurar constraint unique (tenant_id, phone_number) en patients
-            """
+            ),
+            (
+                "4",
+                "Asegurar constraint unique (tenant_id, phone_number) en patients",
+                """
             DO $$ 
             BEGIN 
                 IF NOT EXISTS (
@@ -223,8 +495,11 @@ class Database:
                 END IF;
             END $$;
             """,
-            # Parche 5: Agregar urgencia a la tabla patients para tracking de leads
-            """
+            ),
+            (
+                "5",
+                "Agregar urgencia a la tabla patients para tracking de leads",
+                """
             DO $$ 
             BEGIN 
                 IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='patients' AND column_name='urgency_level') THEN
@@ -235,8 +510,11 @@ class Database:
                 END IF;
             END $$;
             """,
-            # Parche 6: Evolucionar treatment_plan a JSONB en clinical_records
-            """
+            ),
+            (
+                "6",
+                "Evolucionar treatment_plan a JSONB en clinical_records",
+                """
             DO $$ 
             BEGIN 
                 -- Si la columna existe y es de tipo text/varchar, la convertimos a JSONB
@@ -254,8 +532,11 @@ class Database:
                 END IF;
             END $$;
             """,
-            # Parche 7: Asegurar nombres en tabla users para gestión unificada
-            """
+            ),
+            (
+                "7",
+                "Asegurar nombres en tabla users para gestión unificada",
+                """
             DO $$ 
             BEGIN 
                 IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='users' AND column_name='first_name') THEN
@@ -272,8 +553,11 @@ class Database:
             FROM professionals p
             WHERE u.id = p.user_id AND u.first_name IS NULL;
             """,
-            # Parche 8: Agregar google_calendar_id a la tabla de profesionales
-            """
+            ),
+            (
+                "8",
+                "Agregar google_calendar_id a la tabla de profesionales",
+                """
             DO $$ 
             BEGIN 
                 IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='professionals' AND column_name='google_calendar_id') THEN
@@ -281,8 +565,11 @@ class Database:
                 END IF;
             END $$;
             """,
-            # Parche 9: Agregar working_hours a la tabla profesionales
-            """
+            ),
+            (
+                "9",
+                "Agregar working_hours a la tabla profesionales",
+                """
             DO $$ 
             BEGIN 
                 IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='professionals' AND column_name='working_hours') THEN
@@ -290,8 +577,11 @@ class Database:
                 END IF;
             END $$;
             """,
-            # Parche 10: Inicializar working_hours para profesionales existentes
-            """
+            ),
+            (
+                "10",
+                "Inicializar working_hours para profesionales existentes",
+                """
             DO $$ 
             BEGIN 
                 UPDATE professionals 
@@ -307,8 +597,11 @@ class Database:
                 WHERE working_hours = '{}'::jsonb OR working_hours IS NULL;
             END $$;
             """,
-            # Parche 11: Columna config (JSONB) en tenants para calendar_provider y demás opciones
-            """
+            ),
+            (
+                "11",
+                "Columna config (JSONB) en tenants para calendar_provider y demás opciones",
+                """
             DO $$ 
             BEGIN 
                 IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='tenants' AND column_name='config') THEN
@@ -319,8 +612,11 @@ class Database:
                 WHERE config IS NULL OR config->>'calendar_provider' IS NULL;
             END $$;
             """,
-            # Parche 12: tenant_id en professionals (idempotente, no rompe datos existentes)
-            """
+            ),
+            (
+                "12",
+                "tenant_id en professionals (idempotente, no rompe datos existentes)",
+                """
             DO $$
             BEGIN
                 IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'professionals' AND column_name = 'tenant_id') THEN
@@ -333,8 +629,11 @@ class Database:
             END $$;
             CREATE INDEX IF NOT EXISTS idx_professionals_tenant ON professionals(tenant_id);
             """,
-            # Parche 12b: registration_id en professionals (matrícula; BD puede tener license_number)
-            """
+            ),
+            (
+                "12b",
+                "registration_id en professionals (matrícula; BD puede tener license_number)",
+                """
             DO $$
             BEGIN
                 IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'professionals' AND column_name = 'registration_id') THEN
@@ -345,8 +644,11 @@ class Database:
                 END IF;
             END $$;
             """,
-            # Parche 12c: updated_at en professionals (algunos esquemas antiguos no lo tienen)
-            """
+            ),
+            (
+                "12c",
+                "updated_at en professionals (algunos esquemas antiguos no lo tienen)",
+                """
             DO $$
             BEGIN
                 IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'professionals' AND column_name = 'updated_at') THEN
@@ -355,8 +657,11 @@ class Database:
                 END IF;
             END $$;
             """,
-            # Parche 12d: phone_number en professionals (esquemas antiguos pueden no tenerla)
-            """
+            ),
+            (
+                "12d",
+                "phone_number en professionals (esquemas antiguos pueden no tenerla)",
+                """
             DO $$
             BEGIN
                 IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'professionals' AND column_name = 'phone_number') THEN
@@ -364,8 +669,11 @@ class Database:
                 END IF;
             END $$;
             """,
-            # Parche 12e: specialty en professionals (esquemas antiguos pueden no tenerla)
-            """
+            ),
+            (
+                "12e",
+                "specialty en professionals (esquemas antiguos pueden no tenerla)",
+                """
             DO $$
             BEGIN
                 IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'professionals' AND column_name = 'specialty') THEN
@@ -373,8 +681,11 @@ class Database:
                 END IF;
             END $$;
             """,
-            # Parche 13: tenant_id, source y google_calendar_event_id en appointments (idempotente)
-            """
+            ),
+            (
+                "13",
+                "tenant_id, source y google_calendar_event_id en appointments (idempotente)",
+                """
             DO $$
             BEGIN
                 IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'appointments' AND column_name = 'tenant_id') THEN
@@ -394,8 +705,11 @@ class Database:
             CREATE INDEX IF NOT EXISTS idx_appointments_tenant ON appointments(tenant_id);
             CREATE INDEX IF NOT EXISTS idx_appointments_source ON appointments(source);
             """,
-            # Parche 14: tenant_id en treatment_types (idempotente)
-            """
+            ),
+            (
+                "14",
+                "tenant_id en treatment_types (idempotente)",
+                """
             DO $$
             BEGIN
                 IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'treatment_types' AND column_name = 'tenant_id') THEN
@@ -408,8 +722,11 @@ class Database:
             END $$;
             CREATE INDEX IF NOT EXISTS idx_treatment_types_tenant ON treatment_types(tenant_id);
             """,
-            # Parche 15: tenant_id en chat_messages (conversaciones por clínica, buffer/override independientes)
-            """
+            ),
+            (
+                "15",
+                "tenant_id en chat_messages (conversaciones por clínica, buffer/override independientes)",
+                """
             DO $$
             BEGIN
                 IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'chat_messages' AND column_name = 'tenant_id') THEN
@@ -423,8 +740,11 @@ class Database:
             CREATE INDEX IF NOT EXISTS idx_chat_messages_tenant_id ON chat_messages(tenant_id);
             CREATE INDEX IF NOT EXISTS idx_chat_messages_tenant_from_created ON chat_messages(tenant_id, from_number, created_at DESC);
             """,
-            # Parche 16: Tablas de tracking de leads demo (SuperAdmin + Bridge CRM VENTAS)
-            """
+            ),
+            (
+                "16",
+                "Tablas de tracking de leads demo (SuperAdmin + Bridge CRM VENTAS)",
+                """
             CREATE TABLE IF NOT EXISTS demo_leads (
                 id SERIAL PRIMARY KEY,
                 phone_number VARCHAR(50) UNIQUE NOT NULL,
@@ -457,8 +777,11 @@ class Database:
             CREATE INDEX IF NOT EXISTS idx_demo_events_lead ON demo_events(lead_id);
             CREATE INDEX IF NOT EXISTS idx_demo_events_type ON demo_events(event_type);
             """,
-            # Parche 17: Tabla patient_documents (documentos del paciente)
-            """
+            ),
+            (
+                "17",
+                "Tabla patient_documents (documentos del paciente)",
+                """
             DO $$
             BEGIN
                 -- Crear tabla patient_documents si no existe
@@ -490,8 +813,11 @@ class Database:
                 WHEN others THEN NULL; -- Ignorar errores (tabla ya existe, columnas ya existen, etc.)
             END $$;
             """,
-            # Parche 18: Tabla patient_digital_records (registros digitales)
-            """
+            ),
+            (
+                "18",
+                "Tabla patient_digital_records (registros digitales)",
+                """
             DO $$
             BEGIN
                 -- Crear tabla patient_digital_records si no existe
@@ -533,8 +859,11 @@ class Database:
                 WHEN others THEN NULL; -- Ignorar errores (tabla ya existe, columnas ya existen, etc.)
             END $$;
             """,
-            # Parche 19: Columnas faltantes en tabla patients (anamnesis_token, guardian_phone, city, instagram_psid, facebook_psid)
-            """
+            ),
+            (
+                "19",
+                "Columnas faltantes en tabla patients (anamnesis_token, guardian_phone, city, instagram_psid, facebook_psid)",
+                """
             DO $$
             BEGIN
                 -- Añadir anamnesis_token si no existe
@@ -573,8 +902,11 @@ class Database:
                 END IF;
             END $$;
             """,
-            # Parche 20: Tabla tenant_holidays (feriados y cierres por clínica)
-            """
+            ),
+            (
+                "20",
+                "Tabla tenant_holidays (feriados y cierres por clínica)",
+                """
             DO $$
             BEGIN
                 -- Crear tabla tenant_holidays si no existe
@@ -597,8 +929,11 @@ class Database:
                 WHEN others THEN NULL; -- Ignorar errores (tabla ya existe, columnas ya existen, etc.)
             END $$;
             """,
-            # Parche 21: Tablas de billing/treatment_plans (igual a ClinicForge)
-            """
+            ),
+            (
+                "21",
+                "Tablas de billing/treatment_plans (igual a ClinicForge)",
+                """
             DO $$
             BEGIN
                 -- 1. Crear tabla treatment_plans si no existe
@@ -671,8 +1006,11 @@ class Database:
                 WHEN others THEN NULL;
             END $$;
             """,
-            # Parche 22: Columnas faltantes en patients (igual a ClinicForge)
-            """
+            ),
+            (
+                "22",
+                "Columnas faltantes en patients (igual a ClinicForge)",
+                """
             DO $$
             BEGIN
                 -- insurance_provider
@@ -714,21 +1052,310 @@ class Database:
                 END IF;
             END $$;
             """,
+            ),
+            (
+                "23",
+                "Resúmenes acumulados de conversación (compactación del historial del agente)",
+                """
+            CREATE TABLE IF NOT EXISTS conversation_summaries (
+                tenant_id INTEGER NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+                from_number TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                summarized_until_id BIGINT NOT NULL DEFAULT 0,
+                summarized_messages INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMPTZ DEFAULT NOW(),
+                PRIMARY KEY (tenant_id, from_number)
+            );
+            """,
+            ),
+            (
+                "24",
+                "Índice por received_at para la retención de inbound_messages",
+                """
+            CREATE INDEX IF NOT EXISTS idx_inbound_messages_received_at ON inbound_messages (received_at);
+            """,
+            ),
+            (
+                "25",
+                "Contabilidad de tokens y costo del LLM por clínica (una fila por invocación)",
+                """
+            CREATE TABLE IF NOT EXISTS llm_usage (
+                id BIGSERIAL PRIMARY KEY,
+                tenant_id INTEGER REFERENCES tenants(id) ON DELETE CASCADE,
+                kind TEXT NOT NULL DEFAULT 'agent',
+                route TEXT,
+                model TEXT NOT NULL,
+                prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                completion_tokens INTEGER NOT NULL DEFAULT 0,
+                cached_tokens INTEGER NOT NULL DEFAULT 0,
+                llm_calls INTEGER NOT NULL DEFAULT 0,
+                tool_calls INTEGER NOT NULL DEFAULT 0,
+                wall_ms INTEGER NOT NULL DEFAULT 0,
+                cost_usd NUMERIC(12, 6) NOT NULL DEFAULT 0,
+                correlation_id TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            CREATE INDEX IF NOT EXISTS idx_llm_usage_tenant_created ON llm_usage (tenant_id, created_at);
+            """,
+            ),
+            (
+                "26",
+                "Índice parcial para el barrido de human_override_until vencidos",
+                """
+            CREATE INDEX IF NOT EXISTS idx_patients_human_override_until
+                ON patients (human_override_until) WHERE human_override_until IS NOT NULL;
+            """,
+            ),
+            (
+                "27",
+                "Índices compuestos para solapamiento de turnos, agenda y bloques de Google Calendar",
+                """
+            -- check_availability / book_appointment / reprogramación: solo turnos activos, así el
+            -- rango (appointment_datetime < fin) no recorre el historial completado/cancelado
+            CREATE INDEX IF NOT EXISTS idx_appointments_active_overlap
+                ON appointments (tenant_id, professional_id, appointment_datetime)
+                WHERE status IN ('scheduled', 'confirmed');
+            -- Agenda por rango de fechas y analíticas por clínica
+            CREATE INDEX IF NOT EXISTS idx_appointments_tenant_datetime
+                ON appointments (tenant_id, appointment_datetime);
+            -- Último / próximo turno del paciente (ficha y contexto del chat)
+            CREATE INDEX IF NOT EXISTS idx_appointments_tenant_patient_datetime
+                ON appointments (tenant_id, patient_id, appointment_datetime);
+            -- Bloques por profesional y bloques de toda la clínica (professional_id IS NULL)
+            CREATE INDEX IF NOT EXISTS idx_gcalendar_blocks_tenant_prof_start
+                ON google_calendar_blocks (tenant_id, professional_id, start_datetime);
+            CREATE INDEX IF NOT EXISTS idx_gcalendar_blocks_tenant_clinic_start
+                ON google_calendar_blocks (tenant_id, start_datetime) WHERE professional_id IS NULL;
+            -- Prefijos de los compuestos: solo sumaban costo de escritura
+            DROP INDEX IF EXISTS idx_appointments_tenant;
+            DROP INDEX IF EXISTS idx_gcalendar_blocks_tenant;
+            """,
+            ),
+            (
+                "28",
+                "Índices trigram para la búsqueda de pacientes (nombre, teléfono, DNI con ILIKE)",
+                """
+            DO $$
+            BEGIN
+                BEGIN
+                    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+                EXCEPTION WHEN insufficient_privilege OR feature_not_supported OR undefined_file THEN
+                    RAISE NOTICE 'pg_trgm no disponible: la búsqueda de pacientes sigue sin índice trigram';
+                END;
+                IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+                    CREATE INDEX IF NOT EXISTS idx_patients_first_name_trgm
+                        ON patients USING gin (first_name gin_trgm_ops);
+                    CREATE INDEX IF NOT EXISTS idx_patients_last_name_trgm
+                        ON patients USING gin (last_name gin_trgm_ops);
+                    CREATE INDEX IF NOT EXISTS idx_patients_phone_trgm
+                        ON patients USING gin (phone_number gin_trgm_ops);
+                    CREATE INDEX IF NOT EXISTS idx_patients_dni_trgm
+                        ON patients USING gin (dni gin_trgm_ops);
+                END IF;
+            END $$;
+            """,
+            ),
+            (
+                "29",
+                "chat_messages particionada por mes (created_at) con partición default de respaldo",
+                """
+            -- Crea las particiones mensuales desde from_month hasta months_ahead meses adelante.
+            -- Si la default recibió filas de un mes (mantenimiento atrasado) se mueven antes de adjuntar.
+            CREATE OR REPLACE FUNCTION ensure_chat_message_partitions(months_ahead INTEGER, from_month DATE DEFAULT NULL)
+            RETURNS INTEGER LANGUAGE plpgsql AS $fn$
+            DECLARE
+                month_start DATE := date_trunc('month', COALESCE(from_month, CURRENT_DATE))::date;
+                last_month DATE := (date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead))::date;
+                month_end DATE;
+                part TEXT;
+                created INTEGER := 0;
+            BEGIN
+                WHILE month_start <= last_month LOOP
+                    month_end := (month_start + interval '1 month')::date;
+                    part := 'chat_messages_p' || to_char(month_start, 'YYYYMM');
+                    IF to_regclass(part) IS NULL THEN
+                        EXECUTE format('CREATE TABLE %I (LIKE chat_messages INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', part);
+                        IF to_regclass('chat_messages_default') IS NOT NULL THEN
+                            EXECUTE format(
+                                'WITH moved AS (DELETE FROM chat_messages_default WHERE created_at >= %L AND created_at < %L RETURNING *) '
+                                'INSERT INTO %I SELECT * FROM moved',
+                                month_start, month_end, part
+                            );
+                        END IF;
+                        EXECUTE format(
+                            'ALTER TABLE chat_messages ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                            part, month_start, month_end
+                        );
+                        created := created + 1;
+                    END IF;
+                    month_start := month_end;
+                END LOOP;
+                RETURN created;
+            END
+            $fn$;
+
+            -- Conversión única: la tabla existente se copia a particiones mensuales (correr en ventana de
+            -- mantenimiento con `python migrate.py` si chat_messages es grande: bloquea la tabla mientras copia)
+            DO $$
+            DECLARE
+                first_month DATE;
+            BEGIN
+                IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'public.chat_messages'::regclass) THEN
+                    RETURN;
+                END IF;
+                ALTER TABLE chat_messages RENAME TO chat_messages_unpartitioned;
+                ALTER TABLE chat_messages_unpartitioned RENAME CONSTRAINT chat_messages_pkey TO chat_messages_unpartitioned_pkey;
+                UPDATE chat_messages_unpartitioned SET created_at = NOW() WHERE created_at IS NULL;
+
+                CREATE TABLE chat_messages (LIKE chat_messages_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+                    PARTITION BY RANGE (created_at);
+                ALTER TABLE chat_messages ALTER COLUMN created_at SET NOT NULL;
+                -- La PK de una tabla particionada debe incluir la clave; id sigue siendo único por la secuencia
+                ALTER TABLE chat_messages ADD PRIMARY KEY (id, created_at);
+                ALTER SEQUENCE chat_messages_id_seq OWNED BY chat_messages.id;
+                CREATE TABLE chat_messages_default PARTITION OF chat_messages DEFAULT;
+
+                SELECT date_trunc('month', MIN(created_at))::date INTO first_month FROM chat_messages_unpartitioned;
+                PERFORM ensure_chat_message_partitions(3, first_month);
+                INSERT INTO chat_messages SELECT * FROM chat_messages_unpartitioned;
+                DROP TABLE chat_messages_unpartitioned;
+
+                IF EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema = 'public' AND table_name = 'chat_messages' AND column_name = 'tenant_id') THEN
+                    ALTER TABLE chat_messages ADD CONSTRAINT fk_chat_messages_tenant FOREIGN KEY (tenant_id) REFERENCES tenants(id) ON DELETE CASCADE;
+                END IF;
+            END $$;
+            CREATE INDEX IF NOT EXISTS idx_chat_messages_from_number_created_at ON chat_messages (from_number, created_at DESC);
+            CREATE INDEX IF NOT EXISTS idx_chat_messages_tenant_from_created ON chat_messages (tenant_id, from_number, created_at DESC);
+            """,
+            ),
+            (
+                "30",
+                "Índices con desempate por id para keyset pagination (mensajes, pacientes, agenda)",
+                """
+            CREATE INDEX IF NOT EXISTS idx_chat_messages_tenant_from_created_id
+                ON chat_messages (tenant_id, from_number, created_at DESC, id DESC);
+            DROP INDEX IF EXISTS idx_chat_messages_tenant_from_created;
+            CREATE INDEX IF NOT EXISTS idx_patients_tenant_created_id
+                ON patients (tenant_id, created_at DESC, id DESC);
+            CREATE INDEX IF NOT EXISTS idx_appointments_tenant_datetime_id
+                ON appointments (tenant_id, appointment_datetime, id);
+            DROP INDEX IF EXISTS idx_appointments_tenant_datetime;
+            """,
+            ),
         ]
 
+        return await self._apply_patches(patches, logger, allow_offline)
+
+    @staticmethod
+    def _patch_checksum(sql: str) -> str:
+        """sha256 del SQL normalizado (sin espacios de indentación ni líneas vacías)."""
+        normalized = "\n".join(
+            line.strip() for line in sql.strip().splitlines() if line.strip()
+        )
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    async def _applied_patches(conn) -> Optional[dict]:
+        """{version: checksum} del ledger, o None si schema_migrations todavía no existe."""
+        try:
+            rows = await conn.fetch("SELECT version, checksum FROM schema_migrations")
+        except asyncpg.exceptions.UndefinedTableError:
+            return None
+        return {r["version"]: r["checksum"] for r in rows}
+
+    async def _apply_patches(
+        self, patches: List[Tuple[str, str, str]], logger, allow_offline: bool = True
+    ) -> dict:
+        """
+        Ledger schema_migrations: cada parche corre una sola vez (en su propia transacción) y
+        queda registrado con su checksum. Si todo está aplicado alcanza con una consulta; si no,
+        un advisory lock hace que una sola réplica aplique y las demás esperen y salteen.
+        Los parches de SCHEMA_REPEATABLE_PATCHES corren en cada arranque (idempotentes).
+        Sin allow_offline se corta antes del primer SCHEMA_OFFLINE_PATCHES pendiente (los
+        siguientes también esperan, para no aplicarlos fuera de orden).
+        """
+        started = time.perf_counter()
+        applied_now = 0
+        deferred: List[str] = []
         async with self.pool.acquire() as conn:
-            async with conn.transaction():
-                for i, patch in enumerate(patches):
-                    try:
-                        await conn.execute(patch)
-                    except Exception as e:
-                        logger.error(
-                            f"❌ Error aplicando parche evolutivo {i + 1}: {e}"
-                        )
-                        # En evolución, a veces es mejor fallar rápido para no corromper
-                        raise e
+            applied = await self._applied_patches(conn)
+            pending = [
+                p for p in patches
+                if p[0] not in SCHEMA_REPEATABLE_PATCHES and (applied is None or p[0] not in applied)
+            ]
+            if not allow_offline:
+                cut = next(
+                    (i for i, p in enumerate(pending) if p[0] in SCHEMA_OFFLINE_PATCHES), None
+                )
+                if cut is not None:
+                    deferred = [p[0] for p in pending[cut:]]
+                    pending = pending[:cut]
+            if pending:
+                await conn.execute(
+                    "SELECT pg_advisory_lock(hashtext('dentalogic_schema_migrations'))"
+                )
+                try:
+                    await conn.execute(SCHEMA_MIGRATIONS_DDL)
+                    # Otra réplica pudo haberlos aplicado mientras esperábamos el lock
+                    applied = await self._applied_patches(conn) or {}
+                    for version, description, sql in pending:
+                        if version in applied:
+                            continue
+                        patch_started = time.perf_counter()
+                        try:
+                            async with conn.transaction():
+                                await conn.execute(sql)
+                                await conn.execute(
+                                    """
+                                    INSERT INTO schema_migrations (version, description, checksum, duration_ms)
+                                    VALUES ($1, $2, $3, $4)
+                                    """,
+                                    version,
+                                    description,
+                                    self._patch_checksum(sql),
+                                    int((time.perf_counter() - patch_started) * 1000),
+                                )
+                        except Exception as e:
+                            logger.error(f"❌ Error aplicando parche evolutivo {version}: {e}")
+                            # En evolución, a veces es mejor fallar rápido para no corromper
+                            raise e
+                        applied_now += 1
+                        logger.info(f"🧬 Parche {version} aplicado: {description}")
+                finally:
+                    await conn.execute(
+                        "SELECT pg_advisory_unlock(hashtext('dentalogic_schema_migrations'))"
+                    )
+
+            for version, description, sql in patches:
+                if version in SCHEMA_REPEATABLE_PATCHES:
+                    await conn.execute(sql)
+                elif applied and version in applied and applied[version] != self._patch_checksum(sql):
+                    logger.warning(
+                        f"⚠️ El parche {version} cambió después de aplicarse; no se reaplica "
+                        "(los cambios van en un parche nuevo)"
+                    )
+
+        return {
+            "applied": applied_now,
+            "total": len(patches),
+            "deferred": deferred,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
 
     async def disconnect(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            try:
+                await self._lag_task
+            except asyncio.CancelledError:
+                pass
+            self._lag_task = None
+        if self.replica_pool:
+            await self.replica_pool.close()
+            self.replica_pool = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
         if self.pool:
             await self.pool.close()
 
@@ -760,6 +1387,130 @@ class Database:
             )
             return result is not None
 
+    async def insert_inbound_batch(self, records: List[dict]) -> None:
+        """Registro durable en lote de mensajes ya deduplicados en Redis (ON CONFLICT ignora repetidos)."""
+        if not records:
+            return
+        query = """
+        INSERT INTO inbound_messages (provider, provider_message_id, event_id, from_number, payload, status, correlation_id, received_at)
+        VALUES ($1, $2, $3, $4, $5, 'received', $6, $7)
+        ON CONFLICT (provider, provider_message_id) DO NOTHING
+        """
+        async with self.pool.acquire() as conn:
+            await conn.executemany(
+                query,
+                [
+                    (
+                        r["provider"],
+                        r["provider_message_id"],
+                        r["event_id"],
+                        r["from_number"],
+                        json.dumps(r["payload"]),
+                        r["correlation_id"],
+                        r["received_at"],
+                    )
+                    for r in records
+                ],
+            )
+
+    async def prune_inbound_messages(
+        self, retention_days: int, batch_size: int = 5000
+    ) -> Optional[int]:
+        """
+        Borra inbound_messages más viejos que `retention_days` en lotes (sin bloquear la tabla).
+        Devuelve las filas borradas, o None si otro proceso ya está corriendo la limpieza.
+        """
+        deleted = 0
+        async with self.pool.acquire() as conn:
+            if not await conn.fetchval(
+                "SELECT pg_try_advisory_lock(hashtext('inbound_messages_retention'))"
+            ):
+                return None
+            try:
+                while True:
+                    status = await conn.execute(
+                        """
+                        DELETE FROM inbound_messages WHERE id IN (
+                            SELECT id FROM inbound_messages
+                            WHERE received_at < NOW() - make_interval(days => $1)
+                            LIMIT $2
+                        )
+                        """,
+                        retention_days,
+                        batch_size,
+                    )
+                    count = int(status.split()[-1])
+                    deleted += count
+                    if count < batch_size:
+                        break
+            finally:
+                await conn.execute(
+                    "SELECT pg_advisory_unlock(hashtext('inbound_messages_retention'))"
+                )
+        return deleted
+
+    async def ensure_chat_partitions(self, months_ahead: int) -> int:
+        """
+        Crea las particiones mensuales de chat_messages que falten (hasta months_ahead meses).
+        0 si la tabla todavía no está particionada (parche 29 diferido hasta `migrate.py`).
+        """
+        async with self.pool.acquire() as conn:
+            partitioned = await conn.fetchval(
+                """
+                SELECT EXISTS (SELECT 1 FROM pg_partitioned_table
+                               WHERE partrelid = 'public.chat_messages'::regclass)
+                """
+            )
+            if not partitioned:
+                return 0
+            async with conn.transaction():
+                await conn.execute(
+                    "SELECT pg_advisory_xact_lock(hashtext('chat_messages_partitions'))"
+                )
+                return await conn.fetchval(
+                    "SELECT ensure_chat_message_partitions($1)", months_ahead
+                )
+
+    async def list_chat_partitions(self) -> List[str]:
+        """Nombres de las particiones adjuntas a chat_messages (chat_messages_pYYYYMM y la default)."""
+        rows = await self.pool.fetch(
+            """
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'public.chat_messages'::regclass
+            ORDER BY c.relname
+            """
+        )
+        return [r["relname"] for r in rows]
+
+    async def clear_expired_overrides(self, batch_size: int = 500) -> List[dict]:
+        """
+        Reactiva la IA en un lote de pacientes con human_override_until vencido.
+        SKIP LOCKED: varios workers pueden barrer a la vez sin pisarse.
+        Devuelve [{tenant_id, phone_number}] de las filas actualizadas.
+        """
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                WITH expired AS (
+                    SELECT id FROM patients
+                    WHERE human_override_until IS NOT NULL AND human_override_until <= NOW()
+                    ORDER BY human_override_until
+                    LIMIT $1
+                    FOR UPDATE SKIP LOCKED
+                )
+                UPDATE patients p
+                SET human_handoff_requested = FALSE,
+                    human_override_until = NULL,
+                    updated_at = NOW()
+                FROM expired
+                WHERE p.id = expired.id
+                RETURNING p.tenant_id, p.phone_number
+                """,
+                batch_size,
+            )
+        return [dict(r) for r in rows]
+
     async def mark_inbound_processing(self, provider: str, provider_message_id: str):
         query = "UPDATE inbound_messages SET status = 'processing' WHERE provider = $1 AND provider_message_id = $2"
         async with self.pool.acquire() as conn:
@@ -784,10 +1535,11 @@ class Database:
         content: str,
         correlation_id: str,
         tenant_id: int = 1,
-    ):
-        query = "INSERT INTO chat_messages (from_number, role, content, correlation_id, tenant_id) VALUES ($1, $2, $3, $4, $5)"
+    ) -> int:
+        """Inserta el mensaje y devuelve su id (orden de la conversación)."""
+        query = "INSERT INTO chat_messages (from_number, role, content, correlation_id, tenant_id) VALUES ($1, $2, $3, $4, $5) RETURNING id"
         async with self.pool.acquire() as conn:
-            await conn.execute(
+            return await conn.fetchval(
                 query, from_number, role, content, correlation_id, tenant_id
             )
 
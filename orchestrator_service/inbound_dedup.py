@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from prometheus_client import Counter
+
+from db import db
+
+logger = logging.getLogger("inbound_dedup")
+
+REDIS_URL = os.getenv("REDIS_URL", "")
+INBOUND_DEDUP_REDIS_ENABLED = os.getenv("INBOUND_DEDUP_REDIS_ENABLED", "true").lower() == "true"
+# Ventana de dedup en Redis: debe cubrir los reintentos del proveedor (YCloud reintenta por horas)
+INBOUND_DEDUP_TTL_SECONDS = int(os.getenv("INBOUND_DEDUP_TTL_SECONDS", "172800"))
+# Registro durable en Postgres: en lotes, fuera del camino crítico de /chat
+INBOUND_FLUSH_INTERVAL_SECONDS = float(os.getenv("INBOUND_FLUSH_INTERVAL_SECONDS", "2"))
+INBOUND_FLUSH_BATCH = int(os.getenv("INBOUND_FLUSH_BATCH", "200"))
+# Retención de inbound_messages (0 = no borrar)
+INBOUND_RETENTION_DAYS = int(os.getenv("INBOUND_RETENTION_DAYS", "30"))
+INBOUND_RETENTION_INTERVAL_HOURS = float(os.getenv("INBOUND_RETENTION_INTERVAL_HOURS", "24"))
+
+# Tope del buffer si Postgres no acepta escrituras (se descartan los más viejos)
+_MAX_PENDING = 10_000
+
+INBOUND_DEDUP = Counter(
+    "orchestrator_inbound_dedup_total",
+    "Mensajes entrantes deduplicados por capa (redis/postgres) y resultado",
+    ["tier", "result"],
+)
+
+
+class InboundDeduplicator:
+    """
+    Dedup de dos niveles para /chat: SET NX EX en Redis sobre (provider, provider_message_id)
+    decide al instante; el registro en inbound_messages se escribe en lotes en segundo plano.
+    Sin Redis (o si falla) se usa el INSERT ... ON CONFLICT de Postgres como antes.
+    """
+
+    def __init__(self):
+        self._redis = None
+        self._pending: List[Dict[str, Any]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._last_prune = 0.0
+        self.flushed = 0
+        self.flush_errors = 0
+        self.pruned = 0
+
+    def _get_redis(self):
+        if self._redis is None and REDIS_URL and INBOUND_DEDUP_REDIS_ENABLED:
+            import redis.asyncio as aioredis
+
+            self._redis = aioredis.from_url(REDIS_URL, decode_responses=True)
+        return self._redis
+
+    @staticmethod
+    def redis_key(provider: str, provider_message_id: str) -> str:
+        return f"inbound:{provider}:{provider_message_id}"
+
+    async def claim(
+        self,
+        provider: str,
+        provider_message_id: str,
+        event_id: str,
+        from_number: str,
+        payload: dict,
+        correlation_id: str,
+    ) -> bool:
+        """True si el mensaje es nuevo y debe procesarse; False si es un duplicado."""
+        record = {
+            "provider": provider,
+            "provider_message_id": provider_message_id,
+            "event_id": event_id,
+            "from_number": from_number,
+            "payload": payload,
+            "correlation_id": correlation_id,
+            "received_at": datetime.now(timezone.utc),
+        }
+        client = self._get_redis()
+        if client is not None:
+            try:
+                is_new = await client.set(
+                    self.redis_key(provider, provider_message_id),
+                    correlation_id or "1",
+                    nx=True,
+                    ex=INBOUND_DEDUP_TTL_SECONDS,
+                )
+                INBOUND_DEDUP.labels(tier="redis", result="new" if is_new else "duplicate").inc()
+                if is_new:
+                    self._enqueue(record)
+                return bool(is_new)
+            except Exception as e:
+                logger.warning(f"⚠️ Dedup en Redis no disponible, se usa Postgres: {e}")
+
+        inserted = await db.try_insert_inbound(
+            provider=provider,
+            provider_message_id=provider_message_id,
+            event_id=event_id,
+            from_number=from_number,
+            payload=payload,
+            correlation_id=correlation_id,
+        )
+        INBOUND_DEDUP.labels(tier="postgres", result="new" if inserted else "duplicate").inc()
+        return inserted
+
+    def _enqueue(self, record: Dict[str, Any]):
+        self._pending.append(record)
+        if len(self._pending) > _MAX_PENDING:
+            dropped = len(self._pending) - _MAX_PENDING
+            del self._pending[:dropped]
+            logger.error(f"❌ Buffer de inbound_messages lleno: {dropped} registros descartados")
+        if len(self._pending) >= INBOUND_FLUSH_BATCH:
+            self._wake.set()
+
+    async def flush(self) -> int:
+        """Escribe en inbound_messages lo pendiente; si falla, lo reencola para el próximo ciclo."""
+        written = 0
+        while self._pending:
+            batch = self._pending[:INBOUND_FLUSH_BATCH]
+            del self._pending[: len(batch)]
+            try:
+                await db.insert_inbound_batch(batch)
+            except Exception as e:
+                self.flush_errors += 1
+                self._pending[:0] = batch
+                logger.error(f"❌ Error escribiendo {len(batch)} inbound_messages: {e}")
+                break
+            written += len(batch)
+        self.flushed += written
+        return written
+
+    async def prune(self, retention_days: int = INBOUND_RETENTION_DAYS) -> Optional[int]:
+        """Retención: borra inbound_messages viejos (un solo proceso a la vez vía advisory lock)."""
+        if retention_days <= 0:
+            return 0
+        deleted = await db.prune_inbound_messages(retention_days)
+        if deleted:
+            self.pruned += deleted
+            logger.info(f"🧹 inbound_messages: {deleted} filas de más de {retention_days} días borradas")
+        return deleted
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=INBOUND_FLUSH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+            if (
+                INBOUND_RETENTION_DAYS > 0
+                and time.monotonic() - self._last_prune >= INBOUND_RETENTION_INTERVAL_HOURS * 3600
+            ):
+                self._last_prune = time.monotonic()
+                try:
+                    await self.prune()
+                except Exception as e:
+                    logger.error(f"❌ Error en la retención de inbound_messages: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "redis_enabled": bool(REDIS_URL) and INBOUND_DEDUP_REDIS_ENABLED,
+            "pending": len(self._pending),
+            "flushed": self.flushed,
+            "flush_errors": self.flush_errors,
+            "pruned": self.pruned,
+            "retention_days": INBOUND_RETENTION_DAYS,
+        }
+
+
+# Instancia global para importar fácilmente
+inbound_deduplicator = InboundDeduplicator()
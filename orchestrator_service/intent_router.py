@@ -0,0 +1,344 @@
+import logging
+import os
+import re
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("intent_router")
+
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.9"))
+# Mensajes más largos suelen mezclar intenciones: se delegan al agente
+FAST_PATH_MAX_WORDS = int(os.getenv("FAST_PATH_MAX_WORDS", "12"))
+
+
+def _fold(text: str) -> str:
+    """Minúsculas y sin acentos (ñ se conserva como n) para matchear reglas."""
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.split())
+
+
+# --- REGLAS (sobre texto plegado: sin acentos, minúsculas) ---
+INTENT_PATTERNS: Dict[str, List[str]] = {
+    "list_my_appointments": [
+        r"\b(tengo|tenia|tendria)\s+(algun\s+|un\s+)?turnos?\b",
+        r"\bmis\s+turnos\b",
+        r"\b(cuando|que\s+dia)\s+(es|era|tengo)\s+(mi|el)\s+(proximo\s+)?turno\b",
+        r"\bmi\s+proximo\s+turno\b",
+        r"\bdo\s+i\s+have\s+(an?|any)\s+appointments?\b",
+        r"\bmy\s+(next\s+|upcoming\s+)?appointments?\b",
+        r"\bwhen\s+is\s+my\s+(next\s+)?appointment\b",
+        r"\bai[- ]je\s+(un\s+)?rendez[- ]vous\b",
+        r"\b(mes|mon\s+prochain)\s+rendez[- ]vous\b",
+    ],
+    "list_services": [
+        r"\bque\s+(tratamientos|servicios)\b",
+        r"\b(tratamientos|servicios)\s+(tienen|ofrecen|hacen|hay)\b",
+        r"\blista\s+de\s+(tratamientos|servicios)\b",
+        r"\bwhat\s+(treatments|services)\b",
+        r"\b(treatments|services)\s+(do\s+)?you\s+(offer|have|provide)\b",
+        r"\bquels?\s+(soins|traitements|services)\b",
+    ],
+    "list_professionals": [
+        r"\bque\s+(profesionales|doctores|doctoras|odontologos|odontologas|dentistas)\b",
+        r"\bquien(es)?\s+atiende(n)?\b",
+        r"\b(which|what)\s+(dentists|doctors|professionals)\b",
+        r"\bwho\s+are\s+the\s+(dentists|doctors|professionals)\b",
+        r"\bquels?\s+(dentistes|docteurs|praticiens|professionnels)\b",
+    ],
+    "cancel_appointment": [
+        r"\b(cancela|cancelar|cancelame|anula|anular|anulame)\b.*\bturno\b",
+        r"\bcancel\b.*\bappointment\b",
+        r"\bannuler?\b.*\brendez[- ]vous\b",
+    ],
+}
+
+# Señales que exigen razonamiento del agente (agendar, reprogramar, urgencias, síntomas)
+AGENT_ONLY_PATTERNS = [
+    r"\b(agendar|reservar|sacar|pedir|quiero\s+un)\s+turno\b",
+    r"\b(reprogram\w*|cambiar|mover|pasar)\b",
+    r"\b(book|schedule|reschedule|move|change)\b",
+    r"\b(prendre|reporter|deplacer|changer)\b",
+    r"\b(dolor|duele|urgen\w*|sangr\w*|hinchad\w*|pain|hurts?|bleed\w*|swollen|douleur|saigne\w*)\b",
+    r"\b(precio|cuesta|costo|price|cost|prix)\b",
+]
+
+# Negaciones: "no quiero cancelar" matchea las mismas palabras que "quiero cancelar"
+NEGATION_PATTERNS = [
+    r"\b(no|nunca|ni|tampoco|jamas)\b",
+    r"\b(not|never|dont|don't|do\s+not|didn't|didnt)\b",
+    r"\b(ne|n'|pas|jamais)\b",
+]
+
+# Pedidos compuestos ("cancelá el de mañana y sacame otro"): una sola tool no alcanza
+COMPOUND_PATTERNS = [
+    r"\b(y|e|ademas|tambien|despues|luego|otro|otra)\b",
+    r"\b(and|also|then|another|plus)\b",
+    r"\b(et|puis|aussi|ensuite|autre)\b",
+    r"[;+]",
+]
+
+# Fechas simples para cancel_appointment (token plegado -> date_query canónico de parse_date)
+DATE_TOKENS = {
+    "pasado manana": "pasado mañana",
+    "manana": "mañana",
+    "hoy": "hoy",
+    "lunes": "lunes",
+    "martes": "martes",
+    "miercoles": "miércoles",
+    "jueves": "jueves",
+    "viernes": "viernes",
+    "sabado": "sábado",
+    "tomorrow": "mañana",
+    "today": "hoy",
+    "monday": "lunes",
+    "tuesday": "martes",
+    "wednesday": "miércoles",
+    "thursday": "jueves",
+    "friday": "viernes",
+    "saturday": "sábado",
+    "demain": "mañana",
+    "aujourd'hui": "hoy",
+    "lundi": "lunes",
+    "mardi": "martes",
+    "mercredi": "miércoles",
+    "jeudi": "jueves",
+    "vendredi": "viernes",
+    "samedi": "sábado",
+}
+NUMERIC_DATE = r"\b(\d{1,2}[/-]\d{1,2}(?:[/-]\d{2,4})?|\d{4}-\d{2}-\d{2})\b"
+
+# --- PLANTILLAS (es: voseo rioplatense, sin signos de apertura ¿ ¡) ---
+TEMPLATES: Dict[str, Dict[str, Dict[str, str]]] = {
+    "list_services": {
+        "es": {
+            "header": "Estos son los tratamientos que podés agendar 🦷",
+            "footer": "Cuál te interesa? Te busco disponibilidad.",
+            "empty": "Por el momento no hay tratamientos disponibles para agendar en esta sede.",
+        },
+        "en": {
+            "header": "These are the treatments you can book 🦷",
+            "footer": "Which one are you interested in? I can check availability for you.",
+            "empty": "There are no treatments available to book at this clinic right now.",
+        },
+        "fr": {
+            "header": "Voici les soins que vous pouvez réserver 🦷",
+            "footer": "Lequel vous intéresse ? Je peux vérifier les disponibilités.",
+            "empty": "Aucun soin n'est disponible à la réservation dans cette clinique pour le moment.",
+        },
+    },
+    "list_professionals": {
+        "es": {
+            "header": "Estos son los profesionales que atienden en la clínica 👨‍⚕️",
+            "footer": "Tenés preferencia por alguno o buscamos el primer turno disponible?",
+            "empty": "Por el momento no hay profesionales cargados en esta sede.",
+        },
+        "en": {
+            "header": "These are the professionals working at the clinic 👨‍⚕️",
+            "footer": "Do you have a preference, or should I look for the first available slot?",
+            "empty": "There are no professionals listed at this clinic right now.",
+        },
+        "fr": {
+            "header": "Voici les professionnels de la clinique 👨‍⚕️",
+            "footer": "Avez-vous une préférence, ou je cherche le premier créneau disponible ?",
+            "empty": "Aucun professionnel n'est enregistré dans cette clinique pour le moment.",
+        },
+    },
+    "list_my_appointments": {
+        "es": {
+            "header": "Tus próximos turnos:",
+            "line": "• {when} con {professional} ({treatment})",
+            "footer": "Querés cancelar o reprogramar alguno?",
+            "empty": "No tenés turnos registrados en los próximos días. Querés que busquemos disponibilidad para agendar?",
+        },
+        "en": {
+            "header": "Your upcoming appointments:",
+            "line": "• {when} with {professional} ({treatment})",
+            "footer": "Would you like to cancel or reschedule any of them?",
+            "empty": "You have no appointments in the coming days. Would you like me to check availability?",
+        },
+        "fr": {
+            "header": "Vos prochains rendez-vous :",
+            "line": "• {when} avec {professional} ({treatment})",
+            "footer": "Souhaitez-vous en annuler ou en déplacer un ?",
+            "empty": "Vous n'avez aucun rendez-vous dans les prochains jours. Voulez-vous que je cherche une disponibilité ?",
+        },
+    },
+    "cancel_appointment": {
+        "es": {
+            "done": "Listo, cancelé tu turno del {date}. Te puedo ayudar con algo más?",
+            "not_found": "No encontré ningún turno activo para el {date}. Querés que revisemos otra fecha?",
+        },
+        "en": {
+            "done": "Done, I cancelled your appointment for {date}. Can I help you with anything else?",
+            "not_found": "I couldn't find an active appointment for {date}. Should we check another date?",
+        },
+        "fr": {
+            "done": "C'est fait, j'ai annulé votre rendez-vous du {date}. Puis-je vous aider pour autre chose ?",
+            "not_found": "Je n'ai trouvé aucun rendez-vous actif pour le {date}. Voulez-vous vérifier une autre date ?",
+        },
+    },
+}
+
+APPOINTMENT_LINE = re.compile(r"^•\s*(?P<when>.+?)\s+con\s+(?P<professional>.+?)\s+\((?P<treatment>[^)]*)\)\s*$")
+
+
+@dataclass
+class IntentMatch:
+    intent: str
+    confidence: float
+    args: Dict[str, Any] = field(default_factory=dict)
+    label: Optional[str] = None  # Fecha tal como la escribió el paciente (para la plantilla)
+
+
+@dataclass
+class FastPathStats:
+    """Contadores del pre-router: tasa de acierto y ahorro estimado de latencia."""
+
+    hits: Dict[str, int] = field(default_factory=dict)
+    fallbacks: int = 0
+    fast_ms_total: float = 0.0
+    agent_ms_total: float = 0.0
+    agent_calls: int = 0
+
+    def report(self) -> Dict[str, Any]:
+        total_hits = sum(self.hits.values())
+        total = total_hits + self.fallbacks
+        avg_fast = self.fast_ms_total / total_hits if total_hits else 0.0
+        avg_agent = self.agent_ms_total / self.agent_calls if self.agent_calls else 0.0
+        return {
+            "hits": dict(self.hits),
+            "total_hits": total_hits,
+            "fallbacks": self.fallbacks,
+            "hit_rate": round(total_hits / total, 4) if total else 0.0,
+            "avg_fast_path_ms": round(avg_fast, 2),
+            "avg_agent_ms": round(avg_agent, 2),
+            "estimated_saved_ms": round(max(avg_agent - avg_fast, 0.0) * total_hits, 2),
+        }
+
+
+class FastPathRouter:
+    """
+    Pre-router determinístico delante de agent_executor.
+    Reconoce intenciones de alta confianza (reglas + score por palabras clave),
+    llama la tool correspondiente directamente y devuelve texto con plantilla
+    en el idioma detectado. Ante cualquier duda devuelve None y decide el agente.
+    """
+
+    def __init__(self, min_confidence: float = FAST_PATH_MIN_CONFIDENCE):
+        self.min_confidence = min_confidence
+        self.stats = FastPathStats()
+        self._patterns = {
+            intent: [re.compile(p) for p in patterns]
+            for intent, patterns in INTENT_PATTERNS.items()
+        }
+        self._agent_only = [re.compile(p) for p in AGENT_ONLY_PATTERNS]
+        self._negation = [re.compile(p) for p in NEGATION_PATTERNS]
+        self._compound = [re.compile(p) for p in COMPOUND_PATTERNS]
+
+    def classify(self, text: str) -> Optional[IntentMatch]:
+        folded = _fold(text)
+        if not folded:
+            return None
+        if any(p.search(folded) for p in self._agent_only):
+            return None
+        # Negado o con más de un pedido: el agente interpreta (sobre todo antes de cancelar)
+        if any(p.search(folded) for p in self._negation + self._compound):
+            return None
+        matched = [
+            intent
+            for intent, patterns in self._patterns.items()
+            if any(p.search(folded) for p in patterns)
+        ]
+        # "cancelá mi turno" también matchea "mi turno": la acción explícita manda
+        if "cancel_appointment" in matched:
+            matched = ["cancel_appointment"]
+        if len(matched) != 1:
+            return None
+        intent = matched[0]
+
+        words = len(folded.split())
+        confidence = 1.0 if words <= FAST_PATH_MAX_WORDS else 0.7
+        match = IntentMatch(intent=intent, confidence=confidence)
+        if intent == "cancel_appointment":
+            date = self._extract_single_date(folded)
+            if not date:
+                return None
+            match.args["date_query"], match.label = date
+        return match
+
+    @staticmethod
+    def _extract_single_date(folded: str) -> Optional[tuple]:
+        """Devuelve (date_query canónico, token original) si hay exactamente una fecha."""
+        found = []
+        rest = folded
+        for token in sorted(DATE_TOKENS, key=len, reverse=True):
+            if re.search(rf"\b{re.escape(token)}\b", rest):
+                found.append((DATE_TOKENS[token], token))
+                rest = re.sub(rf"\b{re.escape(token)}\b", " ", rest)
+        found.extend((d, d) for d in re.findall(NUMERIC_DATE, rest))
+        return found[0] if len(found) == 1 else None
+
+    async def try_handle(self, text: str, lang: str, tools: Dict[str, Any]) -> Optional[str]:
+        """Devuelve la respuesta final o None para delegar en el agente."""
+        if not FAST_PATH_ENABLED:
+            return None
+        started = time.perf_counter()
+        match = self.classify(text)
+        tool = tools.get(match.intent) if match else None
+        if not match or match.confidence < self.min_confidence or tool is None:
+            self.stats.fallbacks += 1
+            return None
+        lang = lang if lang in ("es", "en", "fr") else "es"
+        try:
+            raw = await tool.ainvoke(match.args)
+            reply = self._render(match, lang, str(raw))
+        except Exception as e:
+            logger.warning(f"⚡ fast-path {match.intent} falló, delego al agente: {e}")
+            reply = None
+        if reply is None:
+            self.stats.fallbacks += 1
+            return None
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stats.hits[match.intent] = self.stats.hits.get(match.intent, 0) + 1
+        self.stats.fast_ms_total += elapsed_ms
+        logger.info(f"⚡ fast-path {match.intent} lang={lang} en {elapsed_ms:.1f}ms (sin LLM)")
+        return reply
+
+    def record_agent_latency(self, elapsed_ms: float):
+        """Latencia de turnos resueltos por el agente (base para estimar el ahorro)."""
+        self.stats.agent_ms_total += elapsed_ms
+        self.stats.agent_calls += 1
+
+    def _render(self, match: IntentMatch, lang: str, raw: str) -> Optional[str]:
+        tpl = TEMPLATES[match.intent][lang]
+        if match.intent == "cancel_appointment":
+            date = match.args["date_query"] if lang == "es" else match.label
+            if raw.startswith("Entendido. He cancelado"):
+                return tpl["done"].format(date=date)
+            if raw.startswith("No encontré ningún turno activo"):
+                return tpl["not_found"].format(date=date)
+            # Estado incierto (error): el agente decide qué decir
+            return None
+
+        bullets = [line.strip() for line in raw.splitlines() if line.strip().startswith("•")]
+        if raw.startswith(("⚠️", "No pude", "Hubo un error")):
+            return None
+        if not bullets:
+            return tpl["empty"]
+        if match.intent == "list_my_appointments":
+            rendered = []
+            for line in bullets:
+                m = APPOINTMENT_LINE.match(line)
+                if not m:
+                    return None
+                rendered.append(tpl["line"].format(**m.groupdict()))
+            bullets = rendered
+        return "\n".join([tpl["header"], *bullets, "", tpl["footer"]])
+
+
+# Instancia global para importar fácilmente
+fast_path_router = FastPathRouter()
@@ -0,0 +1,231 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+from db import db
+
+logger = logging.getLogger("llm_usage")
+
+LLM_USAGE_ENABLED = os.getenv("LLM_USAGE_ENABLED", "true").lower() == "true"
+LLM_USAGE_FLUSH_INTERVAL_SECONDS = float(os.getenv("LLM_USAGE_FLUSH_INTERVAL_SECONDS", "5"))
+LLM_USAGE_FLUSH_BATCH = int(os.getenv("LLM_USAGE_FLUSH_BATCH", "500"))
+
+# Tope del buffer si Postgres no acepta escrituras (se descartan los más viejos)
+_MAX_PENDING = 20_000
+
+# USD por millón de tokens (entrada, salida, entrada cacheada); AGENT_MODEL_PRICES (JSON) agrega o pisa modelos
+MODEL_PRICES: Dict[str, Tuple[float, ...]] = {
+    "gpt-4o-mini": (0.15, 0.60, 0.075),
+    "gpt-4o": (2.50, 10.00, 1.25),
+    "gpt-4.1": (2.00, 8.00, 0.50),
+    "gpt-4.1-mini": (0.40, 1.60, 0.10),
+    "gpt-4.1-nano": (0.10, 0.40, 0.025),
+    "gpt-3.5-turbo": (0.50, 1.50, 0.50),
+}
+try:
+    MODEL_PRICES.update(
+        {k: tuple(v) for k, v in json.loads(os.getenv("AGENT_MODEL_PRICES", "{}")).items()}
+    )
+except (ValueError, TypeError) as e:
+    logger.error(f"❌ AGENT_MODEL_PRICES inválido, se usan precios por defecto: {e}")
+
+
+def estimate_cost_usd(
+    model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0
+) -> float:
+    """Costo estimado según MODEL_PRICES (prefijo más largo: gpt-4o-mini-2024-07-18 → gpt-4o-mini)."""
+    match = max((name for name in MODEL_PRICES if model.startswith(name)), key=len, default=None)
+    if match is None:
+        return 0.0
+    prices = MODEL_PRICES[match]
+    price_in, price_out = prices[0], prices[1]
+    price_cached = prices[2] if len(prices) > 2 else price_in
+    cached = min(cached_tokens, prompt_tokens)
+    return (
+        (prompt_tokens - cached) * price_in + cached * price_cached + completion_tokens * price_out
+    ) / 1_000_000
+
+
+class UsageCollector(AsyncCallbackHandler):
+    """Callback por invocación: tokens (incluye cacheados), llamadas, costo y errores (failover)."""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.llm_calls = 0
+        self.cost_usd = 0.0
+        self.models: List[str] = []
+        self.errors = 0
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        llm_output = getattr(response, "llm_output", None) or {}
+        usage = llm_output.get("token_usage") or {}
+        model = llm_output.get("model_name") or "unknown"
+        prompt = usage.get("prompt_tokens") or 0
+        completion = usage.get("completion_tokens") or 0
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        self.prompt_tokens += prompt
+        self.completion_tokens += completion
+        self.cached_tokens += cached
+        self.llm_calls += 1
+        self.cost_usd += estimate_cost_usd(model, prompt, completion, cached)
+        self.models.append(model)
+
+    async def on_llm_error(self, error, *, run_id, **kwargs):
+        self.errors += 1
+
+
+class LLMUsageRecorder:
+    """
+    Contabilidad de uso del LLM por clínica: una fila por invocación (agente o resumen)
+    en llm_usage, escrita en lotes en segundo plano para no sumar latencia al turno.
+    """
+
+    def __init__(self):
+        self._pending: List[tuple] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self.flushed = 0
+        self.flush_errors = 0
+
+    def record(
+        self,
+        tenant_id: Any,
+        kind: str,
+        model: str,
+        usage: UsageCollector,
+        route: Optional[str] = None,
+        tool_calls: int = 0,
+        wall_ms: int = 0,
+        correlation_id: Optional[str] = None,
+    ):
+        if not LLM_USAGE_ENABLED:
+            return
+        self._pending.append(
+            (
+                int(tenant_id) if tenant_id is not None else None,
+                kind,
+                route,
+                model,
+                usage.prompt_tokens,
+                usage.completion_tokens,
+                usage.cached_tokens,
+                usage.llm_calls,
+                tool_calls,
+                wall_ms,
+                round(usage.cost_usd, 6),
+                correlation_id,
+                datetime.now(timezone.utc),
+            )
+        )
+        if len(self._pending) > _MAX_PENDING:
+            dropped = len(self._pending) - _MAX_PENDING
+            del self._pending[:dropped]
+            logger.error(f"❌ Buffer de llm_usage lleno: {dropped} registros descartados")
+        if len(self._pending) >= LLM_USAGE_FLUSH_BATCH:
+            self._wake.set()
+
+    async def flush(self) -> int:
+        written = 0
+        while self._pending:
+            batch = self._pending[:LLM_USAGE_FLUSH_BATCH]
+            del self._pending[: len(batch)]
+            try:
+                await db.pool.executemany(
+                    """
+                    INSERT INTO llm_usage (
+                        tenant_id, kind, route, model, prompt_tokens, completion_tokens,
+                        cached_tokens, llm_calls, tool_calls, wall_ms, cost_usd,
+                        correlation_id, created_at
+                    ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13)
+                    """,
+                    batch,
+                )
+            except Exception as e:
+                self.flush_errors += 1
+                self._pending[:0] = batch
+                logger.error(f"❌ Error escribiendo {len(batch)} filas de llm_usage: {e}")
+                break
+            written += len(batch)
+        self.flushed += written
+        return written
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._wake.wait(), timeout=LLM_USAGE_FLUSH_INTERVAL_SECONDS
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None and LLM_USAGE_ENABLED:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def daily_usage(
+        self, tenant_ids: List[int], start: date, end: date
+    ) -> List[Dict[str, Any]]:
+        """Uso agregado por clínica y día (zona de Argentina), entre start y end inclusive."""
+        rows = await db.pool.fetch(
+            """
+            SELECT tenant_id,
+                   (created_at AT TIME ZONE 'America/Argentina/Buenos_Aires')::date AS day,
+                   COUNT(*) FILTER (WHERE kind = 'agent') AS agent_turns,
+                   SUM(llm_calls) AS llm_calls,
+                   SUM(tool_calls) AS tool_calls,
+                   SUM(prompt_tokens) AS prompt_tokens,
+                   SUM(completion_tokens) AS completion_tokens,
+                   SUM(cached_tokens) AS cached_tokens,
+                   ROUND(AVG(wall_ms) FILTER (WHERE kind = 'agent')) AS avg_wall_ms,
+                   SUM(cost_usd) AS cost_usd
+            FROM llm_usage
+            WHERE tenant_id = ANY($1::int[])
+              AND created_at >= ($2::date::timestamp AT TIME ZONE 'America/Argentina/Buenos_Aires')
+              AND created_at < (($3::date + 1)::timestamp AT TIME ZONE 'America/Argentina/Buenos_Aires')
+            GROUP BY tenant_id, day
+            ORDER BY day DESC, tenant_id
+            """,
+            tenant_ids,
+            start,
+            end,
+        )
+        return [
+            {
+                **dict(r),
+                "day": r["day"].isoformat(),
+                "avg_wall_ms": int(r["avg_wall_ms"] or 0),
+                "cost_usd": float(r["cost_usd"] or 0),
+            }
+            for r in rows
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": LLM_USAGE_ENABLED,
+            "pending": len(self._pending),
+            "flushed": self.flushed,
+            "flush_errors": self.flush_errors,
+        }
+
+
+# Instancia global para importar fácilmente
+llm_usage_recorder = LLMUsageRecorder()
@@ -0,0 +1,148 @@
+"""
+Modelo de chat falso para pruebas de carga del orchestrator (sin OpenAI).
+Se activa con AGENT_LLM_BACKEND=fake: emite tool calls en formato OpenAI
+(additional_kwargs["tool_calls"]) según palabras clave del mensaje del paciente,
+con latencia configurable, y responde en texto cuando ya tiene el resultado de la tool.
+"""
+
+import asyncio
+import functools
+import json
+import os
+import random
+import re
+import uuid
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+FAKE_LLM_LATENCY_MS_MIN = int(os.getenv("FAKE_LLM_LATENCY_MS_MIN", "400"))
+FAKE_LLM_LATENCY_MS_MAX = int(os.getenv("FAKE_LLM_LATENCY_MS_MAX", "1500"))
+FAKE_TOOL_LATENCY_MS = int(os.getenv("FAKE_TOOL_LATENCY_MS", "0"))
+
+_DATE = re.compile(
+    r"\b(pasado mañana|mañana|hoy|lunes|martes|miércoles|jueves|viernes|sábado|\d{1,2}/\d{1,2})\b"
+)
+_TIME = re.compile(r"\b(\d{1,2}:\d{2})\b")
+_DNI = re.compile(r"\bdni\s*(\d{7,8})\b")
+
+# (patrón sobre el texto en minúsculas, tool) — el orden define la prioridad
+TOOL_RULES = [
+    (r"\b(agendar|reservar|agendame|reservame|book)\b", "book_appointment"),
+    (r"\b(reprogram\w*|cambiar el turno|mover el turno)\b", "reschedule_appointment"),
+    (r"\b(cancel\w*|anul\w*)\b", "cancel_appointment"),
+    (r"\b(duele|dolor|sangr\w*|hinchad\w*)\b", "triage_urgency"),
+    (r"\b(mis turnos|tengo (algún |un )?turno)\b", "list_my_appointments"),
+    (r"\b(disponib\w*|horarios?|turno para)\b", "check_availability"),
+    (r"\b(profesionales|doctor\w*|odontólog\w*|quién atiende)\b", "list_professionals"),
+    (r"\b(tratamientos|servicios)\b", "list_services"),
+]
+
+
+def _date_in(text: str, default: str = "mañana") -> str:
+    m = _DATE.search(text)
+    return m.group(1) if m else default
+
+
+def build_tool_args(tool_name: str, text: str) -> Dict[str, Any]:
+    """Argumentos plausibles para cada tool a partir del mensaje del paciente."""
+    if tool_name == "check_availability":
+        args = {"date_query": _date_in(text)}
+        if "tarde" in text:
+            args["time_preference"] = "tarde"
+        return args
+    if tool_name == "book_appointment":
+        time_m = _TIME.search(text)
+        dni_m = _DNI.search(text)
+        dni = dni_m.group(1) if dni_m else str(random.randint(20_000_000, 45_000_000))
+        return {
+            "date_time": f"{_date_in(text)} {time_m.group(1) if time_m else '10:00'}",
+            "treatment_reason": "limpieza" if "limpieza" in text else "consulta",
+            "first_name": "Carga",
+            "last_name": f"Test{dni[-4:]}",
+            "dni": dni,
+            "insurance_provider": "Particular",
+        }
+    if tool_name == "cancel_appointment":
+        return {"date_query": _date_in(text)}
+    if tool_name == "reschedule_appointment":
+        time_m = _TIME.search(text)
+        return {
+            "original_date": _date_in(text),
+            "new_date_time": f"pasado mañana {time_m.group(1) if time_m else '11:00'}",
+        }
+    if tool_name == "triage_urgency":
+        return {"symptoms": text[:200]}
+    return {}
+
+
+class FakeDentalChatModel(BaseChatModel):
+    """Chat model guionado: una tool call por turno del paciente y luego una respuesta final."""
+
+    latency_ms_min: int = FAKE_LLM_LATENCY_MS_MIN
+    latency_ms_max: int = FAKE_LLM_LATENCY_MS_MAX
+    model_name: str = "fake-dental"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-dental"
+
+    def _respond(self, messages: List[BaseMessage], tools: Optional[List[dict]]) -> AIMessage:
+        last_human = max(
+            (i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1
+        )
+        tool_results = [m for m in messages[last_human + 1 :] if isinstance(m, ToolMessage)]
+        if tool_results:
+            return AIMessage(content=f"{tool_results[-1].content[:300]}\nTe ayudo con algo más?")
+
+        text = (messages[last_human].content if last_human >= 0 else "").lower()
+        available = {t.get("function", {}).get("name") for t in (tools or [])}
+        for pattern, tool_name in TOOL_RULES:
+            if tool_name in available and re.search(pattern, text):
+                call = {
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "type": "function",
+                    "function": {
+                        "name": tool_name,
+                        "arguments": json.dumps(build_tool_args(tool_name, text)),
+                    },
+                }
+                return AIMessage(content="", additional_kwargs={"tool_calls": [call]})
+        return AIMessage(content="Hola! Soy la asistente de la clínica. En qué te puedo ayudar?")
+
+    def _result(self, messages: List[BaseMessage], message: AIMessage) -> ChatResult:
+        prompt_chars = sum(len(str(m.content)) for m in messages)
+        completion_chars = len(message.content) + len(json.dumps(message.additional_kwargs))
+        usage = {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": completion_chars // 4,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"model_name": self.model_name, "token_usage": usage},
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return self._result(messages, self._respond(messages, kwargs.get("tools")))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(random.uniform(self.latency_ms_min, self.latency_ms_max) / 1000)
+        return self._result(messages, self._respond(messages, kwargs.get("tools")))
+
+
+def simulate_tool_latency(tool_obj, latency_ms: int = FAKE_TOOL_LATENCY_MS):
+    """Agrega latencia fija (± 50%) a la corrutina de una tool (simula GCal/servicios externos)."""
+    coroutine = getattr(tool_obj, "coroutine", None)
+    if coroutine is None or latency_ms <= 0:
+        return tool_obj
+
+    @functools.wraps(coroutine)
+    async def wrapper(*args, **kwargs):
+        await asyncio.sleep(latency_ms * random.uniform(0.5, 1.5) / 1000)
+        return await coroutine(*args, **kwargs)
+
+    tool_obj.coroutine = wrapper
+    return tool_obj
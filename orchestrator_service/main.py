@@ -2,25 +2,28 @@ import os
 import json
 import logging
 import asyncio
+import time
 import uuid
+import hashlib
 from datetime import datetime, timedelta, date, timezone
 from typing import List, Optional, Dict, Any
 from contextvars import ContextVar
 from contextlib import asynccontextmanager
+from urllib.parse import parse_qs
 from dateutil.parser import parse as dateutil_parse
 import re
 from gcal_service import gcal_service
 
 from fastapi import FastAPI, Request, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST, REGISTRY
+from prometheus_client.openmetrics.exposition import (
+    generate_latest as openmetrics_latest,
+    CONTENT_TYPE_LATEST as OPENMETRICS_CONTENT_TYPE,
+)
 from pydantic import BaseModel, Field
-from sqlalchemy.engine import make_url
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import text
 
-from langchain_openai import ChatOpenAI
 
 # Busca la línea que falla y reemplázala por estas:
 from langchain.agents import AgentExecutor
@@ -31,14 +34,40 @@ from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from langchain.tools import tool
 
 import socketio
-from db import db
-from admin_routes import router as admin_router
+from db import POSTGRES_REPLICA_DSN, current_read_key, current_read_sticky, db
+from admin_routes import router as admin_router, get_allowed_tenant_ids
+from auth_service import auth_service
 from auth_routes import router as auth_router
 from demo_tracking_routes import router as demo_tracking_router
 from bridge_routes import router as bridge_router
 from demo_tracking_service import demo_tracking_service
 from email_service import email_service
 from holiday_service import holiday_service
+from intent_router import fast_path_router
+from conversation_memory import conversation_memory
+from conversation_cache import conversation_cache
+from override_sweeper import OverrideSweeper
+from admission import admission_controller, AdmissionRejected
+from inbound_dedup import inbound_deduplicator
+from chat_archiver import chat_archiver
+from pagination import NEXT_CURSOR_HEADER
+from llm_usage import llm_usage_recorder
+from model_router import ModelRouter, build_routed_llm, AGENT_MODEL_DEFAULT, MUTATING_TOOLS
+from tool_concurrency import begin_agent_turn, bind_tool_concurrency
+from realtime import CoalescingEmitter, build_client_manager, tenant_room
+from metrics import (
+    StageTimer,
+    current_stage_timer,
+    instrument_tool,
+    lap,
+    SOCKET_EMITS,
+)
+from tool_cache import (
+    tool_cache,
+    normalize_tool_args,
+    TOOL_CACHE_CATALOG_TTL,
+    TOOL_CACHE_AVAILABILITY_TTL,
+)
 
 # --- CONFIGURACIÓN ---
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
@@ -46,7 +75,8 @@ logging.basicConfig(level=LOG_LEVEL)
 logger = logging.getLogger("orchestrator")
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
-POSTGRES_DSN = os.getenv("POSTGRES_DSN", "")
+# "openai" (producción) o "fake" (modelo guionado local para pruebas de carga)
+AGENT_LLM_BACKEND = os.getenv("AGENT_LLM_BACKEND", "openai").lower()
 CLINIC_NAME = os.getenv("CLINIC_NAME", "Consultorio Dental")
 CLINIC_LOCATION = os.getenv("CLINIC_LOCATION", "Buenos Aires, Argentina")
 CLINIC_HOURS_START = os.getenv("CLINIC_HOURS_START", "08:00")
@@ -68,9 +98,15 @@ current_patient_id: ContextVar[Optional[int]] = ContextVar(
 )
 current_tenant_id: ContextVar[int] = ContextVar("current_tenant_id", default=1)
 
-# --- DATABASE SETUP ---
-engine = create_async_engine(POSTGRES_DSN, echo=False)
-AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+def _tenant_scope() -> tuple:
+    """Scope de memoización para tools de catálogo/agenda (por clínica)."""
+    return (current_tenant_id.get(),)
+
+
+def _patient_scope() -> tuple:
+    """Scope de memoización para tools que dependen del paciente de la conversación."""
+    return (current_tenant_id.get(), current_customer_phone.get())
 
 
 # --- MODELOS DE DATOS (API) ---
@@ -424,7 +460,21 @@ async def get_tenant_calendar_provider(tenant_id: int) -> str:
 # --- TOOLS DENTALES ---
 
 
+def _availability_cache_key(fn, args: tuple, kwargs: dict) -> tuple:
+    """Clave de check_availability: 'mañana', 'martes' o '2025-02-05' se resuelven a la fecha real."""
+    norm = dict(normalize_tool_args(fn, args, kwargs))
+    if "date_query" in norm:
+        norm["date_query"] = parse_date(norm["date_query"]).isoformat()
+    return tuple(sorted(norm.items()))
+
+
 @tool
+@tool_cache.memoize(
+    ttl=TOOL_CACHE_AVAILABILITY_TTL,
+    topics=("appointments", "professionals", "treatments", "holidays"),
+    scope=_tenant_scope,
+    key_fn=_availability_cache_key,
+)
 async def check_availability(
     date_query: str,
     professional_name: Optional[str] = None,
@@ -544,8 +594,10 @@ async def check_availability(
                 if not cal_id:
                     continue
                 try:
-                    g_events = gcal_service.get_events_for_day(
-                        calendar_id=cal_id, date_obj=target_date
+                    g_events = await asyncio.to_thread(
+                        gcal_service.get_events_for_day,
+                        calendar_id=cal_id,
+                        date_obj=target_date,
                     )
                     start_day = datetime.combine(
                         target_date, datetime.min.time(), tzinfo=ARG_TZ
@@ -905,7 +957,8 @@ async def book_appointment(
                     continue
             if calendar_provider == "google" and cand.get("google_calendar_id"):
                 try:
-                    g_events = gcal_service.get_events_for_day(
+                    g_events = await asyncio.to_thread(
+                        gcal_service.get_events_for_day,
                         calendar_id=cand["google_calendar_id"],
                         date_obj=apt_datetime.date(),
                     )
@@ -998,13 +1051,15 @@ async def book_appointment(
             duration,
             treatment_code,
         )
+        tool_cache.invalidate("appointments", tenant_id)
 
         if calendar_provider == "google" and target_prof.get("google_calendar_id"):
             try:
                 summary = (
                     f"Cita Dental AI: {first_name or 'Paciente'} - {treatment_code}"
                 )
-                gcal_service.create_event(
+                await asyncio.to_thread(
+                    gcal_service.create_event,
                     calendar_id=target_prof["google_calendar_id"],
                     summary=summary,
                     start_time=apt_datetime.isoformat(),
@@ -1014,20 +1069,18 @@ async def book_appointment(
             except Exception as ge:
                 logger.error(f"GCal sync error: {ge}")
 
-        # 6. Notificar Socket.IO si está disponible
+        # 6. Notificar Socket.IO (solo a los dashboards de esta clínica)
         try:
-            from main import sio  # Ensure we have sio
-
-            # Sanitizar para evitar errores de serialización
-            safe_data = to_json_safe(
+            await emit_to_tenant(
+                "NEW_APPOINTMENT",
                 {
                     "id": apt_id,
+                    "tenant_id": tenant_id,
                     "patient_name": f"{first_name} {last_name or ''}",
                     "appointment_datetime": apt_datetime.isoformat(),
                     "professional_name": target_prof["first_name"],
-                }
+                },
             )
-            await sio.emit("NEW_APPOINTMENT", safe_data)
         except:
             pass
 
@@ -1083,8 +1136,9 @@ async def triage_urgency(symptoms: str):
 
     # Persistir urgencia en el paciente si lo identificamos
     if phone:
+        tenant_id = current_tenant_id.get()
         try:
-            patient_row = await db.ensure_patient_exists(phone)
+            patient_row = await db.ensure_patient_exists(phone, tenant_id)
             await db.pool.execute(
                 """
                 UPDATE patients 
@@ -1097,15 +1151,14 @@ async def triage_urgency(symptoms: str):
             )
 
             # Notificar al dashboard el cambio de prioridad
-            await sio.emit(
+            await emit_to_tenant(
                 "PATIENT_UPDATED",
-                to_json_safe(
-                    {
-                        "phone_number": phone,
-                        "urgency_level": urgency_level,
-                        "urgency_reason": symptoms,
-                    }
-                ),
+                {
+                    "phone_number": phone,
+                    "tenant_id": tenant_id,
+                    "urgency_level": urgency_level,
+                    "urgency_reason": symptoms,
+                },
             )
         except Exception as e:
             logger.error(f"Error persisting triage: {e}")
@@ -1121,6 +1174,9 @@ async def triage_urgency(symptoms: str):
 
 
 @tool
+@tool_cache.memoize(
+    ttl=TOOL_CACHE_AVAILABILITY_TTL, topics=("appointments",), scope=_patient_scope
+)
 async def list_my_appointments(upcoming_days: int = 14):
     """
     Lista los turnos del paciente que tiene la conversación (próximos o recientes).
@@ -1212,7 +1268,8 @@ async def cancel_appointment(date_query: str):
                 apt["id"],
             )
             if google_calendar_id:
-                gcal_service.delete_event(
+                await asyncio.to_thread(
+                    gcal_service.delete_event,
                     calendar_id=google_calendar_id,
                     event_id=apt["google_calendar_event_id"],
                 )
@@ -1224,11 +1281,10 @@ async def cancel_appointment(date_query: str):
         """,
             apt["id"],
         )
+        tool_cache.invalidate("appointments", tenant_id)
 
         # 3. Notificar a la UI (Borrado visual)
-        from main import sio
-
-        await sio.emit("APPOINTMENT_DELETED", apt["id"])
+        await emit_to_tenant("APPOINTMENT_DELETED", apt["id"], tenant_id)
 
         logger.info(f"🚫 Turno cancelado por IA: {apt['id']} ({phone})")
         return f"Entendido. He cancelado tu turno del {date_query}. ¿Te puedo ayudar con algo más?"
@@ -1295,11 +1351,14 @@ async def reschedule_appointment(original_date: str, new_date_time: str):
             and apt.get("google_calendar_event_id")
             and google_calendar_id
         ):
-            gcal_service.delete_event(
-                calendar_id=google_calendar_id, event_id=apt["google_calendar_event_id"]
+            await asyncio.to_thread(
+                gcal_service.delete_event,
+                calendar_id=google_calendar_id,
+                event_id=apt["google_calendar_event_id"],
             )
             summary = f"Cita Dental AI (Reprogramada): {phone}"
-            new_gcal = gcal_service.create_event(
+            new_gcal = await asyncio.to_thread(
+                gcal_service.create_event,
                 calendar_id=google_calendar_id,
                 summary=summary,
                 start_time=new_dt.isoformat(),
@@ -1320,6 +1379,7 @@ async def reschedule_appointment(original_date: str, new_date_time: str):
             sync_status,
             apt["id"],
         )
+        tool_cache.invalidate("appointments", tenant_id)
 
         # 5. Emitir evento Socket.IO (Actualizar UI)
         try:
@@ -1335,7 +1395,9 @@ async def reschedule_appointment(original_date: str, new_date_time: str):
                 apt["id"],
             )
             if updated_apt:
-                await sio.emit("APPOINTMENT_UPDATED", to_json_safe(dict(updated_apt)))
+                await emit_to_tenant(
+                    "APPOINTMENT_UPDATED", dict(updated_apt), tenant_id
+                )
         except Exception as se:
             logger.error(f"Error emitiendo APPOINTMENT_UPDATED via Socket: {se}")
 
@@ -1348,6 +1410,9 @@ async def reschedule_appointment(original_date: str, new_date_time: str):
 
 
 @tool
+@tool_cache.memoize(
+    ttl=TOOL_CACHE_CATALOG_TTL, topics=("professionals",), scope=_tenant_scope
+)
 async def list_professionals():
     """
     Lista los profesionales que trabajan en la clínica (odontólogos/as activos y aprobados).
@@ -1383,6 +1448,9 @@ async def list_professionals():
 
 
 @tool
+@tool_cache.memoize(
+    ttl=TOOL_CACHE_CATALOG_TTL, topics=("treatments",), scope=_tenant_scope
+)
 async def list_services(category: str = None):
     """
     Lista los tratamientos/servicios dentales disponibles para reservar en la clínica.
@@ -1438,16 +1506,13 @@ async def derivhumano(reason: str):
             tenant_id,
             phone,
         )
+        await conversation_cache.set_handoff(tenant_id, phone, True, override_until)
         logger.info(
             f"👤 Derivación humana solicitada para {phone} (tenant={tenant_id}): {reason}"
         )
-        from main import sio
-
-        await sio.emit(
+        await emit_to_tenant(
             "HUMAN_HANDOFF",
-            to_json_safe(
-                {"phone_number": phone, "tenant_id": tenant_id, "reason": reason}
-            ),
+            {"phone_number": phone, "tenant_id": tenant_id, "reason": reason},
         )
         patient = await db.pool.fetchrow(
             "SELECT first_name, last_name, email FROM patients WHERE tenant_id = $1 AND phone_number = $2",
@@ -1510,6 +1575,19 @@ DENTAL_TOOLS = [
     derivhumano,
 ]
 
+if AGENT_LLM_BACKEND == "fake":
+    # Solo en pruebas de carga: el módulo de loadtest no se importa en producción
+    from loadtest.fake_llm import simulate_tool_latency
+
+# Medición de duración por tool y clínica (orchestrator_tool_seconds)
+for _dental_tool in DENTAL_TOOLS:
+    if AGENT_LLM_BACKEND == "fake":
+        # Pruebas de carga: latencia simulada de servicios externos (FAKE_TOOL_LATENCY_MS)
+        simulate_tool_latency(_dental_tool)
+    # Paralelismo dentro de un paso: lecturas con tope de tiempo, escrituras de a una
+    bind_tool_concurrency(_dental_tool, mutating=_dental_tool.name in MUTATING_TOOLS)
+    instrument_tool(_dental_tool)
+
 
 # --- DETECCIÓN DE IDIOMA (para respuesta del agente) ---
 def detect_message_language(text: str) -> str:
@@ -2007,8 +2085,10 @@ Usá SOLO las tools proporcionadas.
 
 
 # --- AGENT SETUP (prompt dinámico: system_prompt se inyecta en cada invocación) ---
-def get_agent_executable():
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, openai_api_key=OPENAI_API_KEY)
+def get_agent_executable(llm=None):
+    """AgentExecutor con DENTAL_TOOLS sobre `llm` (por defecto el modelo de la ruta default)."""
+    if llm is None:
+        llm = build_routed_llm(AGENT_MODEL_DEFAULT, None)
     prompt = ChatPromptTemplate.from_messages(
         [
             ("system", "{system_prompt}"),
@@ -2018,10 +2098,14 @@ def get_agent_executable():
         ]
     )
     agent = create_openai_tools_agent(llm, DENTAL_TOOLS, prompt)
-    return AgentExecutor(agent=agent, tools=DENTAL_TOOLS, verbose=False)
+    # intermediate_steps: el router revisa errores de tools para escalar de modelo
+    return AgentExecutor(
+        agent=agent, tools=DENTAL_TOOLS, verbose=False, return_intermediate_steps=True
+    )
 
 
-agent_executor = get_agent_executable()
+# Ruteo de modelos por clínica (fast/default/strong + failover), ver model_router.py
+model_router = ModelRouter(get_agent_executable)
 
 # --- API ENDPOINTS ---
 
@@ -2033,11 +2117,23 @@ async def lifespan(app: FastAPI):
     logger.info("🚀 Iniciando orquestador dental...")
     await db.connect()
     logger.info("✅ Base de datos conectada")
+    inbound_deduplicator.start()
+    tool_cache.start()
+    llm_usage_recorder.start()
+    override_sweeper.start()
+    chat_archiver.start()
 
     yield
 
     # Shutdown
     logger.info("🔴 Cerrando orquestador dental...")
+    await override_sweeper.stop()
+    await chat_archiver.stop()
+    await socket_coalescer.flush_all()
+    await inbound_deduplicator.stop()
+    await tool_cache.stop()
+    await llm_usage_recorder.stop()
+    await conversation_cache.close()
     await db.disconnect()
     logger.info("✅ Desconexión completada")
 
@@ -2170,8 +2266,39 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cursor de keyset pagination legible desde el navegador
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+
+
+async def read_your_writes(request: Request, call_next):
+    """
+    Quien acaba de escribir (POST/PUT/PATCH/DELETE con éxito) lee del primario durante
+    DB_READ_YOUR_WRITES_SECONDS aunque la ruta use db.reader(). Clave = hash del Authorization;
+    la ventana se guarda en Redis, así vale aunque el próximo request caiga en otro worker.
+    """
+    auth = request.headers.get("authorization")
+    if not auth:
+        return await call_next(request)
+    key = hashlib.sha256(auth.encode("utf-8")).hexdigest()[:16]
+    writes = request.method not in ("GET", "HEAD", "OPTIONS")
+    key_token = current_read_key.set(key)
+    sticky_token = current_read_sticky.set(not writes and await db.wrote_recently(key))
+    try:
+        response = await call_next(request)
+    finally:
+        current_read_sticky.reset(sticky_token)
+        current_read_key.reset(key_token)
+    if writes and response.status_code < 400:
+        await db.mark_write(key)
+    return response
+
+
+# Sin réplica no hay nada que enrutar: no se paga el middleware
+if POSTGRES_REPLICA_DSN:
+    app.middleware("http")(read_your_writes)
+
 # --- RUTAS ---
 app.include_router(auth_router)
 app.include_router(admin_router)
@@ -2210,14 +2337,42 @@ app.openapi = _custom_openapi
 
 # --- SOCKET.IO CONFIGURATION ---
 # Create Socket.IO instance with async mode
-sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins=origins)
+# Con REDIS_URL los eventos se reparten entre workers/réplicas vía Redis (ver realtime.py)
+sio = socketio.AsyncServer(
+    async_mode="asgi",
+    cors_allowed_origins=origins,
+    client_manager=build_client_manager(),
+)
 socket_app = socketio.ASGIApp(sio, app)
+# Los eventos al dashboard se agrupan por sala en frames (ver CoalescingEmitter)
+socket_coalescer = CoalescingEmitter(sio.emit)
+
+
+def _socket_token(environ: Dict[str, Any], auth: Optional[Dict[str, Any]]) -> Optional[str]:
+    """JWT del dashboard: auth.token (socket.io-client), header Authorization o ?token=."""
+    if isinstance(auth, dict) and auth.get("token"):
+        return auth["token"]
+    header = environ.get("HTTP_AUTHORIZATION") or ""
+    if header.startswith("Bearer "):
+        return header.split(" ", 1)[1]
+    query = parse_qs(environ.get("QUERY_STRING") or "")
+    return (query.get("token") or [None])[0]
 
 
 # Socket.IO event handlers
 @sio.event
-async def connect(sid, environ):
-    logger.info(f"🔌 Client connected: {sid}")
+async def connect(sid, environ, auth=None):
+    """Solo dashboards autenticados; cada socket entra a las salas tenant:{id} que puede ver."""
+    token = _socket_token(environ, auth)
+    user_data = auth_service.decode_token(token) if token else None
+    if not user_data or user_data.role not in ("ceo", "secretary", "professional"):
+        logger.warning(f"🔌 Socket rechazado (sin JWT válido): {sid}")
+        raise socketio.exceptions.ConnectionRefusedError("unauthorized")
+
+    tenant_ids = await get_allowed_tenant_ids(user_data)
+    for tid in tenant_ids:
+        await sio.enter_room(sid, tenant_room(tid))
+    logger.info(f"🔌 Client connected: {sid} rooms={tenant_ids}")
 
 
 @sio.event
@@ -2225,22 +2380,132 @@ async def disconnect(sid):
     logger.info(f"🔌 Client disconnected: {sid}")
 
 
-# Helper function to emit appointment events (can be imported by admin_routes)
-async def emit_appointment_event(event_type: str, data: Dict[str, Any]):
-    """Emit appointment-related events to all connected clients. Serializa a JSON-safe para evitar fallos por UUID/datetime."""
+async def emit_to_tenant(event_type: str, data: Any, tenant_id: Optional[int] = None):
+    """
+    Emite un evento solo a la sala de la clínica (tenant_id explícito o data["tenant_id"]).
+    Serializa a JSON-safe para evitar fallos por UUID/datetime. El envío pasa por
+    socket_coalescer: los eventos de una misma ráfaga viajan juntos como EVENT_BATCH.
+    """
+    if tenant_id is None and isinstance(data, dict):
+        tenant_id = data.get("tenant_id")
     payload = to_json_safe(data) if data else data
-    await sio.emit(event_type, payload)
-    logger.info(f"📡 Socket event emitted: {event_type}")
+    if tenant_id is None:
+        # Sin clínica no hay sala: no se difunde a todas las clínicas
+        logger.warning(f"📡 Socket event {event_type} sin tenant_id; no se emite")
+        return
+    room = tenant_room(tenant_id)
+    await socket_coalescer.emit(room, event_type, payload)
+    SOCKET_EMITS.labels(event=event_type, room=room).inc()
+    logger.info(f"📡 Socket event queued: {event_type} room={room}")
+
+
+async def emit_frame_to_tenant(tenant_id: int, events: List[tuple]):
+    """Varios eventos a la sala de la clínica en un solo frame (avisos en lote de jobs)."""
+    room = tenant_room(tenant_id)
+    await socket_coalescer.emit_frame(
+        room, [(event_type, to_json_safe(data)) for event_type, data in events]
+    )
+    for event_type, _ in events:
+        SOCKET_EMITS.labels(event=event_type, room=room).inc()
+
+
+# Reactivación de la IA cuando vence human_override_until (fuera del camino de /chat)
+override_sweeper = OverrideSweeper(emit_frame_to_tenant)
+
+
+# Helper function to emit appointment events (can be imported by admin_routes)
+async def emit_appointment_event(
+    event_type: str, data: Dict[str, Any], tenant_id: Optional[int] = None
+):
+    """Emit appointment-related events to the clinic room (ver emit_to_tenant)."""
+    await emit_to_tenant(event_type, data, tenant_id)
 
 
 # Make the emit function available to other modules
 app.state.emit_appointment_event = emit_appointment_event
 
 
+async def run_agent_turn(req: ChatRequest, tenant_id: int, detected_lang: str) -> str:
+    """Turno completo del agente LLM: historial + system prompt dinámico + model_router."""
+    # 2. Cargar historial compacto: resumen acumulado + últimos mensajes (misma clínica)
+    summary, chat_history = await conversation_memory.load_context(
+        req.final_phone, tenant_id
+    )
+
+    if (
+        chat_history
+        and chat_history[-1]["content"] == req.final_message
+        and chat_history[-1]["role"] == "user"
+    ):
+        chat_history.pop()
+
+    messages = []
+    if summary:
+        messages.append(
+            SystemMessage(
+                content=f"Resumen de la conversación previa con este paciente:\n{summary}"
+            )
+        )
+    for msg in chat_history:
+        if msg["role"] == "user":
+            messages.append(HumanMessage(content=msg["content"]))
+        else:
+            messages.append(AIMessage(content=msg["content"]))
+
+    # 2b. Obtener nombre de la clínica del tenant (prompt agnóstico)
+    tenant_row = await db.pool.fetchrow(
+        "SELECT clinic_name, config FROM tenants WHERE id = $1", tenant_id
+    )
+    clinic_name = (
+        (tenant_row["clinic_name"] or CLINIC_NAME) if tenant_row else CLINIC_NAME
+    )
+
+    # 3. Construir system prompt dinámico (clínica + idioma) e invocar agente
+    now = get_now_arg()
+    dias_semana = [
+        "Lunes",
+        "Martes",
+        "Miércoles",
+        "Jueves",
+        "Viernes",
+        "Sábado",
+        "Domingo",
+    ]
+    nombre_dia = dias_semana[now.weekday()]
+    current_time_str = f"{nombre_dia} {now.strftime('%d/%m/%Y %H:%M')}"
+    system_prompt = build_system_prompt(
+        clinic_name=clinic_name,
+        current_time=current_time_str,
+        response_language=detected_lang,
+        hours_start=CLINIC_HOURS_START,
+        hours_end=CLINIC_HOURS_END,
+    )
+    lap("history_load")
+
+    begin_agent_turn()
+    output = await model_router.run(
+        {
+            "input": req.final_message,
+            "chat_history": messages,
+            "system_prompt": system_prompt,
+        },
+        req.final_message,
+        tenant_id,
+        tenant_row["config"] if tenant_row else None,
+    )
+
+    lap("agent")
+
+    return output
+
+
 @app.post("/chat", tags=["Chat IA"])
 async def chat_endpoint(req: ChatRequest):
     """Endpoint de chat que persiste historial en BD. Usado por WhatsApp Service y pruebas."""
     correlation_id = str(uuid.uuid4())
+    # Cronómetro por etapas (orchestrator_chat_stage_seconds, exemplar = correlation_id)
+    stage_timer = StageTimer(correlation_id)
+    current_stage_timer.set(stage_timer)
     # Log visible en cualquier nivel (WARNING) para diagnosticar si las peticiones llegan al orchestrator
     logger.warning(
         f"📩 CHAT received from={getattr(req, 'from_number', None) or getattr(req, 'phone', None)} to={getattr(req, 'to_number', None)} msg_preview={(req.final_message or '')[:60]!r}"
@@ -2261,6 +2526,7 @@ async def chat_endpoint(req: ChatRequest):
             )
     except Exception as track_err:
         logger.debug(f"Demo tracking skip: {track_err}")
+    lap("demo_tracking")
 
     current_customer_phone.set(req.final_phone)
     # 0. RESOLUCIÓN DINÁMICA DE TENANT (Soberanía Nexus v7.6)
@@ -2292,7 +2558,33 @@ async def chat_endpoint(req: ChatRequest):
     )
 
     current_tenant_id.set(tenant_id)
+    stage_timer.tenant_id = tenant_id
+    lap("tenant_resolution")
+
+    # 0. ADMISIÓN) Cupo global + por clínica; si no hay cupo se rechaza antes de tocar BD
+    # (sin dedup ni historial escritos) para que el WhatsApp Service reintente tras retry_after
+    try:
+        async with admission_controller.slot(tenant_id):
+            return await process_chat_turn(req, tenant_id, correlation_id)
+    except AdmissionRejected as rejected:
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": str(rejected.retry_after)},
+            content={
+                "status": "busy",
+                "send": False,
+                "reason": rejected.reason,
+                "retry_after": rejected.retry_after,
+                "correlation_id": correlation_id,
+            },
+        )
+    finally:
+        stage_timer.finish()
+
 
+async def process_chat_turn(req: ChatRequest, tenant_id: int, correlation_id: str):
+    """Procesa un turno ya admitido: dedup, persistencia, handoff, fast-path o agente."""
+    lap("admission_wait")
     # 0. DEDUP) Si el mensaje viene con provider_message_id (ej. WhatsApp/YCloud), procesar solo una vez
     provider = (req.provider or "ycloud").strip() or "ycloud"
     provider_message_id = (req.provider_message_id or req.event_id or "").strip()
@@ -2303,7 +2595,7 @@ async def chat_endpoint(req: ChatRequest):
                 "to_number": getattr(req, "to_number", None),
                 "text": req.final_message[:500] if req.final_message else None,
             }
-            inserted = await db.try_insert_inbound(
+            inserted = await inbound_deduplicator.claim(
                 provider=provider,
                 provider_message_id=provider_message_id,
                 event_id=(req.event_id or provider_message_id),
@@ -2326,169 +2618,102 @@ async def chat_endpoint(req: ChatRequest):
             logger.warning(
                 f"📩 CHAT dedup check failed (processing anyway): {dedup_err}"
             )
+    lap("dedup")
 
     # 0. A) Ensure patient reference exists
     try:
         await db.ensure_patient_exists(req.final_phone, tenant_id, req.final_name)
 
         # 1. Guardar mensaje del usuario PRIMERO (para no perderlo si hay error)
-        await db.append_chat_message(
+        await conversation_cache.append_message(
             from_number=req.final_phone,
             role="user",
             content=req.final_message,
             correlation_id=correlation_id,
             tenant_id=tenant_id,
         )
+        lap("persist_user")
 
         # --- Notificar al Frontend (Real-time) ---
-        await sio.emit(
+        await emit_to_tenant(
             "NEW_MESSAGE",
-            to_json_safe(
-                {
-                    "phone_number": req.final_phone,
-                    "tenant_id": tenant_id,
-                    "message": req.final_message,
-                    "role": "user",
-                }
-            ),
+            {
+                "phone_number": req.final_phone,
+                "tenant_id": tenant_id,
+                "message": req.final_message,
+                "role": "user",
+            },
         )
+        lap("socket_emit")
         # -----------------------------------------
 
         # 0. B) Verificar si hay intervención humana activa
-        handoff_check = await db.pool.fetchrow(
-            """
-            SELECT human_handoff_requested, human_override_until
-            FROM patients
-            WHERE tenant_id = $1 AND phone_number = $2
-        """,
-            tenant_id,
-            req.final_phone,
-        )
+        # (estado caliente en Redis; ver conversation_cache.py)
+        handoff_check = await conversation_cache.get_handoff(tenant_id, req.final_phone)
 
-        if handoff_check:
-            is_handoff_active = handoff_check["human_handoff_requested"]
+        # Solo lectura: el barrido periódico (override_sweeper.py) limpia los overrides vencidos.
+        # Hasta que pase, un override vencido ya no silencia (se compara contra la hora actual).
+        if handoff_check and handoff_check["human_handoff_requested"]:
             override_until = handoff_check["human_override_until"]
+            if override_until and override_until.tzinfo is None:
+                # Guardado como UTC naive (datos viejos)
+                override_until = override_until.replace(tzinfo=timezone.utc)
+            if override_until and override_until > datetime.now(timezone.utc):
+                logger.info(
+                    f"🔇 IA silenciada para {req.final_phone} hasta {override_until}"
+                )
+                # Ya guardamos el mensaje arriba, solo retornamos silencio
+                return {
+                    "output": "",  # Sin respuesta
+                    "correlation_id": correlation_id,
+                    "status": "silenced",
+                    "reason": "human_intervention_active",
+                }
+        lap("handoff_check")
 
-            # Si hay override activo y no ha expirado, la IA permanece silenciosa
-            if is_handoff_active and override_until:
-                # Fix: Robust comparison (Normalize to UTC)
-                now_utc = datetime.now(timezone.utc)
-
-                # Ensure override_until is aware
-                if override_until.tzinfo is None:
-                    # Assume stored as naive UTC (or local, but safe fallback to UTC)
-                    override_until = override_until.replace(tzinfo=timezone.utc)
-                else:
-                    override_until = override_until.astimezone(timezone.utc)
-
-                if override_until > now_utc:
-                    logger.info(
-                        f"🔇 IA silenciada para {req.final_phone} hasta {override_until}"
-                    )
-                    # Ya guardamos el mensaje arriba, solo retornamos silencio
-                    return {
-                        "output": "",  # Sin respuesta
-                        "correlation_id": correlation_id,
-                        "status": "silenced",
-                        "reason": "human_intervention_active",
-                    }
-                else:
-                    # Override expirado, limpiar flags
-                    await db.pool.execute(
-                        """
-                        UPDATE patients
-                        SET human_handoff_requested = FALSE,
-                            human_override_until = NULL
-                        WHERE tenant_id = $1 AND phone_number = $2
-                    """,
-                        tenant_id,
-                        req.final_phone,
-                    )
-
-        # 2. Cargar historial de BD (últimos 20 mensajes, misma clínica)
-        chat_history = await db.get_chat_history(
-            req.final_phone, limit=20, tenant_id=tenant_id
-        )
-
-        if (
-            chat_history
-            and chat_history[-1]["content"] == req.final_message
-            and chat_history[-1]["role"] == "user"
-        ):
-            chat_history.pop()
-
-        messages = []
-        for msg in chat_history:
-            if msg["role"] == "user":
-                messages.append(HumanMessage(content=msg["content"]))
-            else:
-                messages.append(AIMessage(content=msg["content"]))
-
-        # 2b. Obtener nombre de la clínica del tenant (prompt agnóstico)
-        tenant_row = await db.pool.fetchrow(
-            "SELECT clinic_name FROM tenants WHERE id = $1", tenant_id
-        )
-        clinic_name = (
-            (tenant_row["clinic_name"] or CLINIC_NAME) if tenant_row else CLINIC_NAME
-        )
-
-        # 2c. Detectar idioma del mensaje para responder en el mismo idioma
+        # 2. Detectar idioma del mensaje para responder en el mismo idioma
         detected_lang = detect_message_language(req.final_message)
 
-        # 3. Construir system prompt dinámico (clínica + idioma) e invocar agente
-        now = get_now_arg()
-        dias_semana = [
-            "Lunes",
-            "Martes",
-            "Miércoles",
-            "Jueves",
-            "Viernes",
-            "Sábado",
-            "Domingo",
-        ]
-        nombre_dia = dias_semana[now.weekday()]
-        current_time_str = f"{nombre_dia} {now.strftime('%d/%m/%Y %H:%M')}"
-        system_prompt = build_system_prompt(
-            clinic_name=clinic_name,
-            current_time=current_time_str,
-            response_language=detected_lang,
-            hours_start=CLINIC_HOURS_START,
-            hours_end=CLINIC_HOURS_END,
-        )
-
-        response = await agent_executor.ainvoke(
-            {
-                "input": req.final_message,
-                "chat_history": messages,
-                "system_prompt": system_prompt,
-            }
-        )
-
-        assistant_response = response.get("output", "Error procesando respuesta")
+        # 3. Fast-path determinístico (sin LLM) para intenciones de alta confianza; si no, agente
+        assistant_response = None
+        if not req.media:
+            assistant_response = await fast_path_router.try_handle(
+                req.final_message, detected_lang, {t.name: t for t in DENTAL_TOOLS}
+            )
+        lap("fast_path")
+        if assistant_response is None:
+            agent_started = time.perf_counter()
+            assistant_response = await run_agent_turn(req, tenant_id, detected_lang)
+            fast_path_router.record_agent_latency(
+                (time.perf_counter() - agent_started) * 1000
+            )
 
         # 4. Guardar respuesta del asistente
-        await db.append_chat_message(
+        await conversation_cache.append_message(
             from_number=req.final_phone,
             role="assistant",
             content=assistant_response,
             correlation_id=correlation_id,
             tenant_id=tenant_id,
         )
+        lap("persist_assistant")
 
         # --- Notificar al Frontend (Real-time AI) ---
-        await sio.emit(
+        await emit_to_tenant(
             "NEW_MESSAGE",
-            to_json_safe(
-                {
-                    "phone_number": req.final_phone,
-                    "tenant_id": tenant_id,
-                    "message": assistant_response,
-                    "role": "assistant",
-                }
-            ),
+            {
+                "phone_number": req.final_phone,
+                "tenant_id": tenant_id,
+                "message": assistant_response,
+                "role": "assistant",
+            },
         )
+        lap("socket_emit")
         # --------------------------------------------
 
+        # Compactar historial en segundo plano (resumen acumulado fuera de la ventana reciente)
+        conversation_memory.schedule_summary(req.final_phone, tenant_id)
+
         logger.info(
             f"✅ Chat procesado para {req.final_phone} (correlation_id={correlation_id})"
         )
@@ -2502,7 +2727,7 @@ async def chat_endpoint(req: ChatRequest):
 
     except Exception as e:
         logger.exception(f"❌ Error en chat para {req.final_phone}: {e}")
-        await db.append_chat_message(
+        await conversation_cache.append_message(
             from_number=req.final_phone,
             role="system",
             content=f"Error interno: {str(e)}",
@@ -2524,6 +2749,19 @@ async def health():
     return {"status": "ok", "service": "dental-orchestrator"}
 
 
+@app.get("/metrics", tags=["Health"])
+async def metrics(request: Request):
+    """
+    Métricas Prometheus: etapas de /chat, tools, LLM, espera del pool y admisión.
+    Con Accept OpenMetrics se incluyen exemplars con el correlation_id.
+    """
+    if "application/openmetrics-text" in request.headers.get("accept", ""):
+        return Response(
+            content=openmetrics_latest(REGISTRY), media_type=OPENMETRICS_CONTENT_TYPE
+        )
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 if __name__ == "__main__":
     import uvicorn
 
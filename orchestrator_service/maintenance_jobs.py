@@ -0,0 +1,265 @@
+import logging
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from prometheus_client import Counter
+
+from db import db
+from schema_capabilities import schema_capabilities
+
+logger = logging.getLogger("maintenance_jobs")
+
+# Filas por lote: cada lote es una sentencia y una transacción cortas
+MAINTENANCE_BATCH_SIZE = int(os.getenv("MAINTENANCE_BATCH_SIZE", "1000"))
+
+MAINTENANCE_ROWS = Counter(
+    "orchestrator_maintenance_rows_changed_total",
+    "Filas corregidas por los trabajos de mantenimiento",
+    ["job"],
+)
+
+# (filas revisadas, filas cambiadas, cursor siguiente o None si terminó)
+ChunkResult = Tuple[int, int, Any]
+
+
+class MaintenanceJob(ABC):
+    """
+    Reparación de datos idempotente: run_chunk corrige un lote con una sola sentencia
+    (sin bucles fila a fila) y devuelve el cursor keyset desde donde sigue el próximo lote.
+    Correrlo de nuevo sobre datos ya reparados no cambia nada.
+    """
+
+    name = ""
+    description = ""
+    initial_cursor: Any = None
+
+    def available(self) -> bool:
+        return True
+
+    @abstractmethod
+    async def run_chunk(self, conn, cursor: Any, batch_size: int) -> ChunkResult:
+        """Procesa un lote desde `cursor` dentro de la transacción abierta por el runner."""
+
+
+class BackfillChatTenantJob(MaintenanceJob):
+    name = "backfill_chat_tenant"
+    description = (
+        "chat_messages sin tenant_id: toma la clínica del paciente con ese teléfono "
+        "(si es una sola) o la única clínica del sistema; los ambiguos quedan sin tocar"
+    )
+    initial_cursor = 0
+
+    def available(self) -> bool:
+        return schema_capabilities.has_chat_tenant_id
+
+    async def run_chunk(self, conn, cursor: int, batch_size: int) -> ChunkResult:
+        row = await conn.fetchrow(
+            """
+            WITH batch AS (
+                SELECT id, created_at, from_number FROM chat_messages
+                WHERE tenant_id IS NULL AND id > $1
+                ORDER BY id LIMIT $2
+            ), owners AS (
+                SELECT phone_number, MIN(tenant_id) AS tenant_id FROM patients
+                WHERE phone_number IN (SELECT from_number FROM batch)
+                GROUP BY phone_number
+                HAVING COUNT(DISTINCT tenant_id) = 1
+            ), only_tenant AS (
+                SELECT MIN(id) AS tenant_id FROM tenants HAVING COUNT(*) = 1
+            ), updated AS (
+                UPDATE chat_messages m SET tenant_id = COALESCE(o.tenant_id, t.tenant_id)
+                FROM batch b
+                LEFT JOIN owners o ON o.phone_number = b.from_number
+                LEFT JOIN only_tenant t ON TRUE
+                WHERE m.id = b.id AND m.created_at = b.created_at
+                  AND COALESCE(o.tenant_id, t.tenant_id) IS NOT NULL
+                RETURNING 1
+            )
+            SELECT (SELECT COUNT(*) FROM batch) AS scanned,
+                   (SELECT COUNT(*) FROM updated) AS changed,
+                   (SELECT MAX(id) FROM batch) AS last_id
+            """,
+            cursor,
+            batch_size,
+        )
+        done = row["scanned"] < batch_size
+        return row["scanned"], row["changed"], None if done else row["last_id"]
+
+
+class OrphanedChatsJob(MaintenanceJob):
+    name = "orphaned_chats"
+    description = "Crea la ficha 'guest' de cada teléfono con mensajes y sin paciente en su clínica"
+    initial_cursor = (0, "")
+
+    def available(self) -> bool:
+        return schema_capabilities.has_chat_tenant_id
+
+    async def run_chunk(self, conn, cursor: Tuple[int, str], batch_size: int) -> ChunkResult:
+        # Mismo criterio que ensure_patient_exists: la ficha es por (tenant_id, phone_number)
+        row = await conn.fetchrow(
+            """
+            WITH orphans AS (
+                SELECT DISTINCT m.tenant_id, m.from_number FROM chat_messages m
+                WHERE (m.tenant_id, m.from_number) > ($1::int, $2::text)
+                  AND m.from_number IS NOT NULL AND m.from_number <> ''
+                  AND NOT EXISTS (
+                      SELECT 1 FROM patients p
+                      WHERE p.tenant_id = m.tenant_id AND p.phone_number = m.from_number
+                  )
+                ORDER BY m.tenant_id, m.from_number LIMIT $3
+            ), inserted AS (
+                INSERT INTO patients (tenant_id, phone_number, first_name, status, created_at)
+                SELECT tenant_id, from_number, 'Visitante', 'guest', NOW() FROM orphans
+                ON CONFLICT (tenant_id, phone_number) DO NOTHING
+                RETURNING 1
+            ), last_key AS (
+                SELECT tenant_id, from_number FROM orphans
+                ORDER BY tenant_id DESC, from_number DESC LIMIT 1
+            )
+            SELECT (SELECT COUNT(*) FROM orphans) AS scanned,
+                   (SELECT COUNT(*) FROM inserted) AS changed,
+                   (SELECT tenant_id FROM last_key) AS last_tenant,
+                   (SELECT from_number FROM last_key) AS last_phone
+            """,
+            cursor[0],
+            cursor[1],
+            batch_size,
+        )
+        done = row["scanned"] < batch_size
+        next_cursor = None if done else (row["last_tenant"], row["last_phone"])
+        return row["scanned"], row["changed"], next_cursor
+
+
+class PlanTotalsJob(MaintenanceJob):
+    name = "plan_totals"
+    description = (
+        "Recalcula treatment_plans.estimated_total como la suma de "
+        "COALESCE(approved_price, estimated_price) de los ítems no cancelados"
+    )
+    initial_cursor = uuid.UUID(int=0)
+
+    async def run_chunk(self, conn, cursor: uuid.UUID, batch_size: int) -> ChunkResult:
+        row = await conn.fetchrow(
+            """
+            WITH batch AS (
+                SELECT id, tenant_id FROM treatment_plans
+                WHERE id > $1 ORDER BY id LIMIT $2
+            ), totals AS (
+                SELECT b.id,
+                       COALESCE(SUM(COALESCE(i.approved_price, i.estimated_price))
+                                FILTER (WHERE i.status != 'cancelled'), 0) AS total
+                FROM batch b
+                LEFT JOIN treatment_plan_items i ON i.plan_id = b.id AND i.tenant_id = b.tenant_id
+                GROUP BY b.id
+            ), updated AS (
+                UPDATE treatment_plans tp SET estimated_total = t.total, updated_at = NOW()
+                FROM totals t
+                WHERE tp.id = t.id AND tp.estimated_total IS DISTINCT FROM t.total
+                RETURNING 1
+            )
+            SELECT (SELECT COUNT(*) FROM batch) AS scanned,
+                   (SELECT COUNT(*) FROM updated) AS changed,
+                   (SELECT id FROM batch ORDER BY id DESC LIMIT 1) AS last_id
+            """,
+            cursor,
+            batch_size,
+        )
+        done = row["scanned"] < batch_size
+        return row["scanned"], row["changed"], None if done else row["last_id"]
+
+
+# En orden de ejecución: los chats huérfanos necesitan el tenant_id ya completado
+JOBS: Dict[str, MaintenanceJob] = {
+    job.name: job for job in (BackfillChatTenantJob(), OrphanedChatsJob(), PlanTotalsJob())
+}
+
+
+class MaintenanceRunner:
+    """
+    Ejecuta trabajos de JOBS lote a lote, cada lote en su propia transacción (los locks
+    duran lo que una sentencia). Un advisory lock por trabajo evita dos corridas a la vez.
+    """
+
+    async def run(
+        self,
+        name: str,
+        batch_size: int = MAINTENANCE_BATCH_SIZE,
+        dry_run: bool = False,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        job = JOBS[name]
+        result: Dict[str, Any] = {
+            "job": name,
+            "status": "ok",
+            "dry_run": dry_run,
+            "chunks": 0,
+            "scanned": 0,
+            "changed": 0,
+            "seconds": 0.0,
+        }
+        if not job.available():
+            result["status"] = "skipped"
+            logger.warning(f"⏭️ Mantenimiento {name}: el esquema no lo soporta, se omite")
+            return result
+
+        started = time.perf_counter()
+        lock_key = f"maintenance:{name}"
+        async with db.pool.acquire() as conn:
+            if not await conn.fetchval("SELECT pg_try_advisory_lock(hashtext($1))", lock_key):
+                result["status"] = "locked"
+                return result
+            try:
+                cursor = job.initial_cursor
+                while True:
+                    tx = conn.transaction()
+                    await tx.start()
+                    try:
+                        scanned, changed, cursor = await job.run_chunk(conn, cursor, batch_size)
+                    except BaseException:
+                        await tx.rollback()
+                        raise
+                    # dry-run: el lote se ejecuta de verdad y se revierte, así el conteo es real
+                    if dry_run:
+                        await tx.rollback()
+                    else:
+                        await tx.commit()
+                        MAINTENANCE_ROWS.labels(job=name).inc(changed)
+
+                    result["chunks"] += 1
+                    result["scanned"] += scanned
+                    result["changed"] += changed
+                    result["seconds"] = round(time.perf_counter() - started, 3)
+                    if on_progress is not None:
+                        on_progress(dict(result))
+                    if cursor is None:
+                        break
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock(hashtext($1))", lock_key)
+
+        logger.info(
+            f"🛠️ Mantenimiento {name}: {result['changed']}/{result['scanned']} filas "
+            f"en {result['chunks']} lotes ({result['seconds']}s){' [dry-run]' if dry_run else ''}"
+        )
+        return result
+
+    async def run_all(
+        self,
+        names: Optional[Iterable[str]] = None,
+        batch_size: int = MAINTENANCE_BATCH_SIZE,
+        dry_run: bool = False,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Corre los trabajos pedidos (o todos) respetando el orden de JOBS."""
+        selected = set(names) if names else set(JOBS)
+        return [
+            await self.run(name, batch_size, dry_run, on_progress)
+            for name in JOBS
+            if name in selected
+        ]
+
+
+# Instancia global para importar fácilmente
+maintenance_runner = MaintenanceRunner()
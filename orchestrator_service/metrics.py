@@ -0,0 +1,245 @@
+import functools
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger("metrics")
+
+# Buckets pensados para un turno de chat (ms de BD hasta decenas de segundos de LLM)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60)
+ACQUIRE_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+CHAT_STAGE_SECONDS = Histogram(
+    "orchestrator_chat_stage_seconds",
+    "Duración de cada etapa de /chat",
+    ["stage", "tenant_id"],
+    buckets=LATENCY_BUCKETS,
+)
+TOOL_SECONDS = Histogram(
+    "orchestrator_tool_seconds",
+    "Duración de cada tool del agente (DENTAL_TOOLS)",
+    ["tool", "tenant_id", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_CALL_SECONDS = Histogram(
+    "orchestrator_llm_call_seconds",
+    "Duración de cada llamada al LLM",
+    ["model", "tenant_id"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "orchestrator_llm_tokens_total",
+    "Tokens consumidos por llamadas al LLM",
+    ["model", "tenant_id", "kind"],
+)
+DB_POOL_ACQUIRE_SECONDS = Histogram(
+    "orchestrator_db_pool_acquire_seconds",
+    "Espera para obtener una conexión del pool asyncpg",
+    ["tenant_id"],
+    buckets=ACQUIRE_BUCKETS,
+)
+DB_QUERIES = Counter(
+    "orchestrator_db_queries_total",
+    "Consultas ejecutadas en conexiones del pool",
+    ["tenant_id"],
+)
+DB_POOL_SIZE = Gauge("orchestrator_db_pool_size", "Conexiones abiertas en el pool")
+DB_POOL_IN_USE = Gauge("orchestrator_db_pool_in_use", "Conexiones del pool en uso")
+DB_POOL_MAX = Gauge("orchestrator_db_pool_max_size", "Tope de conexiones del pool (DB_POOL_MAX_SIZE)")
+DB_READ_ROUTES = Counter(
+    "orchestrator_db_read_routes_total",
+    "Lecturas enrutables (db.reader) por destino y motivo",
+    ["target", "reason"],
+)
+DB_REPLICA_LAG = Gauge(
+    "orchestrator_db_replica_lag_seconds", "Retraso de replicación medido en la réplica de lectura"
+)
+SOCKET_EMITS = Counter(
+    "orchestrator_socket_emits_total",
+    "Eventos Socket.IO emitidos por sala de clínica",
+    ["event", "room"],
+)
+SOCKET_FRAMES = Counter(
+    "orchestrator_socket_frames_total",
+    "Mensajes Socket.IO enviados a las salas (single = evento suelto, batch = EVENT_BATCH)",
+    ["kind"],
+)
+SOCKET_COALESCED = Counter(
+    "orchestrator_socket_events_coalesced_total",
+    "Eventos de estado fusionados con uno anterior del mismo frame (no viajan por separado)",
+    ["event"],
+)
+
+
+class StageTimer:
+    """
+    Cronómetro por request: cada lap() registra el tiempo desde la marca anterior
+    como una etapa del histograma (con correlation_id como exemplar).
+    """
+
+    def __init__(self, correlation_id: str, tenant_id: Optional[int] = None):
+        self.correlation_id = correlation_id
+        self.tenant_id = tenant_id
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.stages: Dict[str, float] = {}
+
+    @property
+    def tenant_label(self) -> str:
+        return str(self.tenant_id) if self.tenant_id is not None else "unknown"
+
+    def lap(self, stage: str) -> float:
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self._last = now
+        self.stages[stage] = self.stages.get(stage, 0.0) + elapsed
+        observe(CHAT_STAGE_SECONDS.labels(stage=stage, tenant_id=self.tenant_label), elapsed)
+        return elapsed
+
+    def finish(self):
+        total = time.perf_counter() - self.started
+        observe(CHAT_STAGE_SECONDS.labels(stage="total", tenant_id=self.tenant_label), total)
+        logger.info(
+            f"⏱️ chat stages correlation_id={self.correlation_id} tenant_id={self.tenant_label} "
+            f"total={total * 1000:.0f}ms "
+            + " ".join(f"{k}={v * 1000:.0f}ms" for k, v in self.stages.items())
+        )
+
+
+current_stage_timer: ContextVar[Optional[StageTimer]] = ContextVar(
+    "current_stage_timer", default=None
+)
+
+
+def observe(metric, value: float):
+    """Observa con correlation_id como exemplar si hay un request en curso."""
+    timer = current_stage_timer.get()
+    if timer is not None:
+        try:
+            metric.observe(value, exemplar={"correlation_id": timer.correlation_id})
+            return
+        except Exception:
+            pass
+    metric.observe(value)
+
+
+def lap(stage: str):
+    """Marca el fin de una etapa del request actual (no-op fuera de /chat)."""
+    timer = current_stage_timer.get()
+    if timer is not None:
+        timer.lap(stage)
+
+
+def current_tenant_label() -> str:
+    timer = current_stage_timer.get()
+    return timer.tenant_label if timer is not None else "none"
+
+
+def instrument_tool(tool_obj):
+    """Envuelve la corrutina de una tool de LangChain para medir su duración por clínica."""
+    coroutine = getattr(tool_obj, "coroutine", None)
+    if coroutine is None or getattr(coroutine, "_instrumented", False):
+        return tool_obj
+    name = tool_obj.name
+
+    @functools.wraps(coroutine)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            result = await coroutine(*args, **kwargs)
+            if isinstance(result, str) and result.startswith("⚠️"):
+                status = "error"
+            return result
+        except Exception:
+            status = "exception"
+            raise
+        finally:
+            observe(
+                TOOL_SECONDS.labels(tool=name, tenant_id=current_tenant_label(), status=status),
+                time.perf_counter() - started,
+            )
+
+    wrapper._instrumented = True
+    tool_obj.coroutine = wrapper
+    return tool_obj
+
+
+def instrument_pool(pool, gauges: bool = True):
+    """
+    Mide la espera de Pool.acquire (incluye fetch/execute directos sobre el pool).
+    gauges=False para pools secundarios (réplica): los gauges de tamaño son del primario.
+    """
+    original = getattr(pool, "_acquire", None)
+    if original is None or getattr(original, "_instrumented", False):
+        return pool
+
+    @functools.wraps(original)
+    async def timed_acquire(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await original(*args, **kwargs)
+        finally:
+            observe(
+                DB_POOL_ACQUIRE_SECONDS.labels(tenant_id=current_tenant_label()),
+                time.perf_counter() - started,
+            )
+
+    timed_acquire._instrumented = True
+    pool._acquire = timed_acquire
+    if not gauges:
+        return pool
+    DB_POOL_SIZE.set_function(pool.get_size)
+    DB_POOL_IN_USE.set_function(lambda: pool.get_size() - pool.get_idle_size())
+    DB_POOL_MAX.set_function(pool.get_max_size)
+    return pool
+
+
+def _count_query(record):
+    DB_QUERIES.labels(tenant_id=current_tenant_label()).inc()
+
+
+async def init_connection_metrics(conn):
+    """init= de asyncpg.create_pool: cuenta cada consulta de la conexión."""
+    conn.add_query_logger(_count_query)
+
+
+class LLMMetricsCallback(AsyncCallbackHandler):
+    """Callback de LangChain: duración y tokens de cada llamada al modelo."""
+
+    def __init__(self):
+        self._starts: Dict[Any, float] = {}
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    async def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._starts.pop(run_id, None)
+        llm_output = getattr(response, "llm_output", None) or {}
+        model = llm_output.get("model_name") or "unknown"
+        tenant = current_tenant_label()
+        if started is not None:
+            observe(
+                LLM_CALL_SECONDS.labels(model=model, tenant_id=tenant),
+                time.perf_counter() - started,
+            )
+        usage = llm_output.get("token_usage") or {}
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if usage.get(kind):
+                LLM_TOKENS.labels(model=model, tenant_id=tenant, kind=kind.split("_")[0]).inc(
+                    usage[kind]
+                )
+
+    async def on_llm_error(self, error, *, run_id, **kwargs):
+        self._starts.pop(run_id, None)
+
+
+# Instancia global para importar fácilmente
+llm_metrics_callback = LLMMetricsCallback()
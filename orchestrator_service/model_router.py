@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from prometheus_client import Counter, Histogram
+
+from llm_usage import UsageCollector, llm_usage_recorder
+from metrics import LATENCY_BUCKETS, current_stage_timer, llm_metrics_callback, observe
+
+logger = logging.getLogger("model_router")
+
+AGENT_ROUTING_ENABLED = os.getenv("AGENT_ROUTING_ENABLED", "true").lower() == "true"
+# Tabla de modelos por ruta (cada clínica puede pisarla en tenants.config.model_routing)
+AGENT_MODEL_FAST = os.getenv("AGENT_MODEL_FAST", "gpt-4o-mini")
+AGENT_MODEL_DEFAULT = os.getenv("AGENT_MODEL_DEFAULT", os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
+AGENT_MODEL_STRONG = os.getenv("AGENT_MODEL_STRONG", "gpt-4o")
+# Failover ante timeouts/errores del proveedor ("" = sin failover)
+AGENT_MODEL_FALLBACK = os.getenv("AGENT_MODEL_FALLBACK", "gpt-4o-mini")
+# Proveedor alternativo compatible con la API de OpenAI para el failover (opcional)
+AGENT_FALLBACK_BASE_URL = os.getenv("AGENT_FALLBACK_BASE_URL", "") or None
+AGENT_FALLBACK_API_KEY = os.getenv("AGENT_FALLBACK_API_KEY", "")
+AGENT_LLM_TIMEOUT_SECONDS = float(os.getenv("AGENT_LLM_TIMEOUT_SECONDS", "25"))
+AGENT_LLM_MAX_RETRIES = int(os.getenv("AGENT_LLM_MAX_RETRIES", "1"))
+# Mensajes de hasta N palabras sin fechas/horas/DNI van a la ruta rápida
+AGENT_FAST_MAX_WORDS = int(os.getenv("AGENT_FAST_MAX_WORDS", "6"))
+
+# Tools con efectos: si alguna ya se ejecutó bien, el turno no se repite con otro modelo
+MUTATING_TOOLS = {
+    "book_appointment",
+    "cancel_appointment",
+    "reschedule_appointment",
+    "triage_urgency",
+    "derivhumano",
+}
+_ITERATION_LIMIT = "Agent stopped due to"
+# Fechas, horas o DNI en el mensaje: el turno necesita tools con argumentos → ruta default
+_HAS_DATA = re.compile(r"\d")
+
+AGENT_ROUTE_SECONDS = Histogram(
+    "orchestrator_agent_route_seconds",
+    "Duración del turno del agente por ruta de modelo",
+    ["route", "model"],
+    buckets=LATENCY_BUCKETS,
+)
+AGENT_ROUTE_TURNS = Counter(
+    "orchestrator_agent_route_turns_total",
+    "Turnos del agente por ruta (outcome: ok, failover, escalated, error)",
+    ["route", "model", "outcome"],
+)
+AGENT_ROUTE_COST = Counter(
+    "orchestrator_agent_route_cost_usd_total",
+    "Costo estimado (USD) de los turnos del agente por ruta",
+    ["route", "model", "tenant_id"],
+)
+
+
+def build_chat_model(
+    model: str, base_url: Optional[str] = None, api_key: Optional[str] = None
+):
+    """Chat model del agente (OpenAI o compatible); AGENT_LLM_BACKEND=fake usa el modelo guionado."""
+    if os.getenv("AGENT_LLM_BACKEND", "openai").lower() == "fake":
+        from loadtest.fake_llm import FakeDentalChatModel
+
+        return FakeDentalChatModel(model_name=model, callbacks=[llm_metrics_callback])
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model=model,
+        temperature=0,
+        openai_api_key=api_key or os.getenv("OPENAI_API_KEY", ""),
+        openai_api_base=base_url,
+        request_timeout=AGENT_LLM_TIMEOUT_SECONDS,
+        max_retries=AGENT_LLM_MAX_RETRIES,
+        callbacks=[llm_metrics_callback],
+    )
+
+
+def build_routed_llm(model: str, fallback: Optional[str]):
+    """Modelo de la ruta con failover (with_fallbacks) al modelo/proveedor alternativo."""
+    llm = build_chat_model(model)
+    if not fallback:
+        return llm
+    alternate = build_chat_model(
+        fallback, base_url=AGENT_FALLBACK_BASE_URL, api_key=AGENT_FALLBACK_API_KEY or None
+    )
+    return llm.with_fallbacks([alternate])
+
+
+def escalation_reason(result: Dict[str, Any]) -> Optional[str]:
+    """Motivo para repetir el turno con el modelo fuerte, o None si la respuesta sirve."""
+    steps = result.get("intermediate_steps") or []
+    mutated = any(
+        action.tool in MUTATING_TOOLS and not str(observation).startswith("⚠️")
+        for action, observation in steps
+    )
+    if mutated:
+        return None
+    output = (result.get("output") or "").strip()
+    if not output:
+        return "empty_output"
+    if output.startswith(_ITERATION_LIMIT):
+        return "iteration_limit"
+    if any(str(observation).startswith("⚠️") for _, observation in steps):
+        return "tool_error"
+    return None
+
+
+class ModelRouter:
+    """
+    Ruteo de modelos del agente: turnos cortos y simples → ruta "fast"; el resto → "default";
+    si la respuesta falla (tool con error, salida vacía, límite de iteraciones) el turno se
+    repite una vez en "strong". Cada ruta tiene failover a AGENT_MODEL_FALLBACK ante timeouts.
+    """
+
+    def __init__(self, build_executor: Callable[[Any], Any]):
+        self._build_executor = build_executor
+        self._executors: Dict[Tuple[str, Optional[str]], Any] = {}
+
+    @staticmethod
+    def tiers_for(tenant_config: Any = None) -> Dict[str, Any]:
+        tiers: Dict[str, Any] = {
+            "enabled": AGENT_ROUTING_ENABLED,
+            "fast": AGENT_MODEL_FAST,
+            "default": AGENT_MODEL_DEFAULT,
+            "strong": AGENT_MODEL_STRONG,
+            "fallback": AGENT_MODEL_FALLBACK,
+            "fast_max_words": AGENT_FAST_MAX_WORDS,
+        }
+        if isinstance(tenant_config, str):
+            try:
+                tenant_config = json.loads(tenant_config)
+            except ValueError:
+                tenant_config = None
+        overrides = (tenant_config or {}).get("model_routing") if isinstance(tenant_config, dict) else None
+        if isinstance(overrides, dict):
+            tiers.update({k: v for k, v in overrides.items() if k in tiers and v is not None})
+        return tiers
+
+    @staticmethod
+    def choose_route(message: str, tiers: Dict[str, Any]) -> str:
+        if not tiers["enabled"]:
+            return "default"
+        words = (message or "").split()
+        if len(words) <= int(tiers["fast_max_words"]) and not _HAS_DATA.search(message or ""):
+            return "fast"
+        return "default"
+
+    def executor(self, model: str, fallback: Optional[str]):
+        key = (model, fallback or None)
+        if key not in self._executors:
+            self._executors[key] = self._build_executor(build_routed_llm(model, fallback or None))
+        return self._executors[key]
+
+    async def _invoke(
+        self, route: str, tiers: Dict[str, Any], inputs: Dict[str, Any], tenant_id: Any
+    ) -> Tuple[Dict[str, Any], UsageCollector]:
+        model = tiers[route]
+        usage = UsageCollector()
+        started = time.perf_counter()
+        try:
+            result = await self.executor(model, tiers["fallback"]).ainvoke(
+                inputs, config={"callbacks": [usage]}
+            )
+        except Exception:
+            AGENT_ROUTE_TURNS.labels(route=route, model=model, outcome="error").inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            observe(AGENT_ROUTE_SECONDS.labels(route=route, model=model), elapsed)
+        served = usage.models[-1] if usage.models else model
+        AGENT_ROUTE_COST.labels(route=route, model=model, tenant_id=str(tenant_id)).inc(
+            usage.cost_usd
+        )
+        timer = current_stage_timer.get()
+        llm_usage_recorder.record(
+            tenant_id=tenant_id,
+            kind="agent",
+            route=route,
+            model=served,
+            usage=usage,
+            tool_calls=len(result.get("intermediate_steps") or []),
+            wall_ms=int(elapsed * 1000),
+            correlation_id=timer.correlation_id if timer is not None else None,
+        )
+        if usage.errors:
+            AGENT_ROUTE_TURNS.labels(route=route, model=model, outcome="failover").inc()
+            logger.warning(f"🔀 Failover de {model} a {served} (tenant={tenant_id})")
+        return result, usage
+
+    async def run(
+        self,
+        inputs: Dict[str, Any],
+        message: str,
+        tenant_id: Any,
+        tenant_config: Any = None,
+    ) -> str:
+        tiers = self.tiers_for(tenant_config)
+        route = self.choose_route(message, tiers)
+        result, _ = await self._invoke(route, tiers, inputs, tenant_id)
+
+        reason = escalation_reason(result) if tiers["enabled"] else None
+        if reason and route != "strong" and tiers["strong"] != tiers[route]:
+            AGENT_ROUTE_TURNS.labels(route=route, model=tiers[route], outcome="escalated").inc()
+            logger.info(
+                f"🔀 Escalando turno tenant={tenant_id} {route}→strong reason={reason}"
+            )
+            route = "strong"
+            result, _ = await self._invoke(route, tiers, inputs, tenant_id)
+
+        AGENT_ROUTE_TURNS.labels(route=route, model=tiers[route], outcome="ok").inc()
+        return result.get("output", "Error procesando respuesta")
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import Counter
+
+from conversation_cache import conversation_cache
+from db import db
+
+logger = logging.getLogger("override_sweeper")
+
+# Cada cuánto se reactivan las conversaciones con human_override_until vencido (0 = apagado)
+HUMAN_OVERRIDE_SWEEP_SECONDS = float(os.getenv("HUMAN_OVERRIDE_SWEEP_SECONDS", "30"))
+HUMAN_OVERRIDE_SWEEP_BATCH = int(os.getenv("HUMAN_OVERRIDE_SWEEP_BATCH", "500"))
+
+OVERRIDES_EXPIRED = Counter(
+    "orchestrator_human_overrides_expired_total",
+    "Intervenciones humanas vencidas que el barrido devolvió a la IA",
+    ["tenant_id"],
+)
+
+EmitFrame = Callable[[int, List[Tuple[str, Any]]], Awaitable[Any]]
+
+
+class OverrideSweeper:
+    """
+    Barrido periódico de human_override_until: limpia en lote los vencidos (SKIP LOCKED,
+    seguro con varios workers), invalida el estado cacheado de cada conversación y avisa
+    a cada clínica con un solo frame de HUMAN_OVERRIDE_CHANGED. Así /chat solo lee los flags.
+    """
+
+    def __init__(self, emit_frame: EmitFrame):
+        self._emit_frame = emit_frame
+        self._task: Optional[asyncio.Task] = None
+        self.swept = 0
+        self.errors = 0
+
+    async def sweep(self, batch_size: int = HUMAN_OVERRIDE_SWEEP_BATCH) -> int:
+        by_tenant: Dict[int, List[str]] = {}
+        while True:
+            rows = await db.clear_expired_overrides(batch_size)
+            for row in rows:
+                by_tenant.setdefault(row["tenant_id"], []).append(row["phone_number"])
+                # Invalidar y no escribir False: si un admin reactivó la intervención después
+                # del UPDATE, la próxima lectura trae ese True de Postgres
+                await conversation_cache.invalidate(row["tenant_id"], row["phone_number"])
+            if len(rows) < batch_size:
+                break
+
+        for tenant_id, phones in by_tenant.items():
+            OVERRIDES_EXPIRED.labels(tenant_id=str(tenant_id)).inc(len(phones))
+            try:
+                await self._emit_frame(
+                    tenant_id,
+                    [
+                        (
+                            "HUMAN_OVERRIDE_CHANGED",
+                            {
+                                "phone_number": phone,
+                                "tenant_id": tenant_id,
+                                "enabled": False,
+                                "reason": "expired",
+                            },
+                        )
+                        for phone in phones
+                    ],
+                )
+            except Exception as e:
+                logger.error(f"❌ No se pudo avisar el vencimiento de overrides (tenant={tenant_id}): {e}")
+
+        swept = sum(len(phones) for phones in by_tenant.values())
+        if swept:
+            self.swept += swept
+            logger.info(f"🤖 IA reactivada en {swept} conversaciones con override vencido")
+        return swept
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(HUMAN_OVERRIDE_SWEEP_SECONDS)
+            try:
+                await self.sweep()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"❌ Error en el barrido de human_override_until: {e}")
+
+    def start(self):
+        if self._task is None and HUMAN_OVERRIDE_SWEEP_SECONDS > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,45 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response
+
+# Header con el cursor de la página siguiente (el body sigue siendo la lista de siempre)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created: datetime, row_id: Any) -> str:
+    """Cursor opaco para keyset pagination sobre (timestamp, id). Los UUID viajan como texto."""
+    if isinstance(row_id, uuid.UUID):
+        row_id = str(row_id)
+    raw = json.dumps([created.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, Any]:
+    """(timestamp, id) del cursor; 400 si no es un cursor emitido por la API."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(created), row_id
+    except (ValueError, TypeError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido.")
+
+
+def keyset_page(
+    rows: Sequence[Any],
+    limit: int,
+    key: Callable[[Any], Tuple[datetime, Any]],
+    response: Optional[Response] = None,
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    rows se pidió con LIMIT limit + 1: si sobra una fila hay página siguiente y el cursor
+    apunta a la última devuelta. Si se pasa response, el cursor va en X-Next-Cursor.
+    """
+    page = list(rows[:limit])
+    next_cursor = encode_cursor(*key(page[-1])) if len(rows) > limit and page else None
+    if response is not None and next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return page, next_cursor
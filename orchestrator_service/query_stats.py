@@ -0,0 +1,230 @@
+import hashlib
+import logging
+import math
+import os
+import re
+import sys
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import asyncpg
+from prometheus_client import Counter
+
+from metrics import current_stage_timer, current_tenant_label
+
+logger = logging.getLogger("query_stats")
+
+QUERY_STATS_ENABLED = os.getenv("QUERY_STATS_ENABLED", "true").lower() == "true"
+# Consultas más lentas que esto se loguean con el llamador y el correlation_id (0 = no loguear)
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+# Tope de fingerprints distintos en memoria (SQL dinámico mal parametrizado no agota la RAM)
+QUERY_STATS_MAX_FINGERPRINTS = int(os.getenv("QUERY_STATS_MAX_FINGERPRINTS", "2000"))
+# Muestras recientes por fingerprint para calcular p95
+_SAMPLES = 512
+
+SLOW_QUERIES = Counter(
+    "orchestrator_db_slow_queries_total",
+    "Consultas por encima de DB_SLOW_QUERY_MS",
+    ["tenant_id"],
+)
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PARAM_LISTS = re.compile(r"\(\s*(?:\?|\$\d+)(?:\s*,\s*(?:\?|\$\d+))+\s*\)")
+_SPACES = re.compile(r"\s+")
+# Frames que no cuentan como "llamador" de la consulta
+_SKIP_FILES = (os.path.dirname(asyncpg.__file__), __file__)
+
+
+def normalize_query(query: str) -> str:
+    """SQL sin comentarios, literales ni espacios repetidos: misma forma → mismo fingerprint."""
+    text = _COMMENTS.sub(" ", query)
+    text = _STRINGS.sub("?", text)
+    text = _NUMBERS.sub("?", text)
+    text = _PARAM_LISTS.sub("(?, ...)", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+
+
+def _caller() -> str:
+    """Primer frame fuera de asyncpg y de este módulo (archivo:línea función)."""
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename.startswith(_SKIP_FILES):
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+
+
+class _Fingerprint:
+    __slots__ = ("query", "calls", "errors", "total", "max", "rows", "samples")
+
+    def __init__(self, query: str):
+        self.query = query
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.samples: Deque[float] = deque(maxlen=_SAMPLES)
+
+    def p95(self) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+
+
+class QueryStats:
+    """
+    Estadísticas por fingerprint de consulta (por proceso): llamadas, tiempo total/máximo/p95,
+    filas devueltas y errores. Las consultas lentas se loguean con llamador y correlation_id.
+    """
+
+    def __init__(self):
+        self._by_fp: Dict[str, _Fingerprint] = {}
+        self._normalized: Dict[str, str] = {}
+        self.dropped = 0
+        self.started_at = time.time()
+
+    def _fingerprint_of(self, query: str):
+        normalized = self._normalized.get(query)
+        if normalized is None:
+            normalized = normalize_query(query)
+            if len(self._normalized) < QUERY_STATS_MAX_FINGERPRINTS * 4:
+                self._normalized[query] = normalized
+        return fingerprint(normalized), normalized
+
+    def record(
+        self, query: str, elapsed: float, rows: int = 0, error: bool = False, caller: Optional[str] = None
+    ):
+        fp, normalized = self._fingerprint_of(query)
+        stats = self._by_fp.get(fp)
+        if stats is None:
+            if len(self._by_fp) >= QUERY_STATS_MAX_FINGERPRINTS:
+                self.dropped += 1
+                return
+            stats = self._by_fp[fp] = _Fingerprint(normalized)
+        stats.calls += 1
+        stats.total += elapsed
+        stats.max = max(stats.max, elapsed)
+        stats.rows += rows
+        stats.errors += int(error)
+        stats.samples.append(elapsed)
+
+        if DB_SLOW_QUERY_MS > 0 and elapsed * 1000 >= DB_SLOW_QUERY_MS:
+            SLOW_QUERIES.labels(tenant_id=current_tenant_label()).inc()
+            timer = current_stage_timer.get()
+            logger.warning(
+                f"🐢 Consulta lenta {elapsed * 1000:.0f}ms fp={fp} rows={rows} "
+                f"caller={caller or 'unknown'} "
+                f"correlation_id={timer.correlation_id if timer is not None else '-'} "
+                f"sql={normalized[:300]!r}"
+            )
+
+    def top(self, limit: int = 20, order_by: str = "total") -> List[Dict[str, Any]]:
+        """Top-N fingerprints ordenados por total, calls, p95, max o rows."""
+        keys = {
+            "total": lambda s: s.total,
+            "calls": lambda s: s.calls,
+            "p95": lambda s: s.p95(),
+            "max": lambda s: s.max,
+            "rows": lambda s: s.rows,
+        }
+        key = keys.get(order_by, keys["total"])
+        ranked = sorted(self._by_fp.items(), key=lambda item: key(item[1]), reverse=True)
+        return [
+            {
+                "fingerprint": fp,
+                "query": s.query[:500],
+                "calls": s.calls,
+                "errors": s.errors,
+                "total_ms": round(s.total * 1000, 1),
+                "avg_ms": round(s.total * 1000 / s.calls, 2) if s.calls else 0.0,
+                "p95_ms": round(s.p95() * 1000, 2),
+                "max_ms": round(s.max * 1000, 2),
+                "rows": s.rows,
+                "avg_rows": round(s.rows / s.calls, 1) if s.calls else 0.0,
+            }
+            for fp, s in ranked[:limit]
+        ]
+
+    def reset(self):
+        self._by_fp.clear()
+        self._normalized.clear()
+        self.dropped = 0
+        self.started_at = time.time()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": QUERY_STATS_ENABLED,
+            "fingerprints": len(self._by_fp),
+            "dropped": self.dropped,
+            "slow_query_ms": DB_SLOW_QUERY_MS,
+            "since": self.started_at,
+        }
+
+
+# Instancia global para importar fácilmente
+query_stats = QueryStats()
+
+
+def _rows_from_status(status: Any) -> int:
+    """'UPDATE 5' / 'INSERT 0 3' / 'DELETE 0' → filas afectadas."""
+    if isinstance(status, str):
+        last = status.rsplit(" ", 1)[-1]
+        if last.isdigit():
+            return int(last)
+    return 0
+
+
+class InstrumentedConnection(asyncpg.Connection):
+    """
+    connection_class= de asyncpg.create_pool: mide cada consulta (también las que pasan por
+    db.pool.fetch/execute, que delegan en la conexión) y la registra en query_stats.
+    """
+
+    async def _measured(self, method, query, rows_of, *args, **kwargs):
+        if not QUERY_STATS_ENABLED:
+            return await method(query, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            result = await method(query, *args, **kwargs)
+        except Exception:
+            elapsed = time.perf_counter() - started
+            query_stats.record(query, elapsed, error=True, caller=_caller())
+            raise
+        elapsed = time.perf_counter() - started
+        slow = DB_SLOW_QUERY_MS > 0 and elapsed * 1000 >= DB_SLOW_QUERY_MS
+        query_stats.record(query, elapsed, rows_of(result), caller=_caller() if slow else None)
+        return result
+
+    async def execute(self, query: str, *args, **kwargs):
+        return await self._measured(super().execute, query, _rows_from_status, *args, **kwargs)
+
+    async def executemany(self, command: str, args, **kwargs):
+        return await self._measured(
+            super().executemany,
+            command,
+            lambda _: len(args) if hasattr(args, "__len__") else 0,
+            args,
+            **kwargs,
+        )
+
+    async def fetch(self, query, *args, **kwargs):
+        return await self._measured(super().fetch, query, len, *args, **kwargs)
+
+    async def fetchrow(self, query, *args, **kwargs):
+        return await self._measured(
+            super().fetchrow, query, lambda r: int(r is not None), *args, **kwargs
+        )
+
+    async def fetchval(self, query, *args, **kwargs):
+        return await self._measured(
+            super().fetchval, query, lambda v: int(v is not None), *args, **kwargs
+        )
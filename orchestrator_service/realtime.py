@@ -0,0 +1,198 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import socketio
+
+from metrics import SOCKET_COALESCED, SOCKET_EMITS, SOCKET_FRAMES
+
+logger = logging.getLogger("realtime")
+
+# Redis compartido entre workers/réplicas: los eventos Socket.IO se publican en un canal
+# y cada proceso los entrega a los sockets conectados a él.
+REDIS_URL = os.getenv("REDIS_URL", "")
+SOCKETIO_REDIS_ENABLED = os.getenv("SOCKETIO_REDIS_ENABLED", "true").lower() == "true"
+SOCKETIO_REDIS_CHANNEL = os.getenv("SOCKETIO_REDIS_CHANNEL", "dentalogic-socketio")
+# Ventana de coalescencia por sala (ms); 0 = emitir cada evento al instante
+SOCKET_COALESCE_MS = int(os.getenv("SOCKET_COALESCE_MS", "150"))
+# Un frame con esta cantidad de eventos se envía sin esperar la ventana
+SOCKET_COALESCE_MAX_EVENTS = int(os.getenv("SOCKET_COALESCE_MAX_EVENTS", "50"))
+
+BATCH_EVENT = "EVENT_BATCH"
+# Eventos de estado: dentro de un frame solo importa el último por entidad (se fusionan)
+MERGE_KEYS: Dict[str, Tuple[str, ...]] = {
+    "PATIENT_UPDATED": ("patient_id", "phone_number", "phone"),
+    "APPOINTMENT_UPDATED": ("id",),
+    "HUMAN_OVERRIDE_CHANGED": ("phone_number",),
+}
+
+
+class _SafeJson:
+    """json para el emisor write-only: UUID/datetime/Decimal como texto (ISO para fechas)."""
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        return json.dumps(
+            obj, default=lambda o: o.isoformat() if hasattr(o, "isoformat") else str(o), **kwargs
+        )
+
+    loads = staticmethod(json.loads)
+
+
+def tenant_room(tenant_id: int) -> str:
+    return f"tenant:{tenant_id}"
+
+
+def redis_fanout_enabled() -> bool:
+    return bool(REDIS_URL) and SOCKETIO_REDIS_ENABLED
+
+
+def build_client_manager() -> Optional[socketio.AsyncRedisManager]:
+    """
+    Client manager para socketio.AsyncServer: Redis si REDIS_URL está configurado
+    (varios workers uvicorn o réplicas), o None para el manager en memoria (un solo proceso).
+    """
+    if not redis_fanout_enabled():
+        logger.info("📡 Socket.IO en memoria (un solo worker): REDIS_URL no configurado")
+        return None
+    logger.info(f"📡 Socket.IO con Redis (canal {SOCKETIO_REDIS_CHANNEL})")
+    return socketio.AsyncRedisManager(REDIS_URL, channel=SOCKETIO_REDIS_CHANNEL)
+
+
+def merge_key(event_type: str, data: Any) -> Optional[Tuple[str, Any]]:
+    """Clave de entidad para eventos fusionables; None si el evento debe viajar tal cual."""
+    fields = MERGE_KEYS.get(event_type)
+    if not fields or not isinstance(data, dict):
+        return None
+    for field in fields:
+        if data.get(field) is not None:
+            return (field, data[field])
+    return None
+
+
+def _merge(previous: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    merged = {**previous, **current}
+    if "updated_fields" in previous or "updated_fields" in current:
+        merged["updated_fields"] = list(
+            dict.fromkeys((previous.get("updated_fields") or []) + (current.get("updated_fields") or []))
+        )
+    return merged
+
+
+class CoalescingEmitter:
+    """
+    Agrupa los eventos de cada sala durante SOCKET_COALESCE_MS y los envía en un solo frame:
+    un evento suelto viaja con su nombre de siempre; dos o más viajan como EVENT_BATCH
+    ({"events": [{"event", "data"}, ...]}, en orden). Las actualizaciones repetidas de la misma
+    entidad (MERGE_KEYS) se fusionan y ocupan la posición de la última.
+    """
+
+    def __init__(
+        self,
+        emit: Callable[..., Awaitable[Any]],
+        window_ms: int = SOCKET_COALESCE_MS,
+        max_events: int = SOCKET_COALESCE_MAX_EVENTS,
+    ):
+        self._emit = emit
+        self.window = window_ms / 1000
+        self.max_events = max_events
+        self._frames: Dict[str, List[Tuple[str, Any]]] = {}
+        self._timers: Dict[str, asyncio.Task] = {}
+
+    async def emit(self, room: str, event_type: str, data: Any):
+        if self.window <= 0:
+            await self._send(room, [(event_type, data)])
+            return
+        frame = self._frames.setdefault(room, [])
+        key = merge_key(event_type, data)
+        if key is not None:
+            for i, (queued_event, queued_data) in enumerate(frame):
+                if queued_event == event_type and merge_key(queued_event, queued_data) == key:
+                    data = _merge(queued_data, data)
+                    del frame[i]
+                    SOCKET_COALESCED.labels(event=event_type).inc()
+                    break
+        frame.append((event_type, data))
+        if len(frame) >= self.max_events:
+            await self.flush_room(room)
+        elif room not in self._timers:
+            self._timers[room] = asyncio.create_task(self._flush_later(room))
+
+    async def _flush_later(self, room: str):
+        await asyncio.sleep(self.window)
+        self._timers.pop(room, None)
+        try:
+            await self.flush_room(room)
+        except Exception as e:
+            logger.error(f"❌ Error emitiendo frame Socket.IO a {room}: {e}")
+
+    async def flush_room(self, room: str):
+        timer = self._timers.pop(room, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        frame = self._frames.pop(room, None)
+        if frame:
+            await self._send(room, frame)
+
+    async def emit_frame(self, room: str, events: List[Tuple[str, Any]]):
+        """Envía `events` como un solo frame, después de lo que la sala tenga pendiente."""
+        await self.flush_room(room)
+        if events:
+            await self._send(room, events)
+
+    async def flush_all(self):
+        for room in list(self._frames):
+            await self.flush_room(room)
+
+    async def _send(self, room: str, frame: List[Tuple[str, Any]]):
+        if len(frame) == 1:
+            event_type, data = frame[0]
+            await self._emit(event_type, data, room=room)
+            SOCKET_FRAMES.labels(kind="single").inc()
+        else:
+            await self._emit(
+                BATCH_EVENT,
+                {"events": [{"event": e, "data": d} for e, d in frame]},
+                room=room,
+            )
+            SOCKET_FRAMES.labels(kind="batch").inc()
+        logger.debug(f"📡 Frame Socket.IO room={room} eventos={len(frame)}")
+
+
+class ExternalEmitter:
+    """
+    Emisor write-only para procesos sin servidor Socket.IO (jobs, scripts, workers):
+    publica en el mismo canal Redis y el orchestrator entrega a la sala de la clínica.
+    """
+
+    def __init__(self):
+        self._manager: Optional[socketio.AsyncRedisManager] = None
+
+    def _get_manager(self) -> Optional[socketio.AsyncRedisManager]:
+        if self._manager is None and redis_fanout_enabled():
+            self._manager = socketio.AsyncRedisManager(
+                REDIS_URL, channel=SOCKETIO_REDIS_CHANNEL, write_only=True, json=_SafeJson
+            )
+        return self._manager
+
+    async def emit_to_tenant(self, event_type: str, data: Any, tenant_id: Optional[int] = None) -> bool:
+        """Mismo contrato que main.emit_to_tenant. Devuelve False si no se pudo publicar."""
+        if tenant_id is None and isinstance(data, dict):
+            tenant_id = data.get("tenant_id")
+        if tenant_id is None:
+            logger.warning(f"📡 Evento externo {event_type} sin tenant_id; no se emite")
+            return False
+        manager = self._get_manager()
+        if manager is None:
+            logger.warning(f"📡 Evento externo {event_type} descartado: sin Redis para Socket.IO")
+            return False
+        room = tenant_room(tenant_id)
+        await manager.emit(event_type, data, room=room, namespace="/")
+        SOCKET_EMITS.labels(event=event_type, room=room).inc()
+        return True
+
+
+# Instancia global para importar fácilmente
+external_emitter = ExternalEmitter()
@@ -0,0 +1,92 @@
+import logging
+from typing import Any, Dict, Optional, Set
+
+logger = logging.getLogger("schema_capabilities")
+
+# Tablas cuyas columnas deciden qué variante de consulta usan las rutas
+_TRACKED_TABLES = ("chat_messages", "professionals")
+
+
+class SchemaCapabilities:
+    """
+    Columnas presentes en el esquema, leídas del catálogo una vez al arrancar (y tras migrar).
+    Las rutas eligen la consulta con estos flags en vez de consultar information_schema
+    en cada request o reintentar ante UndefinedColumnError.
+    """
+
+    def __init__(self):
+        self._columns: Optional[Dict[str, Set[str]]] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._columns is not None
+
+    async def refresh(self, pool) -> bool:
+        """Relee el catálogo. Si falla se mantiene lo anterior (o el esquema completo)."""
+        try:
+            rows = await pool.fetch(
+                """
+                SELECT c.relname AS table_name, a.attname AS column_name
+                FROM pg_catalog.pg_attribute a
+                JOIN pg_catalog.pg_class c ON c.oid = a.attrelid
+                JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = 'public' AND c.relname = ANY($1::text[])
+                  AND a.attnum > 0 AND NOT a.attisdropped
+                """,
+                list(_TRACKED_TABLES),
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudieron leer las capacidades del esquema: {e}")
+            return False
+
+        columns: Dict[str, Set[str]] = {}
+        for row in rows:
+            columns.setdefault(row["table_name"], set()).add(row["column_name"])
+        self._columns = columns
+        missing = self.missing()
+        if missing:
+            logger.warning(f"⚠️ Esquema sin columnas esperadas (se usan consultas de compatibilidad): {missing}")
+        else:
+            logger.info("✅ Capacidades del esquema cargadas: esquema completo")
+        return True
+
+    def has_column(self, table: str, column: str) -> bool:
+        # Sin introspección todavía: se asume el esquema al día (migraciones aplicadas)
+        if self._columns is None:
+            return True
+        return column in self._columns.get(table, ())
+
+    @property
+    def has_chat_tenant_id(self) -> bool:
+        return self.has_column("chat_messages", "tenant_id")
+
+    @property
+    def has_professional_tenant_id(self) -> bool:
+        return self.has_column("professionals", "tenant_id")
+
+    @property
+    def has_professional_last_name(self) -> bool:
+        return self.has_column("professionals", "last_name")
+
+    def missing(self) -> Dict[str, Any]:
+        """Columnas de compatibilidad que faltan, por tabla."""
+        expected = {
+            "chat_messages": ("tenant_id",),
+            "professionals": (
+                "tenant_id",
+                "last_name",
+                "working_hours",
+                "phone_number",
+                "registration_id",
+                "google_calendar_id",
+            ),
+        }
+        return {
+            table: [c for c in cols if not self.has_column(table, c)]
+            for table, cols in expected.items()
+            if any(not self.has_column(table, c) for c in cols)
+        }
+
+
+# Instancia global para importar fácilmente
+schema_capabilities = SchemaCapabilities()
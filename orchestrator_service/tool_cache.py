@@ -0,0 +1,270 @@
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger("tool_cache")
+
+# TTLs por defecto (segundos). El catálogo cambia poco; la agenda cambia seguido.
+TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "true").lower() == "true"
+TOOL_CACHE_CATALOG_TTL = int(os.getenv("TOOL_CACHE_CATALOG_TTL", "300"))
+TOOL_CACHE_AVAILABILITY_TTL = int(os.getenv("TOOL_CACHE_AVAILABILITY_TTL", "60"))
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "5000"))
+
+# Con REDIS_URL las invalidaciones se publican a todos los workers/réplicas
+REDIS_URL = os.getenv("REDIS_URL", "")
+TOOL_CACHE_CHANNEL = os.getenv("TOOL_CACHE_CHANNEL", "tool_cache:invalidate")
+
+# Respuestas de error de las tools: nunca se memorizan (el próximo intento debe ir a la BD)
+NON_CACHEABLE_PREFIXES = ("⚠️", "❌", "No pude", "Hubo un error", "Hubo un problema")
+
+
+def normalize_tool_args(fn: Callable, args: tuple, kwargs: dict) -> Tuple:
+    """
+    Convierte los argumentos de una tool en una clave estable:
+    aplica defaults, ignora None, normaliza strings (minúsculas, espacios) y ordena.
+    """
+    try:
+        bound = inspect.signature(fn).bind(*args, **kwargs)
+        bound.apply_defaults()
+        items = bound.arguments.items()
+    except TypeError:
+        items = list(enumerate(args)) + list(kwargs.items())
+    normalized = []
+    for key, value in items:
+        if value is None:
+            continue
+        if isinstance(value, str):
+            value = " ".join(value.lower().split())
+            if not value:
+                continue
+        normalized.append((str(key), value))
+    return tuple(sorted(normalized, key=lambda kv: kv[0]))
+
+
+class ToolResultCache:
+    """
+    Memoización en memoria de resultados de tools del agente.
+    Clave: (tool, scope, args normalizados), donde scope arranca siempre con tenant_id.
+    Cada tool declara de qué "temas" depende (treatments, professionals, appointments...)
+    para poder invalidarla cuando el dato de origen cambia.
+
+    Cada worker tiene su propia memoria: con REDIS_URL, invalidate() además publica en
+    TOOL_CACHE_CHANNEL y los demás workers limpian lo mismo. Mientras la suscripción no
+    está activa (arranque o Redis caído) la memoización se saltea para no servir datos viejos.
+    """
+
+    def __init__(self, max_entries: int = TOOL_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: Dict[Tuple, Tuple[float, Any]] = {}
+        self._topics: Dict[str, set] = {}
+        self.hits = 0
+        self.misses = 0
+        self._origin = uuid.uuid4().hex
+        self._redis = None
+        self._listener: Optional[asyncio.Task] = None
+        self._publishes: Set[asyncio.Task] = set()
+        self._subscribed = False
+        self.remote_invalidations = 0
+
+    def _get_redis(self):
+        if self._redis is None and REDIS_URL:
+            import redis.asyncio as aioredis
+
+            self._redis = aioredis.from_url(REDIS_URL, decode_responses=True)
+        return self._redis
+
+    @property
+    def usable(self) -> bool:
+        return TOOL_CACHE_ENABLED and (not REDIS_URL or self._subscribed)
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        return value
+
+    def set(self, key: Tuple, value: Any, ttl: int):
+        if len(self._entries) >= self.max_entries:
+            self._evict()
+        self._entries[key] = (time.monotonic() + ttl, value)
+
+    def _evict(self):
+        """Descarta expirados; si sigue lleno, la entrada más próxima a expirar."""
+        now = time.monotonic()
+        for key in [k for k, (exp, _) in self._entries.items() if exp < now]:
+            self._entries.pop(key, None)
+        if len(self._entries) >= self.max_entries:
+            oldest = min(self._entries, key=lambda k: self._entries[k][0])
+            self._entries.pop(oldest, None)
+
+    def invalidate(
+        self, topic: str, tenant_id: Optional[int] = None, broadcast: bool = True
+    ) -> int:
+        """
+        Invalida las tools que dependen de `topic`.
+        Con tenant_id solo limpia esa clínica; sin tenant_id limpia todas
+        (solo si la ruta no puede conocer la sede, ej. esquema sin professionals.tenant_id).
+        Devuelve las entradas borradas en este worker; los demás se enteran por Redis.
+        """
+        if broadcast:
+            self._broadcast(topic, tenant_id)
+        tools = self._topics.get(topic, set())
+        removed = 0
+        for key in list(self._entries):
+            tool_name, scope = key[0], key[1]
+            if tool_name not in tools:
+                continue
+            if tenant_id is not None and (not scope or scope[0] != tenant_id):
+                continue
+            self._entries.pop(key, None)
+            removed += 1
+        if removed:
+            logger.debug(
+                f"🧹 tool_cache invalidate topic={topic} tenant_id={tenant_id} removed={removed}"
+            )
+        return removed
+
+    def clear(self):
+        self._entries.clear()
+
+    def _broadcast(self, topic: str, tenant_id: Optional[int]):
+        if not REDIS_URL:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self._publish(topic, tenant_id))
+        self._publishes.add(task)
+        task.add_done_callback(self._publishes.discard)
+
+    async def _publish(self, topic: str, tenant_id: Optional[int]):
+        payload = json.dumps({"origin": self._origin, "topic": topic, "tenant_id": tenant_id})
+        try:
+            await self._get_redis().publish(TOOL_CACHE_CHANNEL, payload)
+        except Exception as e:
+            logger.warning(f"⚠️ tool_cache: no se pudo publicar la invalidación {topic}: {e}")
+
+    def _apply_remote(self, raw: str):
+        data = json.loads(raw)
+        if data.get("origin") == self._origin:
+            return
+        self.remote_invalidations += 1
+        self.invalidate(data["topic"], data.get("tenant_id"), broadcast=False)
+
+    async def _listen(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = self._get_redis().pubsub()
+                await pubsub.subscribe(TOOL_CACHE_CHANNEL)
+                # Lo memorizado antes de suscribirse pudo perder invalidaciones ajenas
+                self.clear()
+                self._subscribed = True
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._apply_remote(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ tool_cache: suscripción a {TOOL_CACHE_CHANNEL} caída: {e}")
+            finally:
+                self._subscribed = False
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+            await asyncio.sleep(1)
+
+    def start(self):
+        if self._listener is None and REDIS_URL and TOOL_CACHE_ENABLED:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._publishes:
+            await asyncio.gather(*self._publishes, return_exceptions=True)
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "shared_invalidation": bool(REDIS_URL),
+            "subscribed": self._subscribed,
+            "remote_invalidations": self.remote_invalidations,
+        }
+
+    def memoize(
+        self,
+        ttl: int,
+        topics: Iterable[str],
+        scope: Callable[[], Tuple],
+        key_fn: Optional[Callable[..., Tuple]] = None,
+    ):
+        """
+        Decorador para la corrutina de una tool (aplicar debajo de @tool, así LangChain
+        sigue leyendo firma y docstring originales).
+        scope: devuelve (tenant_id, ...) desde los ContextVars de la sesión.
+        key_fn: normalización propia de argumentos (por defecto normalize_tool_args).
+        """
+        topics = tuple(topics)
+
+        def decorator(fn):
+            for topic in topics:
+                self._topics.setdefault(topic, set()).add(fn.__name__)
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                if not self.usable:
+                    return await fn(*args, **kwargs)
+                try:
+                    norm = (key_fn or normalize_tool_args)(fn, args, kwargs)
+                    key = (fn.__name__, tuple(scope()), norm)
+                    hash(key)
+                except Exception as key_err:
+                    logger.debug(f"tool_cache key skip for {fn.__name__}: {key_err}")
+                    return await fn(*args, **kwargs)
+
+                cached = self.get(key)
+                if cached is not None:
+                    self.hits += 1
+                    logger.debug(f"⚡ tool_cache HIT {fn.__name__} scope={key[1]}")
+                    return cached
+                self.misses += 1
+                result = await fn(*args, **kwargs)
+                if isinstance(result, str) and not result.startswith(
+                    NON_CACHEABLE_PREFIXES
+                ):
+                    self.set(key, result, ttl)
+                return result
+
+            return wrapper
+
+        return decorator
+
+
+# Instancia global para importar fácilmente
+tool_cache = ToolResultCache()
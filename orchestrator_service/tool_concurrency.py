@@ -0,0 +1,74 @@
+import asyncio
+import functools
+import logging
+import os
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import Counter
+
+from metrics import current_tenant_label
+
+logger = logging.getLogger("tool_concurrency")
+
+# Tope por tool de solo lectura: un paso del agente espera, como mucho, a la tool más lenta
+AGENT_TOOL_TIMEOUT_SECONDS = float(os.getenv("AGENT_TOOL_TIMEOUT_SECONDS", "15"))
+
+TOOL_TIMEOUTS = Counter(
+    "orchestrator_tool_timeouts_total",
+    "Tools del agente cortadas por AGENT_TOOL_TIMEOUT_SECONDS",
+    ["tool", "tenant_id"],
+)
+
+# Lock del turno en curso: las tools con efectos de un mismo paso no se pisan entre sí
+current_turn_tool_lock: ContextVar[Optional[asyncio.Lock]] = ContextVar(
+    "current_turn_tool_lock", default=None
+)
+
+
+def begin_agent_turn():
+    """Abre el alcance de un turno del agente (llamar antes de invocar el AgentExecutor)."""
+    current_turn_tool_lock.set(asyncio.Lock())
+
+
+def timeout_observation(tool_name: str) -> str:
+    return (
+        f"⚠️ La consulta ({tool_name}) tardó demasiado y no obtuvo respuesta. "
+        "Avisale al paciente que lo intentamos de nuevo en un momento."
+    )
+
+
+def bind_tool_concurrency(tool_obj, mutating: bool, timeout: float = AGENT_TOOL_TIMEOUT_SECONDS):
+    """
+    AgentExecutor ya ejecuta con asyncio.gather las tool calls de un mismo paso (cada una en
+    su task, con copia de los contextvars del turno). Este wrapper define cómo conviven:
+    - solo lectura: corren en paralelo con un tope de `timeout` segundos; si se vence, la
+      observación es un "⚠️" y el paso sigue con el resto.
+    - con efectos (mutating): se ejecutan de a una por turno y sin tope, para no cortar
+      una reserva o cancelación a mitad de camino.
+    """
+    coroutine = getattr(tool_obj, "coroutine", None)
+    if coroutine is None or getattr(coroutine, "_concurrency_bound", False):
+        return tool_obj
+    name = tool_obj.name
+
+    @functools.wraps(coroutine)
+    async def wrapper(*args, **kwargs):
+        if mutating:
+            lock = current_turn_tool_lock.get()
+            if lock is None:
+                return await coroutine(*args, **kwargs)
+            async with lock:
+                return await coroutine(*args, **kwargs)
+        if timeout <= 0:
+            return await coroutine(*args, **kwargs)
+        try:
+            return await asyncio.wait_for(coroutine(*args, **kwargs), timeout=timeout)
+        except asyncio.TimeoutError:
+            TOOL_TIMEOUTS.labels(tool=name, tenant_id=current_tenant_label()).inc()
+            logger.warning(f"⏱️ Tool {name} superó {timeout:.0f}s; se responde sin su resultado")
+            return timeout_observation(name)
+
+    wrapper._concurrency_bound = True
+    tool_obj.coroutine = wrapper
+    return tool_obj
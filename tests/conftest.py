@@ -22,4 +22,264 @@ def mock_redis():
 def mock_db_pool():
     mock = MagicMock()
     return mock
-    
+
+
+# --- Fakes asíncronos de asyncpg / redis.asyncio ---
+# Cada test configura solo las respuestas que necesita con respond(...): un valor fijo,
+# una excepción (se lanza) o un callable(query, *args) que devuelve la respuesta.
+
+class AsyncCtx:
+    def __init__(self, value=None):
+        self.value = value
+
+    async def __aenter__(self):
+        return self.value
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeTransaction:
+    """conn.transaction(): sirve como `async with` o con start/commit/rollback explícitos."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def start(self):
+        pass
+
+    async def commit(self):
+        self.conn.commits += 1
+
+    async def rollback(self):
+        self.conn.rollbacks += 1
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, *exc):
+        await (self.rollback() if exc_type else self.commit())
+        return False
+
+
+class FakeConn:
+    def __init__(self):
+        self.responses = {}
+        self.calls = []
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.codecs = {}
+        self.query_loggers = []
+
+    def respond(self, **responses):
+        self.responses.update(responses)
+        return self
+
+    def _answer(self, method, query, *args):
+        self.calls.append((method, query, args))
+        response = self.responses.get(method)
+        if isinstance(response, BaseException):
+            raise response
+        return response(query, *args) if callable(response) else response
+
+    async def fetch(self, query, *args):
+        return self._answer("fetch", query, *args)
+
+    async def fetchrow(self, query, *args):
+        return self._answer("fetchrow", query, *args)
+
+    async def fetchval(self, query, *args):
+        return self._answer("fetchval", query, *args)
+
+    async def execute(self, query, *args):
+        self.executed.append(query.strip())
+        return self._answer("execute", query, *args)
+
+    async def executemany(self, query, rows):
+        return self._answer("executemany", query, rows)
+
+    async def _rows(self, query, args):
+        for row in self._answer("fetch", query, *args) or []:
+            yield row
+
+    def cursor(self, query, *args, prefetch=None):
+        return self._rows(query, args)
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    async def set_type_codec(self, typename, encoder, decoder, schema, format="text"):
+        self.codecs[typename] = (encoder, decoder, schema)
+
+    def add_query_logger(self, callback):
+        self.query_loggers.append(callback)
+
+
+class FakePool:
+    """Pool de una sola conexión; fetch/execute directos sobre el pool van a esa conexión."""
+
+    def __init__(self, conn=None):
+        self.conn = conn or FakeConn()
+
+    def respond(self, **responses):
+        self.conn.respond(**responses)
+        return self
+
+    @property
+    def calls(self):
+        return self.conn.calls
+
+    def acquire(self):
+        return AsyncCtx(self.conn)
+
+    async def fetch(self, query, *args):
+        return await self.conn.fetch(query, *args)
+
+    async def fetchrow(self, query, *args):
+        return await self.conn.fetchrow(query, *args)
+
+    async def fetchval(self, query, *args):
+        return await self.conn.fetchval(query, *args)
+
+    async def execute(self, query, *args):
+        return await self.conn.execute(query, *args)
+
+    async def executemany(self, query, rows):
+        return await self.conn.executemany(query, rows)
+
+
+class FakePipeline:
+    """Encola los comandos y los aplica en execute(); respeta WATCH como MULTI/EXEC."""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+        self.watched = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def watch(self, key):
+        self.watched = (key, self.redis.data.get(key))
+
+    def multi(self):
+        pass
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.ops.append((name, args, kwargs))
+
+        return queue
+
+    async def execute(self):
+        from redis.exceptions import WatchError
+
+        if self.watched and self.redis.data.get(self.watched[0]) != self.watched[1]:
+            raise WatchError("watched key changed")
+        for name, args, kwargs in self.ops:
+            getattr(self.redis, "_" + name)(*args, **kwargs)
+
+
+class FakeRedis:
+    """Redis en memoria; ttls guarda la expiración pedida en milisegundos."""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.fail = False
+
+    def _check(self):
+        if self.fail:
+            raise ConnectionError("redis down")
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def set(self, key, value, nx=False, ex=None, px=None):
+        self._check()
+        if nx and key in self.data:
+            return None
+        self._set(key, value, ex=ex, px=px)
+        return True
+
+    async def get(self, key):
+        self._check()
+        return self.data.get(key)
+
+    async def exists(self, key):
+        self._check()
+        return int(key in self.data)
+
+    async def lrange(self, key, start, end):
+        self._check()
+        return list(self.data.get(key, []))
+
+    async def hgetall(self, key):
+        self._check()
+        return dict(self.data.get(key, {}))
+
+    async def delete(self, *keys):
+        self._check()
+        self._delete(*keys)
+
+    # Operaciones aplicadas por FakePipeline.execute()
+    def _set(self, key, value, ex=None, px=None):
+        self.data[key] = value
+        if ex is not None or px is not None:
+            self.ttls[key] = px if px is not None else ex * 1000
+
+    def _delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+            self.ttls.pop(key, None)
+
+    def _rpush(self, key, *values):
+        self.data.setdefault(key, []).extend(values)
+
+    def _rpushx(self, key, value):
+        if key in self.data:
+            self.data[key].append(value)
+
+    def _lrem(self, key, count, value):
+        if key in self.data:
+            self.data[key] = [v for v in self.data[key] if v != value]
+
+    def _ltrim(self, key, start, end):
+        if key in self.data:
+            self.data[key] = self.data[key][start:]
+
+    def _hset(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+
+    def _incr(self, key):
+        self.data[key] = self.data.get(key, 0) + 1
+
+    def _expire(self, key, ttl):
+        if key in self.data:
+            self.ttls[key] = ttl * 1000
+
+
+@pytest.fixture
+def fake_conn():
+    return FakeConn()
+
+
+@pytest.fixture
+def fake_pool(fake_conn):
+    return FakePool(fake_conn)
+
+
+@pytest.fixture
+def make_fake_pool():
+    """Para tests que necesitan más de un pool (primario/réplica, varias lecturas)."""
+    return lambda **responses: FakePool().respond(**responses)
+
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+@pytest.mark.asyncio
+async def test_tenant_limit_queues_and_times_out():
+    controller = AdmissionController(
+        max_concurrency=4, tenant_max_concurrency=1, queue_max=10, queue_timeout=0.05
+    )
+    async with controller.slot(tenant_id=1):
+        assert controller.in_flight == 1
+        # Otra clínica no queda bloqueada por el límite de la clínica 1
+        async with controller.slot(tenant_id=2):
+            assert controller.in_flight == 2
+        with pytest.raises(AdmissionRejected) as exc:
+            async with controller.slot(tenant_id=1):
+                pass
+    assert exc.value.reason == "queue_timeout"
+    assert exc.value.retry_after >= 1
+    assert controller.in_flight == 0 and controller.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_immediately():
+    controller = AdmissionController(
+        max_concurrency=1, tenant_max_concurrency=1, queue_max=1, queue_timeout=1
+    )
+    release = asyncio.Event()
+
+    async def hold():
+        async with controller.slot(tenant_id=1):
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0.01)
+    waiter = asyncio.create_task(hold())
+    await asyncio.sleep(0.01)
+    assert controller.in_flight == 1 and controller.queued == 1
+
+    with pytest.raises(AdmissionRejected) as exc:
+        async with controller.slot(tenant_id=1):
+            pass
+    assert exc.value.reason == "queue_full"
+
+    release.set()
+    await asyncio.gather(holder, waiter)
+    assert controller.in_flight == 0
@@ -0,0 +1,38 @@
+import httpx
+import jwt
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from Dashboard_Analytics_Sovereign.src.api import analytics_routes
+from Dashboard_Analytics_Sovereign.src.services import analytics_service
+
+
+def test_ceo_dashboard_reports_real_llm_cost(monkeypatch):
+    seen = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen["path"] = request.url.path
+        seen["tenant_id"] = request.url.params["tenant_id"]
+        seen["authorization"] = request.headers["Authorization"]
+        return httpx.Response(200, json={"days": [], "totals": [{"tenant_id": 7, "cost_usd": 12.5}]})
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        analytics_service.httpx,
+        "AsyncClient",
+        lambda **kwargs: real_client(transport=httpx.MockTransport(handler), **kwargs),
+    )
+    token = jwt.encode({"tenant_id": 7, "role": "ceo"}, analytics_routes.JWT_SECRET_KEY, algorithm="HS256")
+
+    app = FastAPI()
+    app.include_router(analytics_routes.router)
+    response = TestClient(app).get("/admin/analytics/ceo", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 200
+    assert response.json()["ia_api_cost"] == 12.5
+    assert response.json()["ai_roi"] != 0
+    assert seen == {
+        "path": "/admin/analytics/llm-usage",
+        "tenant_id": "7",
+        "authorization": f"Bearer {token}",
+    }
@@ -0,0 +1,76 @@
+import gzip
+import json
+from datetime import date, datetime, timezone
+
+import pytest
+
+import chat_archiver as ca
+from chat_archiver import ChatArchiver, archive_cutoff, partition_month
+
+
+ROWS = [
+    {"id": 1, "from_number": "+549", "role": "user", "content": "hola", "tenant_id": 1,
+     "created_at": datetime(2024, 1, 3, tzinfo=timezone.utc), "correlation_id": None},
+    {"id": 2, "from_number": "+549", "role": "assistant", "content": "¡Hola!", "tenant_id": 1,
+     "created_at": datetime(2024, 1, 3, 0, 1, tzinfo=timezone.utc), "correlation_id": "c-1"},
+]
+
+
+@pytest.fixture
+def archive_pool(monkeypatch, fake_pool):
+    """El lock libre y el COUNT de la partición coinciden con las filas exportadas."""
+
+    def configure(lock_free=True, count=len(ROWS)):
+        fake_pool.respond(
+            fetch=ROWS,
+            fetchval=lambda query, *args: lock_free if "pg_try_advisory_xact_lock" in query else count,
+        )
+        monkeypatch.setattr(ca.db, "pool", fake_pool)
+        return fake_pool.conn
+
+    return configure
+
+
+def test_only_monthly_partitions_before_the_cutoff_are_archivable():
+    assert archive_cutoff(date(2025, 3, 15), 12) == date(2024, 3, 1)
+    assert archive_cutoff(date(2025, 1, 1), 1) == date(2024, 12, 1)
+    assert partition_month("chat_messages_default") is None
+
+    partitions = ["chat_messages_default", "chat_messages_p202401", "chat_messages_p202402", "chat_messages_p202403"]
+    assert ChatArchiver.archivable(partitions, months=12, today=date(2025, 3, 15)) == [
+        "chat_messages_p202401",
+        "chat_messages_p202402",
+    ]
+    assert ChatArchiver.archivable(partitions, months=0, today=date(2025, 3, 15)) == []
+
+
+@pytest.mark.asyncio
+async def test_archive_exports_jsonl_gz_then_detaches(archive_pool, tmp_path):
+    conn = archive_pool()
+
+    rows = await ChatArchiver().archive_partition("chat_messages_p202401", str(tmp_path))
+
+    assert rows == 2
+    with gzip.open(tmp_path / "chat_messages_p202401.jsonl.gz", "rt", encoding="utf-8") as fh:
+        exported = [json.loads(line) for line in fh]
+    assert [r["content"] for r in exported] == ["hola", "¡Hola!"]
+    assert exported[0]["created_at"].startswith("2024-01-03")
+    assert any("DETACH PARTITION \"chat_messages_p202401\"" in q for q in conn.executed)
+    assert any(q.startswith("DROP TABLE") for q in conn.executed)
+
+
+@pytest.mark.asyncio
+async def test_archive_keeps_partition_when_export_does_not_match(archive_pool, tmp_path):
+    conn = archive_pool(count=3)
+
+    with pytest.raises(RuntimeError):
+        await ChatArchiver().archive_partition("chat_messages_p202401", str(tmp_path))
+
+    assert list(tmp_path.iterdir()) == []
+    assert not any("DETACH" in q for q in conn.executed)
+
+
+@pytest.mark.asyncio
+async def test_archive_skips_when_another_process_holds_the_lock(archive_pool, tmp_path):
+    archive_pool(lock_free=False)
+    assert await ChatArchiver().archive_partition("chat_messages_p202401", str(tmp_path)) is None
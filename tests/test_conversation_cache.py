@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import conversation_cache as cc
+from conversation_cache import ConversationCache
+
+PHONE = "+5491100000000"
+
+
+@pytest.fixture
+def pool(monkeypatch, fake_pool):
+    fake_pool.messages = [
+        {"id": i, "role": "user" if i % 2 else "assistant", "content": f"m{i}"}
+        for i in range(1, 6)
+    ]
+    fake_pool.patient = {"human_handoff_requested": False, "human_override_until": None}
+    fake_pool.respond(
+        fetch=lambda query, phone, tenant_id, limit: list(reversed(fake_pool.messages))[:limit],
+        fetchrow=lambda query, tenant_id, phone: fake_pool.patient,
+    )
+    monkeypatch.setattr(cc.db, "pool", fake_pool, raising=False)
+
+    async def append_chat_message(from_number, role, content, correlation_id, tenant_id):
+        message = {"id": len(fake_pool.messages) + 1, "role": role, "content": content}
+        fake_pool.messages.append(message)
+        return message["id"]
+
+    monkeypatch.setattr(cc.db, "append_chat_message", append_chat_message)
+    monkeypatch.setattr(cc, "CONVERSATION_CACHE_MESSAGES", 4)
+    return fake_pool
+
+
+@pytest.mark.asyncio
+async def test_messages_load_once_then_append_writes_through(pool, fake_redis):
+    cache = ConversationCache()
+    cache._redis = fake_redis
+
+    assert [m["id"] for m in await cache.recent_messages(PHONE, 1)] == [2, 3, 4, 5]
+    assert [m["id"] for m in await cache.recent_messages(PHONE, 1)] == [2, 3, 4, 5]
+    assert len(pool.calls) == 1
+
+    await cache.append_message(PHONE, "user", "hola", "corr-1", tenant_id=1)
+    recent = await cache.recent_messages(PHONE, 1)
+    assert [m["id"] for m in recent] == [3, 4, 5, 6]
+    assert recent[-1]["content"] == "hola"
+    assert len(pool.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_reload_is_discarded_when_a_write_races_it(pool, fake_redis):
+    cache = ConversationCache()
+    cache._redis = fake_redis
+    load = cache._load_messages
+
+    async def racing_load(phone, tenant_id, limit):
+        rows = await load(phone, tenant_id, limit)
+        # Otro worker escribe entre la lectura de Postgres y el guardado en Redis
+        await cache.append_message(PHONE, "assistant", "respuesta", "corr-2", tenant_id=1)
+        return rows
+
+    cache._load_messages = racing_load
+    stale = await cache.recent_messages(PHONE, 1)
+    assert [m["id"] for m in stale] == [2, 3, 4, 5]
+    assert cache.key(1, PHONE, "msgs") not in cache._redis.data
+
+    cache._load_messages = load
+    assert [m["id"] for m in await cache.recent_messages(PHONE, 1)] == [3, 4, 5, 6]
+
+
+@pytest.mark.asyncio
+async def test_handoff_write_through_and_postgres_fallback(pool, fake_redis):
+    cache = ConversationCache()
+    cache._redis = fake_redis
+
+    assert (await cache.get_handoff(1, PHONE))["human_handoff_requested"] is False
+    until = datetime.now(timezone.utc) + timedelta(hours=24)
+    await cache.set_handoff(1, PHONE, True, until)
+    state = await cache.get_handoff(1, PHONE)
+    assert state == {"human_handoff_requested": True, "human_override_until": until}
+    assert len(pool.calls) == 1
+
+    async def broken(*args, **kwargs):
+        raise ConnectionError("redis down")
+
+    cache._redis.hgetall = broken
+    pool.patient = {"human_handoff_requested": True, "human_override_until": until}
+    assert (await cache.get_handoff(1, PHONE))["human_handoff_requested"] is True
+    assert len(pool.calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_reload_that_already_saw_the_new_message_does_not_duplicate_it(
+    pool, fake_redis, monkeypatch
+):
+    cache = ConversationCache()
+    cache._redis = fake_redis
+    insert = cc.db.append_chat_message
+
+    async def insert_then_reload(**kwargs):
+        message_id = await insert(**kwargs)
+        # Otro request recarga la lista (TTL vencido) antes del RPUSHX de este mensaje
+        await cache.recent_messages(PHONE, 1)
+        return message_id
+
+    monkeypatch.setattr(cc.db, "append_chat_message", insert_then_reload)
+    await cache.append_message(PHONE, "user", "hola", "corr-3", tenant_id=1)
+
+    assert [m["id"] for m in await cache.recent_messages(PHONE, 1)] == [3, 4, 5, 6]
+
+    # Aunque la lista llegue a tener el id repetido, la lectura lo devuelve una vez
+    key = cache.key(1, PHONE, "msgs")
+    cache._redis.data[key].append(cache._redis.data[key][-1])
+    assert [m["id"] for m in await cache.recent_messages(PHONE, 1)] == [3, 4, 5, 6]
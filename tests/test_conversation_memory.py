@@ -0,0 +1,49 @@
+import pytest
+
+import conversation_memory as cm
+from conversation_memory import ConversationMemory, fit_to_budget
+
+
+def test_fit_to_budget_drops_oldest_and_keeps_last_turn():
+    messages = [{"role": "user", "content": "x" * 400} for _ in range(5)]
+    kept = fit_to_budget("resumen", messages, budget=10)
+    assert kept == messages[-2:]
+    assert fit_to_budget(None, messages, budget=10_000) == messages
+
+
+@pytest.mark.asyncio
+async def test_maybe_summarize_folds_messages_outside_recent_window(monkeypatch, fake_pool):
+    messages = [
+        {"id": i, "role": "user" if i % 2 else "assistant", "content": f"m{i}"}
+        for i in range(1, 21)
+    ]
+    summary = {}
+
+    def save_summary(query, tenant_id, phone, text, until_id, count):
+        summary.update(summary=text, summarized_until_id=until_id, summarized_messages=count)
+
+    fake_pool.respond(
+        fetchrow=lambda query, *args: summary or None,
+        fetch=lambda query, phone, tenant_id, until_id, limit: [
+            m for m in messages if m["id"] > until_id
+        ][:limit],
+        execute=save_summary,
+    )
+    monkeypatch.setattr(cm.db, "pool", fake_pool, raising=False)
+    monkeypatch.setattr(cm, "HISTORY_RECENT_MESSAGES", 8)
+    monkeypatch.setattr(cm, "HISTORY_SUMMARY_BATCH", 10)
+
+    memory = ConversationMemory()
+    folded = []
+
+    async def fake_summarize(previous, rows, tenant_id=None):
+        folded.extend(r["id"] for r in rows)
+        return "• Paciente interesado en limpieza"
+
+    monkeypatch.setattr(memory, "_summarize", fake_summarize)
+
+    assert await memory.maybe_summarize("+5491100000000", 1) is True
+    assert folded == list(range(1, 13))
+    assert summary["summarized_until_id"] == 12
+    # Quedan 8 mensajes sin resumir: por debajo del batch, no se vuelve a resumir
+    assert await memory.maybe_summarize("+5491100000000", 1) is False
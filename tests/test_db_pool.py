@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+import db as db_module
+from db import _encode_json, init_connection
+
+
+@pytest.mark.asyncio
+async def test_init_connection_registers_json_codecs_and_query_metrics(fake_conn):
+    conn = fake_conn
+    await init_connection(conn)
+
+    assert set(conn.codecs) == {"json", "jsonb"}
+    encoder, decoder, schema = conn.codecs["jsonb"]
+    assert schema == "pg_catalog"
+    assert decoder('{"monday": {"enabled": true}}') == {"monday": {"enabled": True}}
+    assert len(conn.query_loggers) == 1
+
+
+def test_json_encoder_accepts_dicts_and_already_serialized_strings():
+    hours = {"monday": {"enabled": True, "slots": []}}
+    assert json.loads(_encode_json(hours)) == hours
+    # Los llamadores existentes pasan json.dumps(...): no se vuelve a serializar
+    assert _encode_json(json.dumps(hours)) == json.dumps(hours)
+
+
+@pytest.mark.asyncio
+async def test_connect_uses_pool_settings_from_env(monkeypatch, fake_pool):
+    captured = {}
+    fake_pool.respond(fetch=[])  # catálogo vacío para schema_capabilities.refresh
+
+    async def create_pool(dsn, **kwargs):
+        captured.update(kwargs, dsn=dsn)
+        return fake_pool
+
+    monkeypatch.setattr(db_module.asyncpg, "create_pool", create_pool)
+    monkeypatch.setattr(db_module, "POSTGRES_DSN", "postgresql+asyncpg://u:p@db/x")
+    monkeypatch.setattr(db_module, "SCHEMA_AUTO_MIGRATE", False)
+    monkeypatch.setattr(db_module, "DB_POOL_MIN_SIZE", 20)
+    monkeypatch.setattr(db_module, "DB_POOL_MAX_SIZE", 5)
+    monkeypatch.setattr(db_module, "DB_STATEMENT_CACHE_SIZE", 0)
+
+    database = db_module.Database()
+    await database.connect()
+
+    assert captured["dsn"] == "postgresql://u:p@db/x"
+    assert (captured["min_size"], captured["max_size"]) == (5, 5)
+    assert captured["statement_cache_size"] == 0
+    assert captured["command_timeout"] is None
+    assert captured["init"] is init_connection
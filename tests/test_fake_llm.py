@@ -0,0 +1,40 @@
+import json
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from loadtest.fake_llm import FakeDentalChatModel
+
+TOOLS = [
+    {"type": "function", "function": {"name": name, "parameters": {}}}
+    for name in ("check_availability", "book_appointment", "list_services")
+]
+
+
+@pytest.mark.asyncio
+async def test_fake_model_emits_openai_tool_calls():
+    model = FakeDentalChatModel(latency_ms_min=0, latency_ms_max=0).bind(tools=TOOLS)
+    msg = await model.ainvoke(
+        [HumanMessage(content="Quiero agendar mañana a las 15:00 para limpieza, DNI 30111222")]
+    )
+    call = msg.additional_kwargs["tool_calls"][0]["function"]
+    assert call["name"] == "book_appointment"
+    args = json.loads(call["arguments"])
+    assert args["date_time"] == "mañana 15:00"
+    assert args["dni"] == "30111222"
+
+
+@pytest.mark.asyncio
+async def test_fake_model_answers_after_tool_result_and_skips_unbound_tools():
+    model = FakeDentalChatModel(latency_ms_min=0, latency_ms_max=0)
+    history = [
+        HumanMessage(content="Tienen disponibilidad para mañana?"),
+        AIMessage(content="", additional_kwargs={"tool_calls": []}),
+        ToolMessage(content="Para mañana hay de 09:00 a 12:00.", tool_call_id="call_1"),
+    ]
+    msg = await model.bind(tools=TOOLS).ainvoke(history)
+    assert msg.content.startswith("Para mañana hay de 09:00 a 12:00.")
+
+    # Sin tools enlazadas nunca inventa una tool call
+    msg = await model.ainvoke([HumanMessage(content="Tienen disponibilidad para mañana?")])
+    assert not msg.additional_kwargs.get("tool_calls")
@@ -0,0 +1,69 @@
+import pytest
+
+import inbound_dedup
+from inbound_dedup import InboundDeduplicator
+
+
+def _claim(dedup, message_id):
+    return dedup.claim(
+        provider="ycloud",
+        provider_message_id=message_id,
+        event_id=message_id,
+        from_number="+5491100000000",
+        payload={"text": "hola"},
+        correlation_id="corr-1",
+    )
+
+
+@pytest.mark.asyncio
+async def test_redis_rejects_duplicates_and_batches_postgres_writes(monkeypatch, fake_redis):
+    dedup = InboundDeduplicator()
+    dedup._redis = fake_redis
+    batches = []
+
+    async def insert_batch(records):
+        batches.append([r["provider_message_id"] for r in records])
+
+    async def try_insert(**kwargs):
+        raise AssertionError("no debe tocar Postgres en el camino crítico")
+
+    monkeypatch.setattr(inbound_dedup.db, "insert_inbound_batch", insert_batch, raising=False)
+    monkeypatch.setattr(inbound_dedup.db, "try_insert_inbound", try_insert)
+
+    assert await _claim(dedup, "wamid.1") is True
+    assert await _claim(dedup, "wamid.1") is False
+    assert await _claim(dedup, "wamid.2") is True
+    assert fake_redis.ttls["inbound:ycloud:wamid.1"] == inbound_dedup.INBOUND_DEDUP_TTL_SECONDS * 1000
+    assert batches == []
+
+    assert await dedup.flush() == 2
+    assert batches == [["wamid.1", "wamid.2"]]
+    assert dedup.stats()["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_falls_back_to_postgres_and_requeues_failed_flush(monkeypatch, fake_redis):
+    dedup = InboundDeduplicator()
+    dedup._redis = fake_redis
+    fake_redis.fail = True
+    seen = set()
+
+    async def try_insert(provider, provider_message_id, **kwargs):
+        if provider_message_id in seen:
+            return False
+        seen.add(provider_message_id)
+        return True
+
+    monkeypatch.setattr(inbound_dedup.db, "try_insert_inbound", try_insert)
+    assert await _claim(dedup, "wamid.9") is True
+    assert await _claim(dedup, "wamid.9") is False
+    assert dedup.stats()["pending"] == 0
+
+    async def broken_batch(records):
+        raise OSError("pool closed")
+
+    monkeypatch.setattr(inbound_dedup.db, "insert_inbound_batch", broken_batch, raising=False)
+    fake_redis.fail = False
+    await _claim(dedup, "wamid.10")
+    assert await dedup.flush() == 0
+    assert dedup.stats()["pending"] == 1 and dedup.flush_errors == 1
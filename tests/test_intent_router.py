@@ -0,0 +1,64 @@
+import pytest
+
+from intent_router import FastPathRouter
+
+
+class FakeTool:
+    def __init__(self, output):
+        self.output = output
+        self.calls = []
+
+    async def ainvoke(self, args):
+        self.calls.append(args)
+        return self.output
+
+
+def test_classify_high_confidence_intents():
+    router = FastPathRouter()
+    assert router.classify("Tengo algún turno?").intent == "list_my_appointments"
+    assert router.classify("qué tratamientos tienen").intent == "list_services"
+    assert router.classify("What treatments do you offer?").intent == "list_services"
+    match = router.classify("cancelame el turno de mañana")
+    assert match.intent == "cancel_appointment"
+    assert match.args == {"date_query": "mañana"}
+
+
+def test_ambiguous_or_agent_only_messages_fall_back():
+    router = FastPathRouter()
+    assert router.classify("quiero sacar turno para mañana") is None
+    assert router.classify("me duele una muela, tengo turno?") is None
+    assert router.classify("cancelá mi turno") is None  # sin fecha
+    assert router.classify("cancelá mi turno de hoy o mañana") is None
+    assert router.classify("hola") is None
+
+
+def test_negated_or_compound_cancellations_go_to_the_agent():
+    router = FastPathRouter()
+    assert router.classify("no quiero cancelar mi turno de mañana") is None
+    assert router.classify("quiero cancelar mi turno de mañana y sacar otro") is None
+    assert router.classify("cancelá mi turno de mañana, después vemos otro día") is None
+    assert router.classify("don't cancel my appointment tomorrow") is None
+    assert router.classify("cancel my appointment tomorrow and book another") is None
+    assert router.classify("je ne veux pas annuler mon rendez-vous demain") is None
+
+
+@pytest.mark.asyncio
+async def test_try_handle_renders_template_in_detected_language():
+    router = FastPathRouter()
+    tool = FakeTool(
+        "Tus próximos turnos:\n• Lunes 10/03 10:00 con Dra. Pérez (limpieza)\n"
+    )
+    reply = await router.try_handle(
+        "When is my next appointment?", "en", {"list_my_appointments": tool}
+    )
+    assert tool.calls == [{}]
+    assert "Lunes 10/03 10:00 with Dra. Pérez (limpieza)" in reply
+    assert router.stats.report()["total_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_try_handle_tool_error_delegates_to_agent():
+    router = FastPathRouter()
+    tool = FakeTool("⚠️ Error al consultar servicios.")
+    assert await router.try_handle("qué servicios hay", "es", {"list_services": tool}) is None
+    assert router.stats.fallbacks == 1
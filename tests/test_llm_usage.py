@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+import pytest
+
+import llm_usage
+from llm_usage import LLMUsageRecorder, UsageCollector, estimate_cost_usd
+
+
+def test_cost_uses_longest_price_prefix_and_cached_discount():
+    assert estimate_cost_usd("gpt-4o-mini-2024-07-18", 1_000_000, 0) == pytest.approx(0.15)
+    assert estimate_cost_usd("gpt-4o", 0, 1_000_000) == pytest.approx(10.0)
+    # La mitad del prompt vino de la caché de OpenAI: se cobra a precio de entrada cacheada
+    assert estimate_cost_usd("gpt-4o", 1_000_000, 0, cached_tokens=500_000) == pytest.approx(1.875)
+    assert estimate_cost_usd("desconocido", 1000, 1000) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_collector_and_batched_flush(monkeypatch, fake_pool):
+    usage = UsageCollector()
+    for _ in range(2):
+        await usage.on_llm_end(
+            SimpleNamespace(
+                llm_output={
+                    "model_name": "gpt-4o-mini",
+                    "token_usage": {
+                        "prompt_tokens": 1000,
+                        "completion_tokens": 100,
+                        "prompt_tokens_details": {"cached_tokens": 400},
+                    },
+                }
+            ),
+            run_id=None,
+        )
+    assert (usage.prompt_tokens, usage.completion_tokens, usage.cached_tokens, usage.llm_calls) == (
+        2000,
+        200,
+        800,
+        2,
+    )
+
+    written = []
+    fake_pool.respond(executemany=lambda query, rows: written.extend(rows))
+    monkeypatch.setattr(llm_usage.db, "pool", fake_pool, raising=False)
+    recorder = LLMUsageRecorder()
+    recorder.record(
+        tenant_id=3,
+        kind="agent",
+        route="fast",
+        model="gpt-4o-mini",
+        usage=usage,
+        tool_calls=1,
+        wall_ms=850,
+    )
+    assert written == []
+    assert await recorder.flush() == 1
+    row = written[0]
+    assert row[:10] == (3, "agent", "fast", "gpt-4o-mini", 2000, 200, 800, 2, 1, 850)
+    assert row[10] == pytest.approx(usage.cost_usd)
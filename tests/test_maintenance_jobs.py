@@ -0,0 +1,67 @@
+import pytest
+
+import maintenance_jobs as mj
+from maintenance_jobs import JOBS, MaintenanceJob, MaintenanceRunner
+
+
+class CountdownJob(MaintenanceJob):
+    """25 filas pendientes, la mitad necesita corrección."""
+
+    name = "countdown"
+    initial_cursor = 0
+
+    def __init__(self):
+        self.cursors = []
+
+    async def run_chunk(self, conn, cursor, batch_size):
+        self.cursors.append(cursor)
+        scanned = min(batch_size, 25 - cursor)
+        done = scanned < batch_size
+        return scanned, scanned // 2, None if done else cursor + scanned
+
+
+@pytest.fixture
+def runner(monkeypatch, fake_pool):
+    job = CountdownJob()
+    fake_pool.respond(fetchval=True)  # pg_try_advisory_lock libre
+    monkeypatch.setattr(mj.db, "pool", fake_pool)
+    monkeypatch.setitem(JOBS, job.name, job)
+    return MaintenanceRunner(), fake_pool.conn, job
+
+
+@pytest.mark.asyncio
+async def test_runs_in_keyset_chunks_with_one_transaction_each(runner):
+    maintenance, conn, job = runner
+    progress = []
+
+    result = await maintenance.run("countdown", batch_size=10, on_progress=progress.append)
+
+    assert job.cursors == [0, 10, 20]
+    assert (result["status"], result["chunks"], result["scanned"], result["changed"]) == ("ok", 3, 25, 12)
+    assert [p["scanned"] for p in progress] == [10, 20, 25]
+    assert (conn.commits, conn.rollbacks) == (3, 0)
+    assert any("pg_advisory_unlock" in q for q in conn.executed)
+
+
+@pytest.mark.asyncio
+async def test_dry_run_rolls_back_every_chunk(runner):
+    maintenance, conn, _ = runner
+    result = await maintenance.run("countdown", batch_size=10, dry_run=True)
+    assert result["changed"] == 12
+    assert (conn.commits, conn.rollbacks) == (0, 3)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_run_and_missing_schema_are_reported(runner, monkeypatch):
+    maintenance, conn, job = runner
+    conn.respond(fetchval=False)
+    assert (await maintenance.run("countdown"))["status"] == "locked"
+    assert job.cursors == []
+
+    monkeypatch.setattr(CountdownJob, "available", lambda self: False)
+    assert (await maintenance.run("countdown"))["status"] == "skipped"
+
+
+def test_chat_tenant_backfill_runs_before_orphaned_chats():
+    names = list(JOBS)
+    assert names.index("backfill_chat_tenant") < names.index("orphaned_chats")
@@ -0,0 +1,44 @@
+import pytest
+from prometheus_client import REGISTRY
+
+from metrics import StageTimer, current_stage_timer, instrument_tool, lap
+
+
+class FakeTool:
+    name = "list_services"
+
+    def __init__(self, result):
+        async def coroutine(category=None):
+            return result
+
+        self.coroutine = coroutine
+
+
+def _sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_stage_timer_records_laps_per_tenant():
+    timer = StageTimer("corr-1", tenant_id=7)
+    token = current_stage_timer.set(timer)
+    try:
+        before = _sample("orchestrator_chat_stage_seconds_count", {"stage": "dedup", "tenant_id": "7"})
+        lap("dedup")
+        lap("dedup")
+        after = _sample("orchestrator_chat_stage_seconds_count", {"stage": "dedup", "tenant_id": "7"})
+    finally:
+        current_stage_timer.reset(token)
+    assert after - before == 2
+    assert set(timer.stages) == {"dedup"}
+
+
+@pytest.mark.asyncio
+async def test_instrument_tool_labels_status_and_is_idempotent():
+    tool = instrument_tool(FakeTool("⚠️ Error al consultar servicios."))
+    wrapped = tool.coroutine
+    assert instrument_tool(tool).coroutine is wrapped
+
+    labels = {"tool": "list_services", "tenant_id": "none", "status": "error"}
+    before = _sample("orchestrator_tool_seconds_count", labels)
+    assert await tool.coroutine(category="x") == "⚠️ Error al consultar servicios."
+    assert _sample("orchestrator_tool_seconds_count", labels) - before == 1
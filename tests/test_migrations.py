@@ -0,0 +1,88 @@
+import logging
+
+import asyncpg
+import pytest
+
+from db import Database
+
+
+PATCHES = [
+    ("1", "uno", "ALTER TABLE a ADD COLUMN IF NOT EXISTS x INT;"),
+    ("2", "ceo", "UPDATE users SET status = 'active' WHERE role = 'ceo';"),
+    ("3", "tres", "CREATE INDEX IF NOT EXISTS idx_a ON a (x);"),
+]
+
+
+@pytest.fixture
+def database(fake_pool):
+    """Database sobre un ledger schema_migrations en memoria (None = tabla inexistente)."""
+    conn = fake_pool.conn
+    conn.ledger = None
+
+    def fetch(query, *args):
+        if conn.ledger is None:
+            raise asyncpg.exceptions.UndefinedTableError("schema_migrations")
+        return [{"version": v, "checksum": c} for v, c in conn.ledger.items()]
+
+    def execute(query, *args):
+        if "CREATE TABLE IF NOT EXISTS schema_migrations" in query:
+            conn.ledger = conn.ledger or {}
+        elif "INSERT INTO schema_migrations" in query:
+            conn.ledger[args[0]] = args[2]
+
+    conn.respond(fetch=fetch, execute=execute)
+    database = Database()
+    database.pool = fake_pool
+    return database
+
+
+@pytest.mark.asyncio
+async def test_patches_apply_once_then_startup_skips_them(database):
+    conn = database.pool.conn
+    logger = logging.getLogger("test")
+
+    first = await database._apply_patches(PATCHES, logger)
+    assert first["applied"] == 2
+    assert set(conn.ledger) == {"1", "3"}
+    assert any("pg_advisory_lock" in q for q in conn.executed)
+
+    conn.executed.clear()
+    second = await database._apply_patches(PATCHES, logger)
+    assert second["applied"] == 0
+    # Sin lock ni parches ya aplicados: solo el repetible (activación del CEO)
+    assert [q for q in conn.executed if "schema_migrations" not in q] == [PATCHES[1][2]]
+
+
+@pytest.mark.asyncio
+async def test_startup_defers_offline_patches_and_everything_after(database, monkeypatch):
+    import db as db_module
+
+    monkeypatch.setattr(db_module, "SCHEMA_OFFLINE_PATCHES", {"3"})
+    patches = PATCHES + [("4", "cuatro", "ALTER TABLE a ADD COLUMN IF NOT EXISTS y INT;")]
+    conn = database.pool.conn
+    logger = logging.getLogger("test")
+
+    boot = await database._apply_patches(patches, logger, allow_offline=False)
+    assert (boot["applied"], boot["deferred"]) == (1, ["3", "4"])
+    assert set(conn.ledger) == {"1"}
+
+    # migrate.py (offline) aplica lo diferido en orden
+    offline = await database._apply_patches(patches, logger, allow_offline=True)
+    assert (offline["applied"], offline["deferred"]) == (2, [])
+    assert set(conn.ledger) == {"1", "3", "4"}
+
+
+@pytest.mark.asyncio
+async def test_evolution_pipeline_versions_are_unique(database):
+    conn = database.pool.conn
+
+    result = await database._run_evolution_pipeline(logging.getLogger("test"))
+    assert result["applied"] == result["total"] - 1
+    assert len(conn.ledger) == result["applied"]
+
+
+def test_checksum_ignores_indentation_only():
+    a = Database._patch_checksum("\n    ALTER TABLE a ADD x INT;\n")
+    b = Database._patch_checksum("ALTER TABLE a ADD x INT;")
+    assert a == b
+    assert a != Database._patch_checksum("ALTER TABLE a ADD y INT;")
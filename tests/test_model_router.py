@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import pytest
+
+from model_router import ModelRouter, escalation_reason
+
+
+def _step(tool, observation):
+    return (SimpleNamespace(tool=tool), observation)
+
+
+class ScriptedExecutor:
+    def __init__(self, model, results, calls):
+        self.model = model
+        self.results = results
+        self.calls = calls
+
+    async def ainvoke(self, inputs, config=None):
+        self.calls.append(self.model)
+        return self.results[self.model]
+
+
+def _router(results, calls):
+    router = ModelRouter(lambda llm: None)
+    router.executor = lambda model, fallback: ScriptedExecutor(model, results, calls)
+    return router
+
+
+CONFIG = {
+    "model_routing": {
+        "fast": "cheap",
+        "default": "mid",
+        "strong": "big",
+        "fallback": "",
+        "fast_max_words": 4,
+    }
+}
+
+
+@pytest.mark.asyncio
+async def test_short_turns_use_fast_tier_and_data_turns_use_default():
+    calls = []
+    ok = {"output": "listo", "intermediate_steps": []}
+    router = _router({"cheap": ok, "mid": ok, "big": ok}, calls)
+
+    await router.run({}, "ok gracias!", tenant_id=1, tenant_config=CONFIG)
+    await router.run({}, "turno mañana 15:00", tenant_id=1, tenant_config=CONFIG)
+    # El JSON crudo de tenants.config (asyncpg sin codec) también se acepta
+    await router.run({}, "hola", tenant_id=1, tenant_config='{"model_routing": {"fast": "mid"}}')
+    assert calls == ["cheap", "mid", "mid"]
+
+
+@pytest.mark.asyncio
+async def test_tool_error_escalates_once_to_strong_tier():
+    calls = []
+    failed = {"output": "No pude", "intermediate_steps": [_step("check_availability", "⚠️ error")]}
+    router = _router(
+        {"cheap": failed, "big": {"output": "Tengo 10:00 y 11:00", "intermediate_steps": []}},
+        calls,
+    )
+    assert await router.run({}, "hay lugar?", tenant_id=2, tenant_config=CONFIG) == "Tengo 10:00 y 11:00"
+    assert calls == ["cheap", "big"]
+
+
+def test_no_escalation_after_a_successful_booking():
+    result = {
+        "output": "",
+        "intermediate_steps": [
+            _step("book_appointment", "Turno confirmado"),
+            _step("list_my_appointments", "⚠️ error"),
+        ],
+    }
+    assert escalation_reason(result) is None
+    assert escalation_reason({"output": "Agent stopped due to iteration limit"}) == "iteration_limit"
@@ -0,0 +1,51 @@
+import pytest
+
+import override_sweeper as osw
+from override_sweeper import OverrideSweeper
+from realtime import CoalescingEmitter
+
+
+@pytest.mark.asyncio
+async def test_sweep_clears_in_batches_and_emits_one_frame_per_tenant(monkeypatch):
+    expired = [
+        {"tenant_id": 1, "phone_number": "+5491100000001"},
+        {"tenant_id": 2, "phone_number": "+5491100000002"},
+        {"tenant_id": 1, "phone_number": "+5491100000003"},
+    ]
+
+    async def clear_expired_overrides(batch_size):
+        batch = expired[:batch_size]
+        del expired[:batch_size]
+        return batch
+
+    invalidated = []
+
+    async def invalidate(tenant_id, phone):
+        invalidated.append((tenant_id, phone))
+
+    async def set_handoff(*args):
+        raise AssertionError("el sweeper no debe pisar el estado cacheado")
+
+    monkeypatch.setattr(osw.db, "clear_expired_overrides", clear_expired_overrides)
+    monkeypatch.setattr(osw.conversation_cache, "set_handoff", set_handoff)
+    monkeypatch.setattr(osw.conversation_cache, "invalidate", invalidate)
+
+    sent = []
+
+    async def emit(event, data, room=None):
+        sent.append((room, event, data))
+
+    coalescer = CoalescingEmitter(emit, window_ms=1000)
+    sweeper = OverrideSweeper(
+        lambda tenant_id, events: coalescer.emit_frame(f"tenant:{tenant_id}", events)
+    )
+
+    assert await sweeper.sweep(batch_size=2) == 3
+    assert invalidated == [(1, "+5491100000001"), (2, "+5491100000002"), (1, "+5491100000003")]
+    assert [(room, event) for room, event, _ in sent] == [
+        ("tenant:1", "EVENT_BATCH"),
+        ("tenant:2", "HUMAN_OVERRIDE_CHANGED"),
+    ]
+    phones = [e["data"]["phone_number"] for e in sent[0][2]["events"]]
+    assert phones == ["+5491100000001", "+5491100000003"]
+    assert await sweeper.sweep() == 0
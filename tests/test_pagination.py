@@ -0,0 +1,46 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException, Response
+
+from pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor, keyset_page
+
+
+def test_cursor_round_trip_is_opaque_and_url_safe():
+    created = datetime(2025, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    cursor = encode_cursor(created, 9876)
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+    assert decode_cursor(cursor) == (created, 9876)
+
+
+@pytest.mark.parametrize("bad", ["", "no-es-un-cursor", "eyJhIjoxfQ"])  # el último: {"a":1}
+def test_invalid_cursor_is_a_400(bad):
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(bad)
+    assert exc.value.status_code == 400
+
+
+def test_keyset_page_sets_next_cursor_only_when_there_is_more():
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    rows = [{"id": i, "created_at": base - timedelta(minutes=i)} for i in range(4)]
+    key = lambda r: (r["created_at"], r["id"])
+
+    response = Response()
+    page, cursor = keyset_page(rows, 3, key, response)
+    assert [r["id"] for r in page] == [0, 1, 2]
+    assert decode_cursor(cursor) == (rows[2]["created_at"], 2)
+    assert response.headers[NEXT_CURSOR_HEADER] == cursor
+
+    response = Response()
+    page, cursor = keyset_page(rows[:3], 3, key, response)
+    assert cursor is None and NEXT_CURSOR_HEADER not in response.headers
+
+
+def test_uuid_ids_round_trip_as_text():
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    rows = [{"id": uuid.uuid4(), "appointment_datetime": base + timedelta(minutes=i)} for i in range(3)]
+
+    page, cursor = keyset_page(rows, 2, lambda r: (r["appointment_datetime"], r["id"]))
+    assert page == rows[:2]
+    assert decode_cursor(cursor) == (rows[1]["appointment_datetime"], str(rows[1]["id"]))
@@ -0,0 +1,63 @@
+import logging
+
+import query_stats as qs
+from metrics import StageTimer, current_stage_timer
+from query_stats import QueryStats, _rows_from_status, fingerprint, normalize_query
+
+
+def test_literals_and_param_lists_share_a_fingerprint():
+    a = normalize_query("SELECT * FROM patients WHERE tenant_id = 1 AND phone_number = '+549'")
+    b = normalize_query("SELECT  *  FROM patients\n WHERE tenant_id = 22 AND phone_number = 'x'  -- nota")
+    assert fingerprint(a) == fingerprint(b)
+    assert a == "SELECT * FROM patients WHERE tenant_id = ? AND phone_number = ?"
+
+    in2 = normalize_query("SELECT id FROM chat_messages WHERE id IN ($1, $2)")
+    in5 = normalize_query("SELECT id FROM chat_messages WHERE id IN ($1, $2, $3, $4, $5)")
+    assert in2 == in5
+    # $1 como parámetro no se confunde con un literal numérico
+    assert normalize_query("SELECT $1::int") == "SELECT $1::int"
+
+
+def test_top_orders_by_total_and_reports_p95_and_rows():
+    stats = QueryStats()
+    for _ in range(19):
+        stats.record("SELECT 1 FROM a WHERE x = 5", 0.001, rows=2)
+    stats.record("SELECT 1 FROM a WHERE x = 6", 0.5, rows=2)
+    stats.record("UPDATE b SET y = 1", 0.2, rows=1)
+
+    top = stats.top(limit=5)
+    assert [row["calls"] for row in top] == [20, 1]
+    assert top[0]["rows"] == 40 and top[0]["avg_rows"] == 2.0
+    assert top[0]["p95_ms"] == 1.0 and top[0]["max_ms"] == 500.0
+    assert stats.top(order_by="calls")[0]["fingerprint"] == top[0]["fingerprint"]
+
+
+def test_slow_query_logs_caller_and_correlation_id(monkeypatch, caplog):
+    monkeypatch.setattr(qs, "DB_SLOW_QUERY_MS", 100)
+    stats = QueryStats()
+    token = current_stage_timer.set(StageTimer("req-123", tenant_id=1))
+    try:
+        with caplog.at_level(logging.WARNING, logger="query_stats"):
+            stats.record("SELECT 1", 0.05)
+            stats.record("SELECT * FROM slow WHERE id = 9", 0.25, rows=3, caller="db.py:10 get_x")
+    finally:
+        current_stage_timer.reset(token)
+
+    assert len(caplog.records) == 1
+    message = caplog.records[0].getMessage()
+    assert "caller=db.py:10 get_x" in message and "correlation_id=req-123" in message
+
+
+def test_fingerprint_cap_drops_new_shapes(monkeypatch):
+    monkeypatch.setattr(qs, "QUERY_STATS_MAX_FINGERPRINTS", 1)
+    stats = QueryStats()
+    stats.record("SELECT a FROM t", 0.001)
+    stats.record("SELECT b FROM t", 0.001)
+    assert stats.stats()["fingerprints"] == 1 and stats.dropped == 1
+
+
+def test_rows_from_command_status():
+    assert _rows_from_status("UPDATE 5") == 5
+    assert _rows_from_status("INSERT 0 3") == 3
+    assert _rows_from_status("CREATE INDEX") == 0
+    assert _rows_from_status(None) == 0
@@ -0,0 +1,77 @@
+import pytest
+
+import db as db_module
+from db import Database, current_read_key, current_read_sticky
+
+
+@pytest.fixture
+def make_database(make_fake_pool):
+    """Database con primario y réplica; replica_row es la respuesta de la consulta de lag."""
+
+    def build(replica_row=None):
+        database = Database()
+        database.pool = make_fake_pool(fetchval="0/3000000")
+        database.replica_pool = make_fake_pool(fetchrow=replica_row)
+        return database
+
+    return build
+
+
+def test_reader_uses_primary_without_replica_or_when_lagging(
+    monkeypatch, make_database, make_fake_pool
+):
+    monkeypatch.setattr(db_module, "DB_REPLICA_MAX_LAG_SECONDS", 5)
+    database = Database()
+    database.pool = make_fake_pool()
+    assert database.reader() is database.pool
+
+    database = make_database()
+    assert database.reader() is database.pool  # lag todavía sin medir
+    database.replica_lag = 0.4
+    assert database.reader() is database.replica_pool
+    database.replica_lag = 30
+    assert database.reader() is database.pool
+
+
+@pytest.mark.asyncio
+async def test_reader_is_sticky_to_primary_after_own_write_on_any_worker(
+    monkeypatch, make_database, fake_redis
+):
+    monkeypatch.setattr(db_module, "DB_READ_YOUR_WRITES_SECONDS", 10)
+    # Un mismo Redis para dos Database: simula dos workers
+    writer, other = make_database(), make_database()
+    for database in (writer, other):
+        database.replica_lag = 0.0
+        database._redis = fake_redis
+
+    await writer.mark_write("user-a")
+    assert fake_redis.ttls == {"ryw:user-a": 10000}
+    assert writer.reader("user-a") is writer.pool
+
+    # El próximo request cae en otro worker: el middleware resuelve la ventana contra Redis
+    assert await other.wrote_recently("user-a")
+    assert not await other.wrote_recently("user-b")
+    key_token = current_read_key.set("user-a")
+    sticky_token = current_read_sticky.set(True)
+    try:
+        assert other.reader() is other.pool
+    finally:
+        current_read_sticky.reset(sticky_token)
+        current_read_key.reset(key_token)
+    assert other.reader("user-b") is other.replica_pool
+
+    monkeypatch.setattr(db_module.time, "monotonic", lambda: 10**9)
+    assert writer.reader("user-a") is writer.replica_pool
+
+
+@pytest.mark.asyncio
+async def test_lag_is_zero_when_caught_up_even_if_primary_is_idle(make_database):
+    database = make_database({"in_recovery": True, "caught_up": True, "replay_age": 3600.0})
+    assert await database.check_replica_lag() == 0.0
+
+    database = make_database({"in_recovery": True, "caught_up": False, "replay_age": 7.5})
+    assert await database.check_replica_lag() == 7.5
+
+    database = make_database(ConnectionError("replica down"))
+    assert await database.check_replica_lag() is None
+    assert database.reader() is database.pool
@@ -0,0 +1,84 @@
+import asyncio
+import json
+import uuid
+from datetime import datetime
+
+import pytest
+
+import realtime
+from realtime import ExternalEmitter, _SafeJson, tenant_room
+
+
+@pytest.mark.asyncio
+async def test_external_emitter_publishes_to_tenant_room(monkeypatch):
+    monkeypatch.setattr(realtime, "REDIS_URL", "redis://localhost:6379")
+    emitter = ExternalEmitter()
+    manager = emitter._get_manager()
+    assert manager.write_only and manager.channel == realtime.SOCKETIO_REDIS_CHANNEL
+
+    published = []
+
+    async def fake_publish(data):
+        published.append(data)
+
+    monkeypatch.setattr(manager, "_publish", fake_publish)
+    assert await emitter.emit_to_tenant("NEW_APPOINTMENT", {"id": 1, "tenant_id": 7})
+    # Sin clínica no se publica nada (no se difunde a todas las salas)
+    assert not await emitter.emit_to_tenant("NEW_APPOINTMENT", {"id": 2})
+
+    assert len(published) == 1
+    assert published[0]["event"] == "NEW_APPOINTMENT"
+    assert published[0]["room"] == tenant_room(7) == "tenant:7"
+    assert published[0]["namespace"] == "/"
+
+
+@pytest.mark.asyncio
+async def test_without_redis_uses_in_memory_manager(monkeypatch):
+    monkeypatch.setattr(realtime, "REDIS_URL", "")
+    assert realtime.build_client_manager() is None
+    assert not await ExternalEmitter().emit_to_tenant("PATIENT_UPDATED", {"tenant_id": 1})
+
+
+def test_safe_json_serializes_uuid_and_datetime():
+    uid = uuid.uuid4()
+    decoded = json.loads(_SafeJson.dumps({"id": uid, "at": datetime(2026, 3, 2, 10, 30)}))
+    assert decoded == {"id": str(uid), "at": "2026-03-02T10:30:00"}
+
+
+class RecordingEmit:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, event, data, room=None):
+        self.calls.append((room, event, data))
+
+
+@pytest.mark.asyncio
+async def test_coalescer_batches_per_room_and_merges_patient_updates():
+    emit = RecordingEmit()
+    coalescer = realtime.CoalescingEmitter(emit, window_ms=20)
+
+    await coalescer.emit("tenant:1", "NEW_MESSAGE", {"role": "user", "message": "hola"})
+    await coalescer.emit("tenant:1", "PATIENT_UPDATED", {"patient_id": 5, "updated_fields": ["email"]})
+    await coalescer.emit("tenant:2", "NEW_APPOINTMENT", {"id": 9})
+    await coalescer.emit("tenant:1", "NEW_MESSAGE", {"role": "assistant", "message": "hola!"})
+    await coalescer.emit("tenant:1", "PATIENT_UPDATED", {"patient_id": 5, "updated_fields": ["phone"]})
+    assert emit.calls == []
+
+    await asyncio.sleep(0.05)
+    by_room = {room: (event, data) for room, event, data in emit.calls}
+    assert len(emit.calls) == 2
+    # Un solo evento en la sala: viaja con su nombre original
+    assert by_room["tenant:2"] == ("NEW_APPOINTMENT", {"id": 9})
+    event, frame = by_room["tenant:1"]
+    assert event == realtime.BATCH_EVENT
+    assert [e["event"] for e in frame["events"]] == ["NEW_MESSAGE", "NEW_MESSAGE", "PATIENT_UPDATED"]
+    assert frame["events"][-1]["data"]["updated_fields"] == ["email", "phone"]
+
+
+@pytest.mark.asyncio
+async def test_coalescer_disabled_emits_immediately():
+    emit = RecordingEmit()
+    coalescer = realtime.CoalescingEmitter(emit, window_ms=0)
+    await coalescer.emit("tenant:3", "HUMAN_HANDOFF", {"phone_number": "+1"})
+    assert emit.calls == [("tenant:3", "HUMAN_HANDOFF", {"phone_number": "+1"})]
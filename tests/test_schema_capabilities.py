@@ -0,0 +1,36 @@
+import pytest
+
+from schema_capabilities import SchemaCapabilities
+
+
+def _rows(table, *columns):
+    return [{"table_name": table, "column_name": c} for c in columns]
+
+
+@pytest.mark.asyncio
+async def test_flags_come_from_a_single_catalog_read(make_fake_pool):
+    caps = SchemaCapabilities()
+    # Antes de introspeccionar se asume el esquema migrado
+    assert caps.has_chat_tenant_id and not caps.loaded
+
+    pool = make_fake_pool(
+        fetch=_rows("chat_messages", "id", "from_number", "content")
+        + _rows("professionals", "id", "first_name", "tenant_id")
+    )
+    assert await caps.refresh(pool) is True
+    assert len(pool.calls) == 1
+
+    assert not caps.has_chat_tenant_id
+    assert caps.has_professional_tenant_id
+    assert not caps.has_professional_last_name
+    assert caps.missing()["chat_messages"] == ["tenant_id"]
+    assert "last_name" in caps.missing()["professionals"]
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_keeps_previous_flags(make_fake_pool):
+    caps = SchemaCapabilities()
+    await caps.refresh(make_fake_pool(fetch=_rows("chat_messages", "tenant_id")))
+    assert await caps.refresh(make_fake_pool(fetch=RuntimeError("db down"))) is False
+    assert caps.has_chat_tenant_id
+    assert not caps.has_column("professionals", "tenant_id")
@@ -0,0 +1,139 @@
+import pytest
+from contextvars import ContextVar
+from types import SimpleNamespace
+from typing import Optional
+
+import tool_cache as tc
+from tool_cache import ToolResultCache
+
+tenant_var: ContextVar[int] = ContextVar("tenant_var", default=1)
+
+
+@pytest.fixture(autouse=True)
+def single_worker(monkeypatch):
+    # conftest define REDIS_URL; sin suscripción activa el cache no memoriza
+    monkeypatch.setattr(tc, "REDIS_URL", "")
+
+
+@pytest.mark.asyncio
+async def test_memoize_hits_and_normalizes_args():
+    cache = ToolResultCache()
+    calls = []
+
+    @cache.memoize(ttl=60, topics=("treatments",), scope=lambda: (tenant_var.get(),))
+    async def list_services(category: Optional[str] = None):
+        calls.append(category)
+        return f"servicios {category}"
+
+    assert await list_services() == "servicios None"
+    assert await list_services(category=None) == "servicios None"
+    await list_services(category=" Prevention ")
+    await list_services(category="prevention")
+    assert calls == [None, " Prevention "]
+    assert cache.stats()["hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_scope_isolates_tenants_and_invalidate_by_topic():
+    cache = ToolResultCache()
+    calls = []
+
+    @cache.memoize(ttl=60, topics=("professionals",), scope=lambda: (tenant_var.get(),))
+    async def list_professionals():
+        calls.append(tenant_var.get())
+        return "profesionales"
+
+    await list_professionals()
+    tenant_var.set(2)
+    await list_professionals()
+    await list_professionals()
+    assert calls == [1, 2]
+
+    assert cache.invalidate("treatments", 2) == 0
+    assert cache.invalidate("professionals", 2) == 1
+    await list_professionals()
+    assert calls == [1, 2, 2]
+    tenant_var.set(1)
+
+
+@pytest.mark.asyncio
+async def test_error_results_are_not_cached():
+    cache = ToolResultCache()
+    calls = []
+
+    @cache.memoize(ttl=60, topics=("appointments",), scope=lambda: (1,))
+    async def check_availability(date_query: str):
+        calls.append(date_query)
+        return "⚠️ Error al consultar."
+
+    await check_availability("mañana")
+    await check_availability("mañana")
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_error_replies_are_not_memoized():
+    cache = ToolResultCache()
+    calls = []
+
+    @cache.memoize(ttl=60, topics=("professionals",), scope=lambda: (1,))
+    async def check_availability(professional_name: str):
+        calls.append(professional_name)
+        return "❌ No encontré al profesional indicado."
+
+    await check_availability("Pérez")
+    await check_availability("Pérez")
+    assert calls == ["Pérez", "Pérez"]
+
+
+@pytest.mark.asyncio
+async def test_invalidations_from_other_workers_apply_and_own_echo_is_ignored(monkeypatch):
+    import json
+
+    cache = ToolResultCache()
+    calls = []
+
+    @cache.memoize(ttl=60, topics=("appointments",), scope=lambda: (1, "+549"))
+    async def list_my_appointments():
+        calls.append(1)
+        return "turnos"
+
+    await list_my_appointments()
+    cache._apply_remote(json.dumps({"origin": cache._origin, "topic": "appointments", "tenant_id": 1}))
+    await list_my_appointments()
+    assert len(calls) == 1
+
+    cache._apply_remote(json.dumps({"origin": "otro-worker", "topic": "appointments", "tenant_id": 1}))
+    await list_my_appointments()
+    assert len(calls) == 2 and cache.stats()["remote_invalidations"] == 1
+
+    # Con Redis configurado pero sin suscripción activa no se memoriza
+    monkeypatch.setattr(tc, "REDIS_URL", "redis://localhost:6379/0")
+    await list_my_appointments()
+    await list_my_appointments()
+    assert len(calls) == 4
+
+
+@pytest.mark.asyncio
+async def test_appointment_routes_invalidate_only_their_clinic(monkeypatch, fake_pool):
+    import admin_routes
+
+    invalidated = []
+    monkeypatch.setattr(
+        admin_routes.tool_cache,
+        "invalidate",
+        lambda topic, tenant_id=None: invalidated.append((topic, tenant_id)),
+    )
+    monkeypatch.setattr(admin_routes.db, "pool", fake_pool, raising=False)
+    request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace()))
+
+    fake_pool.respond(fetchval=7, fetchrow=None)  # UPDATE ... RETURNING tenant_id
+    status = admin_routes.StatusUpdate(status="attended")
+    await admin_routes.update_appointment_status("apt-1", status, request)
+
+    fake_pool.respond(
+        fetchrow={"google_calendar_event_id": None, "professional_id": 2, "tenant_id": 9}
+    )
+    await admin_routes.delete_appointment("apt-2", request)
+
+    assert invalidated == [("appointments", 7), ("appointments", 9)]
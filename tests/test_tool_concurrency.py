@@ -0,0 +1,76 @@
+import asyncio
+import time
+from contextvars import ContextVar
+
+import pytest
+from langchain.tools import tool
+
+from tool_concurrency import begin_agent_turn, bind_tool_concurrency
+
+tenant_var: ContextVar[int] = ContextVar("tenant_var", default=0)
+
+
+def _make_tools(log):
+    @tool
+    async def read_a(day: str) -> str:
+        """Lectura lenta A."""
+        log.append(("start", "a", tenant_var.get()))
+        await asyncio.sleep(0.1)
+        return f"a {day}"
+
+    @tool
+    async def read_b(day: str) -> str:
+        """Lectura lenta B."""
+        log.append(("start", "b", tenant_var.get()))
+        await asyncio.sleep(0.1)
+        return f"b {day}"
+
+    @tool
+    async def write_c(day: str) -> str:
+        """Escritura."""
+        log.append(("start", "c", day))
+        await asyncio.sleep(0.05)
+        log.append(("end", "c", day))
+        return f"c {day}"
+
+    return read_a, read_b, write_c
+
+
+@pytest.mark.asyncio
+async def test_reads_overlap_and_see_turn_contextvars():
+    log = []
+    read_a, read_b, _ = _make_tools(log)
+    for t in (read_a, read_b):
+        bind_tool_concurrency(t, mutating=False, timeout=1)
+    tenant_var.set(7)
+    begin_agent_turn()
+
+    started = time.perf_counter()
+    results = await asyncio.gather(read_a.arun({"day": "lunes"}), read_b.arun({"day": "martes"}))
+    assert results == ["a lunes", "b martes"]
+    assert time.perf_counter() - started < 0.18
+    assert {entry[2] for entry in log} == {7}
+
+
+@pytest.mark.asyncio
+async def test_mutating_tools_run_one_at_a_time_within_a_turn():
+    log = []
+    _, _, write_c = _make_tools(log)
+    bind_tool_concurrency(write_c, mutating=True)
+    begin_agent_turn()
+
+    await asyncio.gather(write_c.arun({"day": "1"}), write_c.arun({"day": "2"}))
+    assert [entry[0] for entry in log] == ["start", "end", "start", "end"]
+
+
+@pytest.mark.asyncio
+async def test_slow_read_times_out_without_blocking_the_step():
+    log = []
+    read_a, read_b, _ = _make_tools(log)
+    bind_tool_concurrency(read_a, mutating=False, timeout=0.02)
+    bind_tool_concurrency(read_b, mutating=False, timeout=1)
+    begin_agent_turn()
+
+    slow, ok = await asyncio.gather(read_a.arun({"day": "x"}), read_b.arun({"day": "y"}))
+    assert slow.startswith("⚠️") and "read_a" in slow
+    assert ok == "b y"
@@ -64,6 +64,9 @@ ORCHESTRATOR_URL = os.getenv("ORCHESTRATOR_SERVICE_URL", "http://orchestrator_se
 # Buffer y respuestas (Redis + ventana de acumulación)
 DEBOUNCE_SECONDS = int(os.getenv("WHATSAPP_DEBOUNCE_SECONDS", "11"))  # Ventana sin mensajes nuevos antes de procesar
 BUBBLE_DELAY_SECONDS = float(os.getenv("WHATSAPP_BUBBLE_DELAY_SECONDS", "4"))  # Delay entre cada burbuja de respuesta
+# Backpressure del orchestrator (429 + retry_after): reintentos y espera máxima por intento
+ORCHESTRATOR_BUSY_MAX_ATTEMPTS = int(os.getenv("ORCHESTRATOR_BUSY_MAX_ATTEMPTS", "6"))
+ORCHESTRATOR_BUSY_MAX_WAIT = float(os.getenv("ORCHESTRATOR_BUSY_MAX_WAIT_SECONDS", "60"))
 
 # Initialize structlog
 structlog.configure(
@@ -109,6 +112,7 @@ app = FastAPI(
 SERVICE_NAME = "whatsapp_service"
 REQUESTS = Counter("http_requests_total", "Total Request Count", ["service", "endpoint", "method", "status"])
 LATENCY = Histogram("http_request_latency_seconds", "Request Latency", ["service", "endpoint"])
+ORCHESTRATOR_BUSY = Counter("orchestrator_busy_total", "Turnos rechazados por backpressure del orchestrator")
 
 # --- Middleware ---
 @app.middleware("http")
@@ -149,11 +153,48 @@ async def verify_signature(request: Request):
     expected = hmac.new(v_secret.encode("utf-8"), signed_payload.encode("utf-8"), hashlib.sha256).hexdigest()
     if not hmac.compare_digest(expected, s): raise HTTPException(status_code=401, detail="Invalid signature")
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10),
-       retry=retry_if_exception_type(httpx.HTTPError))
+class OrchestratorBusy(Exception):
+    """Orchestrator rechazó el turno por falta de cupo (429/503) e indicó cuándo reintentar."""
+    def __init__(self, retry_after: float):
+        super().__init__(f"orchestrator busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+def _parse_retry_after(response: httpx.Response) -> float:
+    try:
+        body = response.json()
+    except Exception:
+        body = {}
+    value = response.headers.get("Retry-After") or (body.get("retry_after") if isinstance(body, dict) else None)
+    try:
+        return min(max(float(value), 1.0), ORCHESTRATOR_BUSY_MAX_WAIT)
+    except (TypeError, ValueError):
+        return 5.0
+
+_backoff = wait_exponential(multiplier=1, min=2, max=10)
+
+def _wait_orchestrator(retry_state):
+    # Si el orchestrator pidió esperar (backpressure), respetamos su retry_after
+    exc = retry_state.outcome.exception()
+    if isinstance(exc, OrchestratorBusy):
+        return exc.retry_after
+    return _backoff(retry_state)
+
+def _stop_orchestrator(retry_state):
+    exc = retry_state.outcome.exception()
+    if isinstance(exc, OrchestratorBusy):
+        return stop_after_attempt(ORCHESTRATOR_BUSY_MAX_ATTEMPTS)(retry_state)
+    return stop_after_attempt(3)(retry_state)
+
+@retry(stop=_stop_orchestrator, wait=_wait_orchestrator,
+       retry=retry_if_exception_type((httpx.HTTPError, OrchestratorBusy)))
 async def forward_to_orchestrator(payload: dict, headers: dict):
     async with httpx.AsyncClient(timeout=httpx.Timeout(120.0, connect=5.0)) as client:
         response = await client.post(f"{ORCHESTRATOR_URL}/chat", json=payload, headers=headers)
+        if response.status_code in (429, 503):
+            retry_after = _parse_retry_after(response)
+            ORCHESTRATOR_BUSY.inc()
+            logger.warning("orchestrator_busy", retry_after=retry_after, status_code=response.status_code)
+            raise OrchestratorBusy(retry_after)
         response.raise_for_status()
         return response.json()
 